@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CafeAnalyticsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cafe_analytics'
+
+    def ready(self):
+        # ロールアップの差分更新用シグナルを登録
+        from . import signals  # noqa: F401
@@ -0,0 +1,50 @@
+from typing import Callable, Optional
+
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from .services import BaseService
+from .services.cache_service import DashboardCache
+from .services.dashboard_service import DashboardService
+from .services.order_service import OrderService
+from .services.rollup_service import RollupService
+
+
+def _etag(request, start_date, end_date) -> str:
+    """URL(クエリ文字列を含む)・レスポンスの形式・期間内のデータバージョンからETagを作る"""
+    endpoint = f"{request.get_full_path()}|{getattr(request, 'accepted_media_type', '')}"
+    return DashboardCache.get_etag(endpoint, start_date, end_date)
+
+
+def dashboard_etag(period: str) -> Callable[..., Optional[str]]:
+    """dateパラメータの対象日を含むダッシュボードの期間のETagを返す関数"""
+    def etag_func(request, *args, **kwargs) -> Optional[str]:
+        target_date = OrderService.get_target_date(request.query_params.get('date'))
+        if not target_date:
+            return None
+        return _etag(request, *DashboardService.get_period_range(period, target_date))
+    return etag_func
+
+
+def analysis_etag(request, *args, **kwargs) -> Optional[str]:
+    """
+    start_date/end_dateの期間のETagを返す
+    指定が無い(または不正な)日付は全期間として扱うため、注文の最初と最後の日付で補う
+    """
+    start_date = BaseService.parse_date_param(request.query_params.get('start_date'))
+    end_date = BaseService.parse_date_param(request.query_params.get('end_date'))
+    if start_date is None or end_date is None:
+        first_date, last_date = RollupService.get_order_date_bounds()
+        start_date = start_date or first_date
+        end_date = end_date or last_date
+        if start_date is None or end_date is None:
+            return None
+    return _etag(request, start_date, end_date)
+
+
+def conditional_get(etag_func: Callable[..., Optional[str]]):
+    """
+    ViewSetのアクションにETagを付け、If-None-Matchが一致すればサービスを呼ばずに304を返すデコレーター
+    ETagは期間内のデータバージョンから作るため、注文が変更されるまで同じ値になる
+    """
+    return method_decorator(condition(etag_func=etag_func))
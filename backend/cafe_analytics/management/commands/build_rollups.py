@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from cafe_analytics.models import DailySalesRollup, DailyMenuItemRollup, RollupDay
+from cafe_analytics.services.rollup_service import RollupService
+
+
+class Command(BaseCommand):
+    help = 'Build or rebuild daily rollup tables from orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', help='開始日 (YYYY-MM-DD)。省略時は最初の注文日')
+        parser.add_argument('--end-date', help='終了日 (YYYY-MM-DD)。省略時は最後の注文日')
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='既存のロールアップを全て削除してから構築する',
+        )
+
+    def handle(self, *args, **options):
+        first_date, last_date = RollupService.get_order_date_bounds()
+
+        start_date = RollupService.parse_date_param(options['start_date']) if options['start_date'] else first_date
+        end_date = RollupService.parse_date_param(options['end_date']) if options['end_date'] else last_date
+
+        if options['start_date'] and not start_date:
+            raise CommandError('Invalid --start-date format')
+        if options['end_date'] and not end_date:
+            raise CommandError('Invalid --end-date format')
+
+        if options['rebuild']:
+            DailySalesRollup.objects.all().delete()
+            DailyMenuItemRollup.objects.all().delete()
+            RollupDay.objects.all().delete()
+            self.stdout.write('Cleared existing rollups')
+
+        if not start_date or not end_date:
+            self.stdout.write(self.style.WARNING('No orders found. Nothing to build.'))
+            return
+
+        if start_date > end_date:
+            raise CommandError('--start-date must be before --end-date')
+
+        self.stdout.write(f"Building rollups from {start_date} to {end_date}")
+        result = RollupService.build(start_date, end_date)
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully built {result['sales_rollups']} sales rollups and "
+            f"{result['menu_item_rollups']} menu item rollups for {result['days']} days"
+        ))
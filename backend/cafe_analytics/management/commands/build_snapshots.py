@@ -0,0 +1,49 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from cafe_analytics.services.snapshot_service import SnapshotService, SNAPSHOT_FORMATS, parse_month
+
+
+class Command(BaseCommand):
+    help = 'Write monthly Parquet / Arrow snapshots of orders for months whose data has changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-month', help='開始月 (YYYY-MM)。省略時は最初の注文の月')
+        parser.add_argument('--end-month', help='終了月 (YYYY-MM)。省略時は最後の注文の月')
+        parser.add_argument(
+            '--format',
+            dest='snapshot_format',
+            choices=SNAPSHOT_FORMATS,
+            help='ファイル形式。省略時はSNAPSHOT_FORMATの設定',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='データが変わっていない月も書き出す',
+        )
+
+    def handle(self, *args, **options):
+        start_month = parse_month(options['start_month']) if options['start_month'] else None
+        end_month = parse_month(options['end_month']) if options['end_month'] else None
+
+        if options['start_month'] and not start_month:
+            raise CommandError('Invalid --start-month format')
+        if options['end_month'] and not end_month:
+            raise CommandError('Invalid --end-month format')
+        if start_month and end_month and start_month > end_month:
+            raise CommandError('--start-month must be before --end-month')
+
+        try:
+            result = SnapshotService.build(start_month, end_month, options['snapshot_format'], options['force'])
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+        if not result['built'] and not result['skipped']:
+            self.stdout.write(self.style.WARNING('No orders found. Nothing to write.'))
+            return
+
+        for month in result['built']:
+            self.stdout.write(f"Wrote snapshot for {month}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully wrote {len(result['built'])} snapshots to {SnapshotService.get_directory()} "
+            f"({len(result['skipped'])} unchanged months skipped)"
+        ))
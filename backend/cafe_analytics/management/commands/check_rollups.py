@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from cafe_analytics.services.rollup_service import RollupService
+
+
+class Command(BaseCommand):
+    help = 'Compare daily rollups with raw orders and optionally repair drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', help='開始日 (YYYY-MM-DD)。省略時は最初の注文日')
+        parser.add_argument('--end-date', help='終了日 (YYYY-MM-DD)。省略時は最後の注文日')
+        parser.add_argument(
+            '--repair',
+            action='store_true',
+            help='差異のある日付を集計し直す',
+        )
+
+    def handle(self, *args, **options):
+        first_date, last_date = RollupService.get_order_date_bounds()
+
+        start_date = RollupService.parse_date_param(options['start_date']) if options['start_date'] else first_date
+        end_date = RollupService.parse_date_param(options['end_date']) if options['end_date'] else last_date
+
+        if options['start_date'] and not start_date:
+            raise CommandError('Invalid --start-date format')
+        if options['end_date'] and not end_date:
+            raise CommandError('Invalid --end-date format')
+
+        if not start_date or not end_date:
+            self.stdout.write(self.style.WARNING('No orders found. Nothing to check.'))
+            return
+
+        drifted_days = 0
+        for day in RollupService.iter_days(start_date, end_date):
+            mismatches = RollupService.check_day(day, repair=options['repair'])
+            if not mismatches:
+                continue
+
+            drifted_days += 1
+            for mismatch in mismatches:
+                self.stdout.write(self.style.WARNING(
+                    f"{day} {mismatch['table']} {mismatch['key']}: "
+                    f"expected={mismatch['expected']} actual={mismatch['actual']}"
+                ))
+
+        if not drifted_days:
+            self.stdout.write(self.style.SUCCESS('All rollups are consistent'))
+        elif options['repair']:
+            self.stdout.write(self.style.SUCCESS(f'Repaired {drifted_days} days'))
+        else:
+            self.stdout.write(self.style.ERROR(f'Found drift in {drifted_days} days (run with --repair to fix)'))
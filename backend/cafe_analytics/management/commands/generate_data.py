@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cafe_analytics.services.import_service import BulkImporter, CONFLICT_CHOICES, CONFLICT_IGNORE
+from cafe_analytics.services.rollup_service import RollupService
+from cafe_analytics.services.snapshot_service import parse_month
+from cafe_analytics.services.synthetic_data import (
+    SampleProfile, SyntheticDataGenerator, next_month_after,
+    DEFAULT_ORDERS_SAMPLE, DEFAULT_ORDER_ITEMS_SAMPLE, DEFAULT_MASTER_DATA,
+)
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic orders that follow the distributions of the sample data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=1, help='生成する月数')
+        parser.add_argument(
+            '--start-month',
+            help='開始月 (YYYY-MM)。省略時は最後の注文の翌月 (注文が無ければサンプルと同じ月)',
+        )
+        parser.add_argument('--scale', type=float, default=1.0, help='サンプルに対する1日の注文数の倍率')
+        parser.add_argument('--seed', type=int, default=0, help='乱数のシード (同じシードなら同じデータを生成する)')
+        parser.add_argument('--id-prefix', default='S', help='生成する注文IDの接頭辞')
+        parser.add_argument('--orders-sample', default=str(DEFAULT_ORDERS_SAMPLE), help='分布の元にする注文データ')
+        parser.add_argument('--order-items-sample', default=str(DEFAULT_ORDER_ITEMS_SAMPLE), help='分布の元にする注文アイテムデータ')
+        parser.add_argument('--master', default=str(DEFAULT_MASTER_DATA), help='マスターデータ (価格の取得と登録に使用)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='1回のbulk_createとコミットで扱う行数')
+        parser.add_argument(
+            '--on-conflict',
+            choices=CONFLICT_CHOICES,
+            default=CONFLICT_IGNORE,
+            help='既存IDとの競合時の動作',
+        )
+
+    def handle(self, *args, **options):
+        if options['months'] < 1:
+            raise CommandError('--months must be 1 or more')
+        if options['scale'] <= 0:
+            raise CommandError('--scale must be greater than 0')
+
+        try:
+            profile = SampleProfile(options['orders_sample'], options['order_items_sample'], options['master'])
+        except FileNotFoundError as e:
+            raise CommandError(f'File not found: {e.filename}')
+
+        if options['start_month']:
+            start_month = parse_month(options['start_month'])
+            if not start_month:
+                raise CommandError('Invalid --start-month format')
+        else:
+            start_month = next_month_after(RollupService.get_order_date_bounds()[1]) or profile.sample_month
+
+        generator = SyntheticDataGenerator(
+            profile, scale=options['scale'], seed=options['seed'], id_prefix=options['id_prefix']
+        )
+        importer = BulkImporter(batch_size=options['batch_size'], on_conflict=options['on_conflict'])
+        summary = generator.import_months(
+            importer, start_month, options['months'],
+            progress=lambda stats: self.stdout.write(f"  {stats.summary()}"),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully generated {summary['orders']} orders and {summary['order_items']} order items "
+            f"for {options['months']} months from {start_month:%Y-%m} (scale {options['scale']:g})"
+        ))
+
@@ -1,126 +1,77 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from django.core.management.base import BaseCommand
-from cafe_analytics.models import Category, Gender, OrderType, WeatherType, TimeSlot, MenuItem, Order, OrderItem
+import django
 import json
 from django.conf import settings
+from django.db import connections
 import os
-from django.utils import timezone
-from datetime import datetime
-from django.db import transaction
 
-class Command(BaseCommand):
-    help = 'Import cafe data from JSON files'
-
-    def handle_master_data(self, master_data):
-        """マスターデータをインポートする"""
-        # 各マスターデータのインポート処理
-        for category in master_data['categories']:
-            Category.objects.get_or_create(
-                id=category['id'],
-                defaults={'name': category['name']}
-            )
-
-        for gender in master_data['genders']:
-            Gender.objects.get_or_create(
-                id=gender['id'],
-                defaults={'name': gender['name']}
-            )
-
-        for order_type in master_data['order_types']:
-            OrderType.objects.get_or_create(
-                id=order_type['id'],
-                defaults={'name': order_type['name']}
-            )
-
-        for weather_type in master_data['weather_types']:
-            WeatherType.objects.get_or_create(
-                id=weather_type['id'],
-                defaults={'name': weather_type['name']}
-            )
-
-        for time_slot in master_data['time_slots']:
-            TimeSlot.objects.get_or_create(
-                id=time_slot['id'],
-                defaults={'name': time_slot['name']}
-            )
-
-        for menu_item in master_data['menu_items']:
-            MenuItem.objects.get_or_create(
-                id=menu_item['id'],
-                defaults={
-                    'name': menu_item['name'],
-                    'price': menu_item['price'],
-                    'category_id': menu_item['category_id']
-                }
-            )
-
-    def handle_orders(self, orders_data):
-        """注文データをインポートする"""
-        created_count = 0
-        for order in orders_data:
-            timestamp = datetime.strptime(order['timestamp'], '%Y-%m-%d %H:%M:%S')
-            order_obj, created = Order.objects.get_or_create(
-                id=order['id'],
-                defaults={
-                    'timestamp': timestamp,
-                    'gender_id': order['gender_id'],
-                    'order_type_id': order['order_type_id'],
-                    'weather_id': order['weather_id'],
-                    'time_slot_id': order['time_slot_id'],
-                    'total_price': order['total_price'],
-                    'discount': order['discount']
-                }
-            )
-            if created:
-                created_count += 1
-        return created_count
-
-    def handle_order_items(self, order_items_data):
-        """注文アイテムデータをインポートする"""
-        created_count = 0
-        for item in order_items_data:
-            order_item, created = OrderItem.objects.get_or_create(
-                id=item['id'],
-                defaults={
-                    'order_id': item['order_id'],
-                    'menu_item_id': item['menu_item_id'],
-                    'price': item['price']
-                }
-            )
-            if created:
-                created_count += 1
-        return created_count
-
-    @transaction.atomic
-    def handle(self, *args, **kwargs):
-        data_dir = os.path.join(settings.BASE_DIR, 'cafe_analytics', 'data')
-
-        try:
-            # マスターデータのインポート
-            master_data_path = os.path.join(data_dir, 'master_data_2024-04.json')
-            self.stdout.write(f"Reading master data from: {master_data_path}")
+from cafe_analytics.services.import_readers import iter_records
+from cafe_analytics.services.import_service import (
+    BulkImporter, CONFLICT_CHOICES, CONFLICT_IGNORE, detect_source_kind, expand_sources, parse_source_file,
+    SOURCE_MASTER, SOURCE_WORKBOOK, SOURCE_ORDERS, SOURCE_ORDER_ITEMS,
+)
 
-            with open(master_data_path, encoding='utf-8') as f:
-                master_data = json.load(f)
-                self.handle_master_data(master_data)
-                self.stdout.write(self.style.SUCCESS('Successfully imported master data'))
-
-            # 注文データのインポート
-            orders_path = os.path.join(data_dir, 'orders_2024-04.json')
-            self.stdout.write(f"Reading orders data from: {orders_path}")
+# 依存関係の順(マスターデータ → 注文 → 注文アイテム)
+SOURCE_ORDER = (SOURCE_MASTER, SOURCE_WORKBOOK, SOURCE_ORDERS, SOURCE_ORDER_ITEMS)
 
-            with open(orders_path, encoding='utf-8') as f:
-                orders_data = json.load(f)
-                orders_created = self.handle_orders(orders_data)
-                self.stdout.write(self.style.SUCCESS(f'Successfully imported {orders_created} orders'))
 
-            # 注文アイテムデータのインポート
-            order_items_path = os.path.join(data_dir, 'order_items_2024-04.json')
-            self.stdout.write(f"Reading order items data from: {order_items_path}")
+class Command(BaseCommand):
+    help = 'Import cafe data from JSON, JSON Lines, CSV or XLSX files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'sources',
+            nargs='*',
+            help='取り込むファイル・ディレクトリ・globパターン (.json/.jsonl/.csv/.xlsx)。省略時は--data-dirのJSONファイルを取り込む',
+        )
+        default_dir = os.path.join(settings.BASE_DIR, 'cafe_analytics', 'data')
+        parser.add_argument('--data-dir', default=default_dir, help='データファイルのディレクトリ')
+        parser.add_argument('--master', default='master_data_2024-04.json', help='マスターデータのファイル名')
+        parser.add_argument('--orders', default='orders_2024-04.json', help='注文データのファイル名 (.json/.jsonl)')
+        parser.add_argument('--order-items', default='order_items_2024-04.json', help='注文アイテムのファイル名 (.json/.jsonl)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='1回のbulk_createとコミットで扱う行数')
+        parser.add_argument(
+            '--on-conflict',
+            choices=CONFLICT_CHOICES,
+            default=CONFLICT_IGNORE,
+            help='既存IDとの競合時の動作 (ignore: スキップ, update: 上書き, error: エラー, upsert: 変更された行だけ更新)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='ファイルを解析するプロセス数。2以上の場合は並列に解析し、書き込みはファイルごとに1トランザクションで行う',
+        )
+
+    def report(self, stats):
+        """バッチごとの進捗を表示"""
+        self.stdout.write(f"  {stats.label}: {stats.read} rows ({stats.rows_per_sec:,.0f} rows/s)")
+
+    def write_stats(self, stats):
+        self.stdout.write(self.style.SUCCESS(f'Successfully imported {stats.summary()}'))
+        for error in stats.errors:
+            self.stdout.write(self.style.WARNING(f'  skipped {error}'))
+        if stats.invalid > len(stats.errors):
+            self.stdout.write(self.style.WARNING(f'  ... and {stats.invalid - len(stats.errors)} more invalid rows'))
+
+    def handle(self, *args, **options):
+        importer = BulkImporter(
+            batch_size=options['batch_size'],
+            on_conflict=options['on_conflict'],
+            progress=self.report if options['verbosity'] > 1 else None,
+        )
 
-            with open(order_items_path, encoding='utf-8') as f:
-                order_items_data = json.load(f)
-                items_created = self.handle_order_items(order_items_data)
-                self.stdout.write(self.style.SUCCESS(f'Successfully imported {items_created} order items'))
+        try:
+            if options['workers'] > 1:
+                paths = expand_sources(options['sources']) if options['sources'] else [
+                    os.path.join(options['data_dir'], options[key]) for key in ('master', 'orders', 'order_items')
+                ]
+                self.import_parallel(importer, paths, options['workers'])
+            elif options['sources']:
+                self.import_sources(importer, expand_sources(options['sources']))
+            else:
+                self.import_default_files(importer, options)
 
         except FileNotFoundError as e:
             self.stdout.write(self.style.ERROR(f'File not found: {e.filename}'))
@@ -128,3 +79,105 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR('Invalid JSON format'))
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'An error occurred: {str(e)}'))
+
+        finally:
+            # 登録された日付のロールアップを更新
+            # 途中で失敗した場合も、コミット済みのバッチの日付は集計し直してデータバージョンを上げる
+            refreshed = importer.finalize()
+            self.stdout.write(self.style.SUCCESS(f'Refreshed rollups for {refreshed} days'))
+
+    def sort_sources(self, paths):
+        """ファイルの種類を判定し、依存関係の順に並べる"""
+        return sorted(
+            ((detect_source_kind(path), path) for path in paths),
+            key=lambda source: SOURCE_ORDER.index(source[0]),
+        )
+
+    def import_sources(self, importer, paths):
+        """指定されたファイルを依存関係の順に取り込む"""
+        for kind, path in self.sort_sources(paths):
+            self.stdout.write(f"Reading {kind} data from: {path}")
+            for stats in importer.import_file(path, kind):
+                self.write_stats(stats)
+            if kind == SOURCE_MASTER:
+                self.stdout.write(self.style.SUCCESS('Successfully imported master data'))
+
+    def import_default_files(self, importer, options):
+        """--data-dir内のマスターデータ・注文・注文アイテムのJSONファイルを取り込む"""
+        data_dir = options['data_dir']
+
+        # マスターデータのインポート
+        master_data_path = os.path.join(data_dir, options['master'])
+        self.stdout.write(f"Reading master data from: {master_data_path}")
+
+        with open(master_data_path, encoding='utf-8') as f:
+            master_data = json.load(f)
+            importer.import_master_data(master_data)
+            self.stdout.write(self.style.SUCCESS('Successfully imported master data'))
+
+        # 注文データのインポート
+        orders_path = os.path.join(data_dir, options['orders'])
+        self.stdout.write(f"Reading orders data from: {orders_path}")
+        self.write_stats(importer.import_orders(iter_records(orders_path)))
+
+        # 注文アイテムデータのインポート
+        order_items_path = os.path.join(data_dir, options['order_items'])
+        self.stdout.write(f"Reading order items data from: {order_items_path}")
+        self.write_stats(importer.import_order_items(iter_records(order_items_path)))
+
+    def import_parallel(self, importer, paths, workers):
+        """
+        ファイルの読み込みと検証をプロセスプールで並列に行い、
+        書き込みはこのプロセスで依存関係の順に1ファイルずつ行う
+        解析中・書き込み待ちのファイルはworkers個までとし、解析結果はバッチごとに読み込んで書き込む
+        """
+        sources = iter(self.sort_sources(paths))
+        self.stdout.write(f"Parsing {len(paths)} files with {workers} workers")
+
+        # ワーカーにDB接続を引き継がないよう、プロセスの生成前に接続を閉じる
+        connections.close_all()
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=django.setup)
+        in_flight = {}
+
+        def submit_next():
+            source = next(sources, None)
+            if source is not None:
+                kind, path = source
+                in_flight[executor.submit(parse_source_file, path, kind, importer.batch_size)] = kind
+
+        try:
+            for _ in range(workers):
+                submit_next()
+
+            while in_flight:
+                # ファイルは依存関係の順に投入するため、解析中の最も前の種類より前の種類はすべて書き込み済み
+                # 同じ種類のファイルは解析が終わった順に書き込む
+                kind = min(in_flight.values(), key=SOURCE_ORDER.index)
+                pending = [future for future, value in in_flight.items() if value == kind]
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del in_flight[future]
+                    parsed = future.result()
+                    try:
+                        self.write_parsed(importer, parsed)
+                    finally:
+                        parsed.close()
+                    submit_next()
+        finally:
+            executor.shutdown(cancel_futures=True)
+            # 書き込まずに終わったファイルの一時ファイルを削除する
+            for future in in_flight:
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    future.result().close()
+
+    def write_parsed(self, importer, parsed):
+        """ワーカーで解析したファイルを書き込む"""
+        self.stdout.write(
+            f"Writing {parsed.kind} data from: {parsed.path} "
+            f"(parsed {parsed.rows} rows in {parsed.parse_elapsed:.2f}s)"
+        )
+        results = importer.import_parsed(parsed)
+        if parsed.master_data:
+            self.stdout.write(self.style.SUCCESS('Successfully imported master data'))
+        for stats in results:
+            self.write_stats(stats)
@@ -0,0 +1,243 @@
+import json
+import statistics
+import subprocess
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from cafe_analytics.models import (
+    Order, OrderItem, DailySalesRollup, DailyMenuItemRollup, RollupDay, DataVersion,
+)
+from cafe_analytics.services.columnar_store import ColumnarStore
+from cafe_analytics.services.dashboard_service import DashboardService
+from cafe_analytics.services.import_service import BulkImporter
+from cafe_analytics.services.order_service import OrderService
+from cafe_analytics.services.product_service import ProductService
+from cafe_analytics.services.sales_service import SalesService
+from cafe_analytics.services.snapshot_service import month_range, parse_month
+from cafe_analytics.services.synthetic_data import SampleProfile, SyntheticDataGenerator
+
+
+def service_cases(start, end, target_date):
+    """DashboardService / SalesService / ProductServiceの各メソッドの計測対象"""
+    orders = lambda: OrderService.get_orders_in_period(start, end)  # noqa: E731
+    return {
+        'DashboardService.get_daily_dashboard': lambda: DashboardService.get_daily_dashboard(target_date),
+        'DashboardService.get_weekly_dashboard': lambda: DashboardService.get_weekly_dashboard(target_date),
+        'DashboardService.get_monthly_dashboard': lambda: DashboardService.get_monthly_dashboard(target_date),
+        'SalesService.get_sales_summary': lambda: SalesService.get_sales_summary(start, end),
+        'SalesService.get_period_sales:daily': lambda: SalesService.get_period_sales('daily', start, end),
+        'SalesService.get_period_sales:weekly': lambda: SalesService.get_period_sales('weekly', start, end),
+        'SalesService.get_period_sales:monthly': lambda: SalesService.get_period_sales('monthly', start, end),
+        'SalesService.get_sales_by_factor:weather': lambda: SalesService.get_sales_by_factor('weather', 'weather__name', start, end),
+        'SalesService.get_sales_by_factor:gender': lambda: SalesService.get_sales_by_factor('gender', 'gender__name', start, end),
+        'SalesService.get_top_categories': lambda: SalesService.get_top_categories(None, start, end),
+        'SalesService.calculate_takeout_rate': lambda: SalesService.calculate_takeout_rate(orders()),
+        'SalesService.get_hourly_sales': lambda: SalesService.get_hourly_sales(orders()),
+        'SalesService.get_weather_timeslot_analysis': lambda: SalesService.get_weather_timeslot_analysis(start, end),
+        'ProductService.get_bestsellers': lambda: ProductService.get_bestsellers(10, start, end),
+        'ProductService.get_popular_items_by_type:dine_in': lambda: ProductService.get_popular_items_by_type(1, 10, start, end),
+        'ProductService.get_popular_items_by_type:takeout': lambda: ProductService.get_popular_items_by_type(2, 10, start, end),
+        'ProductService.get_dine_in_popular_by_timeslot': lambda: ProductService.get_dine_in_popular_by_timeslot(start, end),
+        'ProductService.get_discount_analysis': lambda: ProductService.get_discount_analysis(start, end),
+        'ProductService.get_combo_analysis': lambda: ProductService.get_combo_analysis(2, 10, start, end),
+    }
+
+
+def view_cases(start, end, target_date):
+    """各ViewSetのアクションの計測対象 (名前: URL)"""
+    period = f"start_date={start}&end_date={end}"
+    return {
+        'dashboard.daily_dashboard': f"/api/dashboard/daily_dashboard/?date={target_date}",
+        'dashboard.weekly_dashboard': f"/api/dashboard/weekly_dashboard/?date={target_date}",
+        'dashboard.monthly_dashboard': f"/api/dashboard/monthly_dashboard/?date={target_date}",
+        'dashboard.daily_sales': f"/api/dashboard/daily_sales/?{period}",
+        'dashboard.weekly_sales': f"/api/dashboard/weekly_sales/?{period}",
+        'dashboard.monthly_sales': f"/api/dashboard/monthly_sales/?{period}",
+        'sales.sales_summary': f"/api/sales/sales_summary/?{period}",
+        'sales.category_sales': f"/api/sales/category_sales/?{period}",
+        'sales.sales_by_weather': f"/api/sales/sales_by_weather/?{period}",
+        'sales.sales_by_gender': f"/api/sales/sales_by_gender/?{period}",
+        'sales.weather_timeslot_analysis': f"/api/sales/weather_timeslot_analysis/?{period}",
+        'products.bestsellers': f"/api/products/bestsellers/?{period}",
+        'products.discount_analysis': f"/api/products/discount_analysis/?{period}",
+        'products.dine_in_popular_items': f"/api/products/dine_in_popular_items/?{period}",
+        'products.dine_in_popular': f"/api/products/dine_in_popular/?{period}",
+        'products.takeout_popular': f"/api/products/takeout_popular/?{period}",
+        'products.combo_analysis': f"/api/products/combo_analysis/?{period}",
+        'orders.list': f"/api/orders/?{period}",
+        'orders.stream': f"/api/orders/stream/?{period}",
+        'exports.orders': f"/api/exports/orders/?{period}",
+        'exports.order_items': f"/api/exports/order_items/?{period}",
+        'menu_items.list': "/api/menu-items/",
+    }
+
+
+def measure(func, repeat: int):
+    """1回実行して結果を捨てた後、repeat回の処理時間(ミリ秒)とクエリ数を計測する"""
+    func()
+    durations = []
+    with CaptureQueriesContext(connection) as queries:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            durations.append((time.perf_counter() - started) * 1000)
+    return {
+        'median_ms': round(statistics.median(durations), 3),
+        'mean_ms': round(statistics.mean(durations), 3),
+        'min_ms': round(min(durations), 3),
+        'max_ms': round(max(durations), 3),
+        'queries': len(queries) // repeat,
+    }
+
+
+def fetch(client, url):
+    """URLを取得し、ストリーミングの場合は最後まで読み込む"""
+    def run():
+        response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f"{url} returned {response.status_code}")
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+    return run
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every service method and API action against synthetic data at several volumes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1,10,100', help='サンプルに対するデータ量の倍率 (カンマ区切り)')
+        parser.add_argument('--months', type=int, default=1, help='生成する月数')
+        parser.add_argument('--start-month', default='2024-04', help='生成を開始する月 (YYYY-MM)')
+        parser.add_argument('--repeat', type=int, default=5, help='1つの計測対象を実行する回数')
+        parser.add_argument('--seed', type=int, default=0, help='合成データの乱数のシード')
+        parser.add_argument('--output', default='benchmark_results.json', help='結果を書き出すJSONファイル')
+        parser.add_argument('--compare', help='比較する以前の結果のJSONファイル (中央値の変化を表示する)')
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='ベンチマーク用データベースを削除せずに残す',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            scales = [float(scale) for scale in options['scales'].split(',')]
+        except ValueError:
+            raise CommandError('Invalid --scales format')
+        start_month = parse_month(options['start_month'])
+        if not start_month:
+            raise CommandError('Invalid --start-month format')
+        if options['repeat'] < 1 or options['months'] < 1:
+            raise CommandError('--repeat and --months must be 1 or more')
+
+        profile = SampleProfile()
+
+        # テストと同じく専用のデータベースを作成し、既存のデータには触れない
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            with override_settings(DASHBOARD_CACHE_ENABLED=False, SLOW_QUERY_THRESHOLD_MS=0):
+                results = [self.run_scale(profile, scale, start_month, options) for scale in scales]
+        finally:
+            if not options['keepdb']:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'commit': get_commit(),
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'settings': {
+                key: getattr(settings, key, None)
+                for key in ('ANALYTICS_BACKEND', 'DASHBOARD_EXECUTION_MODE', 'DASHBOARD_ORDERS_PAGE_SIZE')
+            },
+            'months': options['months'],
+            'repeat': options['repeat'],
+            'seed': options['seed'],
+            'scales': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Successfully wrote benchmark results to {options['output']}"))
+
+        if options['compare']:
+            self.compare(options['compare'], report)
+
+    def run_scale(self, profile, scale, start_month, options):
+        """指定した倍率のデータを作り直し、全ての計測対象を計測する"""
+        OrderItem.objects.all().delete()
+        Order.objects.all().delete()
+        for model in (DailySalesRollup, DailyMenuItemRollup, RollupDay, DataVersion):
+            model.objects.all().delete()
+
+        started = time.perf_counter()
+        generator = SyntheticDataGenerator(profile, scale=scale, seed=options['seed'])
+        summary = generator.import_months(BulkImporter(batch_size=5000), start_month, options['months'])
+        generate_seconds = time.perf_counter() - started
+        ColumnarStore.invalidate()
+        self.stdout.write(
+            f"Scale {scale:g}x: generated {summary['orders']} orders and {summary['order_items']} items "
+            f"in {generate_seconds:.1f}s"
+        )
+
+        start = start_month
+        end = month_range(start_month)[1]
+        for _ in range(options['months'] - 1):
+            end = month_range(end + timedelta(days=1))[1]
+        target_date = start + timedelta(days=14)
+
+        client = Client()
+        cases = {
+            **{f"service:{name}": func for name, func in service_cases(start, end, target_date).items()},
+            **{f"view:{name}": fetch(client, url) for name, url in view_cases(start, end, target_date).items()},
+        }
+
+        results = {}
+        for name, func in cases.items():
+            results[name] = measure(func, options['repeat'])
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {name}: {results[name]['median_ms']:.1f}ms ({results[name]['queries']} queries)")
+
+        return {
+            'scale': scale,
+            'orders': summary['orders'],
+            'order_items': summary['order_items'],
+            'generate_seconds': round(generate_seconds, 3),
+            'results': results,
+        }
+
+    def compare(self, path, report):
+        """以前の結果と同じ倍率・計測対象の中央値を比較して表示する"""
+        with open(path, encoding='utf-8') as f:
+            previous = {entry['scale']: entry['results'] for entry in json.load(f)['scales']}
+
+        for entry in report['scales']:
+            baseline = previous.get(entry['scale'])
+            if baseline is None:
+                continue
+            self.stdout.write(f"Scale {entry['scale']:g}x (median, vs {path}):")
+            for name, result in entry['results'].items():
+                if name not in baseline:
+                    continue
+                before = baseline[name]['median_ms']
+                change = (result['median_ms'] - before) / before * 100 if before else 0.0
+                line = f"  {name}: {before:.1f}ms -> {result['median_ms']:.1f}ms ({change:+.0f}%)"
+                if change >= 10:
+                    line = self.style.WARNING(line)
+                self.stdout.write(line)
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cafe_analytics.services.analysis_service import ANALYSES
+from cafe_analytics.services.cache_service import DashboardCache
+from cafe_analytics.services.cache_warmer import CacheWarmer
+
+
+class Command(BaseCommand):
+    help = 'Pre-compute and cache dashboards and analyses for the latest periods'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--periods', type=int, help='基準日から遡ってキャッシュする日・週・月の数 (既定はCACHE_WARM_PERIODS)')
+        parser.add_argument('--concurrency', type=int, help='同時に実行する計算の数 (既定はCACHE_WARM_CONCURRENCY)')
+        parser.add_argument('--date', help='基準日 (YYYY-MM-DD)。省略時は最新の注文日')
+        parser.add_argument(
+            '--analyses',
+            help=f"キャッシュする分析 (カンマ区切り)。省略時は全て: {', '.join(ANALYSES)}",
+        )
+
+    def handle(self, *args, **options):
+        if not DashboardCache.is_enabled():
+            raise CommandError('DASHBOARD_CACHE_ENABLED is False. Nothing would be cached.')
+        for option in ('periods', 'concurrency'):
+            if options[option] is not None and options[option] < 1:
+                raise CommandError(f'--{option} must be 1 or more')
+
+        anchor = None
+        if options['date']:
+            anchor = CacheWarmer.parse_date_param(options['date'])
+            if not anchor:
+                raise CommandError('Invalid --date format')
+
+        analyses = None
+        if options['analyses']:
+            analyses = [name.strip() for name in options['analyses'].split(',') if name.strip()]
+            unknown = [name for name in analyses if name not in ANALYSES]
+            if unknown:
+                raise CommandError(f"Unknown analyses: {', '.join(unknown)}")
+
+        if 'LocMemCache' in DashboardCache.get_cache().__class__.__name__:
+            self.stdout.write(self.style.WARNING(
+                'The dashboard cache is process-local (LocMemCache). Results cached here are not shared with '
+                'the web processes; use a shared backend or CACHE_WARM_ON_STARTUP instead.'
+            ))
+
+        warmer = CacheWarmer(options['periods'], options['concurrency'], anchor, analyses)
+        if warmer.anchor is None:
+            self.stdout.write(self.style.WARNING('No orders found. Nothing to warm.'))
+            return
+
+        def progress(result):
+            if result['error']:
+                self.stdout.write(self.style.ERROR(f"  {result['name']}: {result['error']}"))
+            elif options['verbosity'] > 1:
+                self.stdout.write(f"  {result['name']}: {result['seconds'] * 1000:.0f}ms")
+
+        self.stdout.write(
+            f"Warming cache for {warmer.periods} periods up to {warmer.anchor} "
+            f"(concurrency {warmer.concurrency})"
+        )
+        results = warmer.run(progress)
+        failed = sum(1 for result in results if result['error'])
+        total_seconds = sum(result['seconds'] for result in results)
+        message = f"Successfully cached {len(results) - failed} of {len(results)} results ({total_seconds:.1f}s of computation)"
+        self.stdout.write(self.style.WARNING(message) if failed else self.style.SUCCESS(message))
@@ -0,0 +1,134 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Optional, Sequence, Tuple
+
+from django.db import connection
+
+_state = threading.local()
+
+# 処理時間(秒)のヒストグラムの区切り
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# クエリ数のヒストグラムの区切り
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+# レスポンスサイズ(バイト)のヒストグラムの区切り
+SIZE_BUCKETS = (1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000, 10_000_000)
+
+
+class Histogram:
+    """ラベルごとに観測値の分布(累積バケット・合計・件数)を保持するヒストグラム"""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._values: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label: str, value: float) -> None:
+        with self._lock:
+            counts = self._values.get(label)
+            if counts is None:
+                # バケットごとの件数 + 上限超えの件数 + 合計
+                counts = self._values[label] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> str:
+        """Prometheusのテキスト形式に変換する"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = {label: list(counts) for label, counts in self._values.items()}
+
+        for label, counts in sorted(values.items()):
+            view = label.replace('\\', '\\\\').replace('"', '\\"')
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+            cumulative += counts[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{view="{view}",le="+Inf"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{view="{view}"}} {counts[-1]}')
+            lines.append(f'{self.name}_count{{view="{view}"}} {cumulative}')
+        return '\n'.join(lines)
+
+
+REQUEST_DURATION = Histogram(
+    'cafe_request_duration_seconds', 'Wall time of each view action.', DURATION_BUCKETS
+)
+SQL_QUERIES = Histogram(
+    'cafe_request_sql_queries', 'SQL queries executed per request.', QUERY_COUNT_BUCKETS
+)
+SQL_DURATION = Histogram(
+    'cafe_request_sql_duration_seconds', 'Total SQL execution time per request.', DURATION_BUCKETS
+)
+SERIALIZATION_DURATION = Histogram(
+    'cafe_request_serialization_duration_seconds', 'Time spent rendering the response body.', DURATION_BUCKETS
+)
+RESPONSE_SIZE = Histogram(
+    'cafe_response_size_bytes', 'Response body size in bytes.', SIZE_BUCKETS
+)
+HISTOGRAMS = (REQUEST_DURATION, SQL_QUERIES, SQL_DURATION, SERIALIZATION_DURATION, RESPONSE_SIZE)
+
+
+def render_metrics() -> str:
+    """全てのヒストグラムをPrometheusのテキスト形式で返す"""
+    return '\n'.join(histogram.render() for histogram in HISTOGRAMS) + '\n'
+
+
+class QueryCollector:
+    """リクエスト中に実行したSQLの件数と合計時間を集める(ワーカースレッドからも記録される)"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.count += 1
+                self.duration += elapsed
+
+
+def current_collector() -> Optional[QueryCollector]:
+    """現在のスレッドで記録中のQueryCollectorを返す"""
+    return getattr(_state, 'collector', None)
+
+
+@contextmanager
+def collect_queries(collector: Optional[QueryCollector]):
+    """ブロック内で現在のスレッドのDB接続が実行したSQLをcollectorに記録する"""
+    if collector is None:
+        yield None
+        return
+
+    previous = current_collector()
+    _state.collector = collector
+    try:
+        with connection.execute_wrapper(collector):
+            yield collector
+    finally:
+        _state.collector = previous
+
+
+def format_debug_header(values: Dict[str, float]) -> str:
+    """計測結果をデバッグ用ヘッダーの値に変換する"""
+    parts: Tuple[str, ...] = (
+        f"queries={values['queries']}",
+        f"sql={values['sql'] * 1000:.1f}ms",
+        f"serialize={values['serialize'] * 1000:.1f}ms",
+        f"total={values['total'] * 1000:.1f}ms",
+    )
+    if values.get('size') is not None:
+        parts += (f"size={values['size']}",)
+    return '; '.join(parts)
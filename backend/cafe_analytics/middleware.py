@@ -0,0 +1,105 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.middleware.gzip import GZipMiddleware
+
+from .metrics import (
+    QueryCollector, collect_queries, format_debug_header,
+    REQUEST_DURATION, SQL_QUERIES, SQL_DURATION, SERIALIZATION_DURATION, RESPONSE_SIZE,
+)
+
+DEBUG_HEADER = 'X-Request-Metrics'
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    RESPONSE_COMPRESSION_MIN_BYTES以上のレスポンスのみgzipで圧縮する
+    小さいレスポンスは圧縮しても数バイトしか減らず、CPU時間だけがかかるため
+    """
+
+    def process_response(self, request, response):
+        min_bytes = getattr(settings, 'RESPONSE_COMPRESSION_MIN_BYTES', 1024)
+        if min_bytes <= 0 or (not response.streaming and len(response.content) < min_bytes):
+            return response
+        return super().process_response(request, response)
+
+
+class RequestMetricsMiddleware:
+    """
+    cafe_analyticsのビューごとに、SQLの件数と合計時間・シリアライズ時間・レスポンスサイズ・処理時間を計測し、
+    /api/metrics/ のヒストグラムに記録する
+    REQUEST_METRICS_DEBUG_HEADERが有効な場合は、計測結果をレスポンスヘッダーでも返す
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        collector = QueryCollector()
+        request.metrics_view = None
+        request.metrics_serialize = 0.0
+
+        with collect_queries(collector):
+            response = self.get_response(request)
+
+        view = request.metrics_view
+        if view is None:
+            return response
+
+        if response.streaming:
+            # ストリーミングは本文を送り終えた時点で記録する(送信中のクエリも数える)
+            response.streaming_content = self._observe_stream(
+                response.streaming_content, view, collector, started, request
+            )
+        else:
+            self._observe(view, collector, started, request, len(response.content))
+
+        if getattr(settings, 'REQUEST_METRICS_DEBUG_HEADER', False):
+            response[DEBUG_HEADER] = format_debug_header({
+                'queries': collector.count,
+                'sql': collector.duration,
+                'serialize': request.metrics_serialize,
+                'total': time.perf_counter() - started,
+                'size': None if response.streaming else len(response.content),
+            })
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """cafe_analyticsのビューのみを、URL名(例: dashboard-daily-dashboard)ごとに記録する"""
+        if getattr(view_func, '__module__', '').startswith('cafe_analytics'):
+            match = request.resolver_match
+            request.metrics_view = (match.url_name if match else None) or view_func.__name__
+        return None
+
+    def process_template_response(self, request, response):
+        """DRFのResponseのレンダリング(JSONへの変換)の時間を計測する"""
+        if request.metrics_view is not None:
+            render_started = time.perf_counter()
+
+            def record_render(rendered):
+                request.metrics_serialize += time.perf_counter() - render_started
+
+            response.add_post_render_callback(record_render)
+        return response
+
+    @staticmethod
+    def _observe(view, collector, started, request, size):
+        REQUEST_DURATION.observe(view, time.perf_counter() - started)
+        SQL_QUERIES.observe(view, collector.count)
+        SQL_DURATION.observe(view, collector.duration)
+        SERIALIZATION_DURATION.observe(view, request.metrics_serialize)
+        RESPONSE_SIZE.observe(view, size)
+
+    def _observe_stream(self, content, view, collector, started, request):
+        size = 0
+        try:
+            with collect_queries(collector):
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self._observe(view, collector, started, request, size)
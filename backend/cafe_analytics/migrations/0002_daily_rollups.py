@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cafe_analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='日付')),
+                ('built_at', models.DateTimeField(auto_now=True, verbose_name='集計日時')),
+            ],
+            options={
+                'verbose_name': 'ロールアップ集計日',
+                'verbose_name_plural': 'ロールアップ集計日',
+                'db_table': 'rollup_days',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyMenuItemRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日付')),
+                ('items_sold', models.IntegerField(default=0, verbose_name='販売数')),
+                ('total_sales', models.BigIntegerField(default=0, verbose_name='売上合計')),
+                ('menu_item', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='cafe_analytics.menuitem', verbose_name='メニューアイテム')),
+            ],
+            options={
+                'verbose_name': '日次商品ロールアップ',
+                'verbose_name_plural': '日次商品ロールアップ',
+                'db_table': 'daily_menu_item_rollups',
+                'constraints': [models.UniqueConstraint(fields=('date', 'menu_item'), name='uniq_daily_menu_item_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日付')),
+                ('order_count', models.IntegerField(default=0, verbose_name='注文数')),
+                ('total_sales', models.BigIntegerField(default=0, verbose_name='売上合計')),
+                ('total_discount', models.BigIntegerField(default=0, verbose_name='割引合計')),
+                ('gender', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='cafe_analytics.gender', verbose_name='性別')),
+                ('order_type', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='cafe_analytics.ordertype', verbose_name='注文タイプ')),
+                ('time_slot', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='cafe_analytics.timeslot', verbose_name='時間帯')),
+                ('weather', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='cafe_analytics.weathertype', verbose_name='天気')),
+            ],
+            options={
+                'verbose_name': '日次売上ロールアップ',
+                'verbose_name_plural': '日次売上ロールアップ',
+                'db_table': 'daily_sales_rollups',
+                'constraints': [models.UniqueConstraint(fields=('date', 'time_slot', 'order_type', 'weather', 'gender'), name='uniq_daily_sales_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cafe_analytics', '0004_order_timestamp_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='row_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40, verbose_name='取込データのハッシュ'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='row_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40, verbose_name='取込データのハッシュ'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:23
+
+from django.db import migrations, models
+
+
+def clear_rollups(apps, schema_editor):
+    """既存のロールアップには時刻が無いため削除する(build_rollupsで作り直すまでは生データから集計する)"""
+    for model_name in ('DailySalesRollup', 'DailyMenuItemRollup', 'RollupDay'):
+        apps.get_model('cafe_analytics', model_name).objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cafe_analytics', '0005_import_row_hashes'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_rollups, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='dailysalesrollup',
+            name='uniq_daily_sales_rollup',
+        ),
+        migrations.AddField(
+            model_name='dailysalesrollup',
+            name='hour',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='時'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailysalesrollup',
+            constraint=models.UniqueConstraint(fields=('date', 'hour', 'time_slot', 'order_type', 'weather', 'gender'), name='uniq_daily_sales_rollup'),
+        ),
+    ]
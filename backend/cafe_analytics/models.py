@@ -123,12 +123,18 @@ class Order(models.Model):
         _('割引額'),
         validators=[MinValueValidator(0)]
     )
+    row_hash = models.CharField(_('取込データのハッシュ'), max_length=40, blank=True, default='', editable=False)
 
     class Meta:
         db_table = 'orders'
         verbose_name = _('注文')
         verbose_name_plural = _('注文')
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['timestamp'], name='orders_ts_idx'),
+            models.Index(fields=['timestamp', 'order_type'], name='orders_ts_order_type_idx'),
+            models.Index(fields=['timestamp', 'time_slot'], name='orders_ts_time_slot_idx'),
+        ]
 
     def __str__(self):
         return f"Order {self.id} - {self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
@@ -157,11 +163,118 @@ class OrderItem(models.Model):
         _('価格'),
         validators=[MinValueValidator(0)]
     )
+    row_hash = models.CharField(_('取込データのハッシュ'), max_length=40, blank=True, default='', editable=False)
 
     class Meta:
         db_table = 'order_items'
         verbose_name = _('注文項目')
         verbose_name_plural = _('注文項目')
+        indexes = [
+            models.Index(fields=['order', 'menu_item'], name='order_items_order_menu_idx'),
+        ]
 
     def __str__(self):
         return f"{self.menu_item.name} - Order {self.order.id}"
+
+
+class DailySalesRollup(models.Model):
+    """日次売上ロールアップモデル(日付×時刻×時間帯×注文タイプ×天気×性別)"""
+    date = models.DateField(_('日付'))
+    hour = models.PositiveSmallIntegerField(_('時'), default=0)
+    time_slot = models.ForeignKey(
+        TimeSlot,
+        verbose_name=_('時間帯'),
+        on_delete=models.PROTECT,
+        related_name='+',
+    )
+    order_type = models.ForeignKey(
+        OrderType,
+        verbose_name=_('注文タイプ'),
+        on_delete=models.PROTECT,
+        related_name='+',
+    )
+    weather = models.ForeignKey(
+        WeatherType,
+        verbose_name=_('天気'),
+        on_delete=models.PROTECT,
+        related_name='+',
+    )
+    gender = models.ForeignKey(
+        Gender,
+        verbose_name=_('性別'),
+        on_delete=models.PROTECT,
+        related_name='+',
+    )
+    order_count = models.IntegerField(_('注文数'), default=0)
+    total_sales = models.BigIntegerField(_('売上合計'), default=0)
+    total_discount = models.BigIntegerField(_('割引合計'), default=0)
+
+    class Meta:
+        db_table = 'daily_sales_rollups'
+        verbose_name = _('日次売上ロールアップ')
+        verbose_name_plural = _('日次売上ロールアップ')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'hour', 'time_slot', 'order_type', 'weather', 'gender'],
+                name='uniq_daily_sales_rollup',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.order_count} orders"
+
+
+class DailyMenuItemRollup(models.Model):
+    """日次商品ロールアップモデル(日付×メニューアイテム)"""
+    date = models.DateField(_('日付'))
+    menu_item = models.ForeignKey(
+        MenuItem,
+        verbose_name=_('メニューアイテム'),
+        on_delete=models.PROTECT,
+        related_name='+',
+    )
+    items_sold = models.IntegerField(_('販売数'), default=0)
+    total_sales = models.BigIntegerField(_('売上合計'), default=0)
+
+    class Meta:
+        db_table = 'daily_menu_item_rollups'
+        verbose_name = _('日次商品ロールアップ')
+        verbose_name_plural = _('日次商品ロールアップ')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'menu_item'],
+                name='uniq_daily_menu_item_rollup',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.menu_item_id}: {self.items_sold}"
+
+
+class RollupDay(models.Model):
+    """ロールアップ集計済みの日付を管理するモデル"""
+    date = models.DateField(_('日付'), unique=True)
+    built_at = models.DateTimeField(_('集計日時'), auto_now=True)
+
+    class Meta:
+        db_table = 'rollup_days'
+        verbose_name = _('ロールアップ集計日')
+        verbose_name_plural = _('ロールアップ集計日')
+
+    def __str__(self):
+        return f"{self.date}"
+
+
+class DataVersion(models.Model):
+    """日付ごとのデータバージョンを管理するモデル(注文の変更時に更新)"""
+    date = models.DateField(_('日付'), unique=True)
+    version = models.PositiveIntegerField(_('バージョン'), default=0)
+    updated_at = models.DateTimeField(_('更新日時'), auto_now=True)
+
+    class Meta:
+        db_table = 'data_versions'
+        verbose_name = _('データバージョン')
+        verbose_name_plural = _('データバージョン')
+
+    def __str__(self):
+        return f"{self.date} v{self.version}"
@@ -0,0 +1,111 @@
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def _value(row, field):
+    return row[field] if isinstance(row, dict) else getattr(row, field)
+
+
+def encode_cursor(row) -> str:
+    """行の (timestamp, id) をカーソル文字列に変換する"""
+    position = f"{_value(row, 'timestamp').isoformat()}|{_value(row, 'id')}"
+    return b64encode(position.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(encoded: str):
+    """カーソル文字列を (timestamp, id) に戻す。不正な場合はValueError"""
+    try:
+        timestamp, order_id = b64decode(encoded.encode('ascii')).decode('utf-8').split('|', 1)
+        return datetime.fromisoformat(timestamp), order_id
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {encoded}") from e
+
+
+def keyset_page(queryset, position=None, page_size: int = 100):
+    """
+    (timestamp, id) の順でpositionより後ろの行を1ページ分取得する
+
+    Args:
+        queryset: timestampとidを含む注文のクエリセット(values()でも可)
+        position (tuple, optional): decode_cursorで得た位置. Defaults to None (先頭から).
+        page_size (int, optional): 1ページの件数. Defaults to 100.
+
+    Returns:
+        tuple: (ページ内の行, 次のページがあるか)
+    """
+    queryset = queryset.order_by('timestamp', 'id')
+    if position is not None:
+        timestamp, order_id = position
+        queryset = queryset.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=order_id))
+
+    # 次のページの有無を判定するために1件多く取得する
+    rows = list(queryset[:page_size + 1])
+    return rows[:page_size], len(rows) > page_size
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    (timestamp, id) のキーセットによるカーソルページネーション
+    OFFSETを使わず、前のページの最後の行より後ろをインデックスで直接読み始めるため、
+    テーブルが大きくなってもページの取得時間とメモリ使用量は一定
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 100
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        """リクエストのカーソルを (timestamp, id) に戻す。指定が無ければNone"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            return decode_cursor(encoded)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """リクエストのカーソルの位置から1ページ分の行を取得する"""
+        self.request = request
+        self.page, self.has_next = keyset_page(
+            queryset, self.decode_cursor(request), self.get_page_size(request)
+        )
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,75 @@
+from typing import Any
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpackは任意の依存関係
+    msgpack = None
+
+
+def to_columnar(data: Any) -> Any:
+    """
+    同じキーを持つ辞書のリストを {"columns": [キー], "rows": [[値, ...], ...]} に変換する(入れ子も変換する)
+    集計結果の各行で繰り返される長いキー(menu_item__category__name等)を1回だけにする
+    """
+    if isinstance(data, dict):
+        return {key: to_columnar(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        if data and all(isinstance(row, dict) for row in data):
+            columns = list(data[0])
+            if all(len(row) == len(columns) and all(column in row for column in columns) for row in data):
+                return {
+                    'columns': columns,
+                    'rows': [[to_columnar(row[column]) for column in columns] for row in data],
+                }
+        return [to_columnar(item) for item in data]
+    return data
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """
+    行のリストを列名と値の配列で返すJSON
+    Acceptヘッダー (application/vnd.cafe-analytics.columnar+json) または ?format=columnar で指定する
+    """
+
+    media_type = 'application/vnd.cafe-analytics.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(to_columnar(data), accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    JSONと同じ構造をMessagePackで返す ※msgpackが必要
+    Acceptヘッダー (application/msgpack) または ?format=msgpack で指定する
+    """
+
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    @staticmethod
+    def is_available() -> bool:
+        return msgpack is not None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if msgpack is None:
+            raise ImproperlyConfigured('MessagePack responses require msgpack (pip install msgpack)')
+        if data is None:
+            return b''
+        # Decimal・日付等はJSONと同じ値に変換する
+        return msgpack.packb(data, default=JSONEncoder().default, use_bin_type=True)
+
+
+class ContentNegotiation(DefaultContentNegotiation):
+    """依存関係が無く使えないレンダラー(is_available()がFalse)を選択肢から除く(指定された場合は406/404になる)"""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        renderers = [renderer for renderer in renderers if getattr(renderer, 'is_available', lambda: True)()]
+        return super().select_renderer(request, renderers, format_suffix)
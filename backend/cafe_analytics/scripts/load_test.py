@@ -0,0 +1,229 @@
+"""
+REST APIの負荷試験
+ダッシュボードを中心とした実際の利用に近い比率でリクエストを送り、同時接続数を段階的に増やしながら
+エンドポイントごとのレイテンシ(p50/p95/p99)・スループット・エラー率を計測する
+
+標準ライブラリのみで動作する。起動済みのサーバーに対して実行する
+    python manage.py runserver --noreload  (または gunicorn dashboard.wsgi)
+    python cafe_analytics/scripts/load_test.py --base-url http://127.0.0.1:8000/api --stages 1,5,10,20
+"""
+import argparse
+import http.client
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+
+# (名前, 重み, パス) パスの {date} / {start} / {end} はリクエストごとに置き換える
+DEFAULT_MIX = (
+    ('dashboard.daily_dashboard', 40, '/dashboard/daily_dashboard/?date={date}'),
+    ('dashboard.weekly_dashboard', 25, '/dashboard/weekly_dashboard/?date={date}'),
+    ('dashboard.monthly_dashboard', 5, '/dashboard/monthly_dashboard/?date={date}'),
+    ('sales.sales_summary', 5, '/sales/sales_summary/?start_date={start}&end_date={end}'),
+    ('sales.category_sales', 3, '/sales/category_sales/?start_date={start}&end_date={end}'),
+    ('products.bestsellers', 7, '/products/bestsellers/?start_date={start}&end_date={end}'),
+    ('products.dine_in_popular_items', 5, '/products/dine_in_popular_items/?start_date={start}&end_date={end}'),
+    ('products.combo_analysis', 5, '/products/combo_analysis/?start_date={start}&end_date={end}'),
+    ('products.discount_analysis', 5, '/products/discount_analysis/?start_date={start}&end_date={end}'),
+)
+
+
+def percentile(values, ratio):
+    """昇順に並べた値のパーセンタイル(nearest-rank法)"""
+    if not values:
+        return None
+    return values[max(math.ceil(ratio * len(values)) - 1, 0)]
+
+
+class Recorder:
+    """エンドポイントごとのレイテンシとエラーをスレッド間で集める"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def add(self, name, latency, ok):
+        with self.lock:
+            self.latencies[name].append(latency)
+            if not ok:
+                self.errors[name] += 1
+
+    def summary(self, elapsed):
+        """エンドポイントごとと全体の集計結果"""
+        def summarize(latencies, errors):
+            latencies = sorted(latencies)
+            return {
+                'requests': len(latencies),
+                'errors': errors,
+                'error_rate': errors / len(latencies) if latencies else 0.0,
+                'throughput': len(latencies) / elapsed if elapsed else 0.0,
+                'p50_ms': percentile(latencies, 0.50),
+                'p95_ms': percentile(latencies, 0.95),
+                'p99_ms': percentile(latencies, 0.99),
+            }
+
+        with self.lock:
+            endpoints = {
+                name: summarize(latencies, self.errors[name])
+                for name, latencies in sorted(self.latencies.items())
+            }
+            total = summarize(
+                [latency for latencies in self.latencies.values() for latency in latencies],
+                sum(self.errors.values()),
+            )
+        return endpoints, total
+
+
+class Worker(threading.Thread):
+    """1人の利用者として、終了時刻までリクエストを送り続ける(接続はKeep-Aliveで使い回す)"""
+
+    def __init__(self, target, mix, dates, recorder, stop_at, think_time, timeout, seed):
+        super().__init__(daemon=True)
+        self.scheme, self.netloc, self.prefix = target
+        self.mix = mix
+        self.weights = [weight for _, weight, _ in mix]
+        self.dates = dates
+        self.recorder = recorder
+        self.stop_at = stop_at
+        self.think_time = think_time
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.connection = None
+
+    def connect(self):
+        connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(self.netloc, timeout=self.timeout)
+
+    def build_path(self, template):
+        day = self.rng.choice(self.dates)
+        # 分析系は指定日から最大1か月前までの期間を指定する
+        start = max(day - timedelta(days=self.rng.choice((6, 13, 29))), self.dates[0])
+        return self.prefix + template.format(date=day, start=start, end=day)
+
+    def request(self, path):
+        if self.connection is None:
+            self.connect()
+        try:
+            self.connection.request('GET', path, headers={'Accept': 'application/json'})
+            response = self.connection.getresponse()
+            response.read()
+            if response.getheader('Connection', '').lower() == 'close':
+                self.connection.close()
+                self.connection = None
+            return 200 <= response.status < 400
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = None
+            return False
+
+    def run(self):
+        while time.monotonic() < self.stop_at:
+            name, _, template = self.rng.choices(self.mix, weights=self.weights)[0]
+            started = time.perf_counter()
+            ok = self.request(self.build_path(template))
+            self.recorder.add(name, (time.perf_counter() - started) * 1000, ok)
+            if self.think_time:
+                time.sleep(self.rng.uniform(0, 2 * self.think_time))
+        if self.connection is not None:
+            self.connection.close()
+
+
+def run_stage(target, mix, dates, concurrency, duration, think_time, timeout, seed):
+    """指定した同時接続数で一定時間リクエストを送り、集計結果を返す"""
+    recorder = Recorder()
+    stop_at = time.monotonic() + duration
+    workers = [
+        Worker(target, mix, dates, recorder, stop_at, think_time, timeout, seed * 1000 + number)
+        for number in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    endpoints, total = recorder.summary(time.perf_counter() - started)
+    return {'concurrency': concurrency, 'duration': duration, 'total': total, 'endpoints': endpoints}
+
+
+def format_ms(value):
+    return '-' if value is None else f"{value:.1f}"
+
+
+def print_stage(result):
+    total = result['total']
+    print(
+        f"\n== concurrency {result['concurrency']}: {total['requests']} requests, "
+        f"{total['throughput']:.1f} req/s, errors {total['error_rate']:.1%}, "
+        f"p50 {format_ms(total['p50_ms'])}ms / p95 {format_ms(total['p95_ms'])}ms / p99 {format_ms(total['p99_ms'])}ms"
+    )
+    print(f"{'endpoint':<34}{'req':>7}{'req/s':>9}{'err%':>7}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for name, stats in result['endpoints'].items():
+        print(
+            f"{name:<34}{stats['requests']:>7}{stats['throughput']:>9.1f}{stats['error_rate'] * 100:>7.1f}"
+            f"{format_ms(stats['p50_ms']):>9}{format_ms(stats['p95_ms']):>9}{format_ms(stats['p99_ms']):>9}"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load test the cafe dashboard REST API')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000/api', help='APIのURL')
+    parser.add_argument('--stages', default='1,5,10,20,50', help='段階ごとの同時接続数 (カンマ区切り)')
+    parser.add_argument('--duration', type=float, default=30, help='1段階の秒数')
+    parser.add_argument('--think-time', type=float, default=0, help='リクエスト間の平均待ち時間(秒)')
+    parser.add_argument('--start-date', default='2024-04-01', help='リクエストに使う日付の範囲の開始日')
+    parser.add_argument('--end-date', default='2024-04-30', help='リクエストに使う日付の範囲の終了日')
+    parser.add_argument('--timeout', type=float, default=30, help='1リクエストのタイムアウト(秒)')
+    parser.add_argument('--seed', type=int, default=0, help='リクエストの選択に使う乱数のシード')
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help='この割合を超えるエラーが出たら増加を止める')
+    parser.add_argument('--max-p95-ms', type=float, help='全体のp95がこの値を超えたら増加を止める')
+    parser.add_argument('--mix', help='リクエストの比率を上書きするJSONファイル ([[名前, 重み, パス], ...])')
+    parser.add_argument('--output', help='結果を書き出すJSONファイル')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    url = urlsplit(args.base_url)
+    target = (url.scheme, url.netloc, url.path.rstrip('/'))
+
+    mix = DEFAULT_MIX
+    if args.mix:
+        with open(args.mix, encoding='utf-8') as f:
+            mix = [tuple(entry) for entry in json.load(f)]
+
+    first, last = date.fromisoformat(args.start_date), date.fromisoformat(args.end_date)
+    dates = [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+    stages = [int(stage) for stage in args.stages.split(',')]
+
+    results = []
+    max_sustained = None
+    for concurrency in stages:
+        result = run_stage(target, mix, dates, concurrency, args.duration, args.think_time, args.timeout, args.seed)
+        results.append(result)
+        print_stage(result)
+
+        total = result['total']
+        over_p95 = args.max_p95_ms is not None and (total['p95_ms'] or 0) > args.max_p95_ms
+        if total['error_rate'] > args.max_error_rate or over_p95:
+            print(f"\nStopped ramping at concurrency {concurrency} (error rate or p95 limit exceeded)")
+            break
+        max_sustained = concurrency
+
+    print(f"\nHighest concurrency within limits: {max_sustained if max_sustained is not None else 'none'}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'base_url': args.base_url,
+                'max_sustained_concurrency': max_sustained,
+                'stages': results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
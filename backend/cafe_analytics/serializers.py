@@ -3,6 +3,7 @@ from .models import (
     Category, MenuItem, OrderItem, Order,
     Gender, OrderType, WeatherType, TimeSlot,
 )
+from .services.dimensions import DimensionRegistry
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -36,12 +37,16 @@ class TimeSlotSerializer(serializers.ModelSerializer):
 
 
 class MenuItemSerializer(serializers.ModelSerializer):
-    category_name = serializers.CharField(source='category.name', read_only=True)
+    category_name = serializers.SerializerMethodField()
 
     class Meta:
         model = MenuItem
         fields = ['id', 'name', 'price', 'category', 'category_name']
 
+    def get_category_name(self, obj):
+        # カテゴリー名はレジストリから引き、メニューごとのクエリを発行しない
+        return DimensionRegistry.get().name('category', obj.category_id)
+
 
 class OrderItemSerializer(serializers.ModelSerializer):
     menu_item_name = serializers.CharField(source='menu_item.name', read_only=True)
@@ -77,3 +82,60 @@ class OrderSerializer(serializers.ModelSerializer):
             'total_price', 'discount', 'final_price',
             'items',
         ]
+
+
+# .values()の行から辞書を組み立てる読み取り専用の高速なシリアライズ
+# OrderSerializerと同じ形式を、モデルインスタンスを生成せずに作る
+# 名称はマスターとJOINせず、DimensionRegistryでIDから付ける
+ORDER_VALUE_FIELDS = (
+    'id', 'timestamp', 'total_price', 'discount',
+    'gender_id', 'order_type_id', 'weather_id', 'time_slot_id',
+)
+ORDER_ITEM_VALUE_FIELDS = (
+    'id', 'order_id', 'price', 'menu_item_id',
+)
+
+_timestamp_field = serializers.DateTimeField()
+
+
+def order_item_row_to_dict(row, registry=None):
+    """注文アイテムの行をOrderItemSerializerと同じ形式に変換する"""
+    menu_item = (registry or DimensionRegistry.get()).menu_item(row['menu_item_id'])
+    return {
+        'id': row['id'],
+        'menu_item': row['menu_item_id'],
+        'menu_item_name': menu_item['name'],
+        'menu_item_price': menu_item['price'],
+        'category_name': menu_item['category_name'],
+        'price': row['price'],
+    }
+
+
+def order_row_to_dict(row, items, registry=None):
+    """注文の行をOrderSerializerと同じ形式に変換する"""
+    registry = registry or DimensionRegistry.get()
+    return {
+        'id': row['id'],
+        'timestamp': _timestamp_field.to_representation(row['timestamp']),
+        'gender': row['gender_id'],
+        'gender_name': registry.name('gender', row['gender_id']),
+        'order_type': row['order_type_id'],
+        'order_type_name': registry.name('order_type', row['order_type_id']),
+        'weather': row['weather_id'],
+        'weather_name': registry.name('weather', row['weather_id']),
+        'time_slot': row['time_slot_id'],
+        'time_slot_name': registry.name('time_slot', row['time_slot_id']),
+        'total_price': row['total_price'],
+        'discount': row['discount'],
+        'final_price': row['total_price'] + row['discount'],
+        'items': items,
+    }
+
+
+def serialize_order_rows(order_rows, item_rows):
+    """注文と注文アイテムの行から、アイテムを含む注文の一覧を作る"""
+    registry = DimensionRegistry.get()
+    items_by_order = {}
+    for row in item_rows:
+        items_by_order.setdefault(row['order_id'], []).append(order_item_row_to_dict(row, registry))
+    return [order_row_to_dict(row, items_by_order.get(row['id'], []), registry) for row in order_rows]
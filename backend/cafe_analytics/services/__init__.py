@@ -1,6 +1,8 @@
-from datetime import date, datetime
+from datetime import date, datetime, time, timedelta
 from typing import Optional, Union, List, Dict, Any
+from django.conf import settings
 from django.db.models import QuerySet
+from django.utils import timezone
 from django.utils.dateparse import parse_date
 
 class BaseService:
@@ -31,6 +33,43 @@ class BaseService:
         except (ValueError, TypeError):
             return None
 
+    @staticmethod
+    def start_of_day(day: date) -> datetime:
+        """日付の開始時刻(ローカルタイムゾーン)を返す"""
+        start = datetime.combine(day, time.min)
+        return timezone.make_aware(start) if settings.USE_TZ else start
+
+    @classmethod
+    def timestamp_range_filter(
+        cls,
+        start_date: Optional[Union[str, date]] = None,
+        end_date: Optional[Union[str, date]] = None,
+        field: str = 'timestamp',
+    ) -> Dict[str, datetime]:
+        """
+        日付の範囲を日時の半開区間 [開始日 00:00, 終了日翌日 00:00) の条件に変換する
+        timestamp__date のようにカラムを関数で包まないため、timestampのインデックスが使われる
+
+        Args:
+            start_date (str or date, optional): 開始日. Defaults to None.
+            end_date (str or date, optional): 終了日. Defaults to None.
+            field (str, optional): 日時フィールド名. Defaults to 'timestamp'.
+
+        Returns:
+            Dict[str, datetime]: filter()に渡す条件
+        """
+        filters = {}
+
+        start_date_obj = cls.parse_date_param(start_date)
+        if start_date_obj:
+            filters[f'{field}__gte'] = cls.start_of_day(start_date_obj)
+
+        end_date_obj = cls.parse_date_param(end_date)
+        if end_date_obj:
+            filters[f'{field}__lt'] = cls.start_of_day(end_date_obj + timedelta(days=1))
+
+        return filters
+
     @staticmethod
     def date_range_to_dict(start_date: date, end_date: date) -> Dict[str, date]:
         """開始日と終了日を辞書形式に変換
@@ -46,3 +85,23 @@ class BaseService:
             'start_date': start_date,
             'end_date': end_date
         }
+
+    @staticmethod
+    def truncate_period(day: date, period: str) -> Union[date, datetime]:
+        """
+        日付を期間の開始に切り捨てる(TruncDate/TruncWeek/TruncMonthと同じ形式)
+
+        Args:
+            day (date): 日付
+            period (str): 'daily', 'weekly', 'monthly'のいずれか
+
+        Returns:
+            Union[date, datetime]: 日次はdate、週次・月次は期間開始のdatetime
+        """
+        if period == 'weekly':
+            start = day - timedelta(days=day.weekday())
+        elif period == 'monthly':
+            start = day.replace(day=1)
+        else:
+            return day
+        return timezone.make_aware(datetime.combine(start, time.min))
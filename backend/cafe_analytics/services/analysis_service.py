@@ -0,0 +1,62 @@
+import inspect
+from typing import Any, Callable, Dict, Optional, Union
+from datetime import date
+
+from . import BaseService
+from .cache_service import DashboardCache
+from .product_service import ProductService
+from .sales_service import SalesService
+
+# 分析APIの名前と、期間と追加の引数を受け取って結果を返す関数の対応
+ANALYSES: Dict[str, Callable[..., Any]] = {
+    'dashboard.daily_sales': lambda start, end: SalesService.get_period_sales('daily', start, end),
+    'dashboard.weekly_sales': lambda start, end: SalesService.get_period_sales('weekly', start, end),
+    'dashboard.monthly_sales': lambda start, end: SalesService.get_period_sales('monthly', start, end),
+    'sales.sales_summary': SalesService.get_sales_summary,
+    'sales.category_sales': lambda start, end: SalesService.get_top_categories(None, start, end),
+    'sales.sales_by_weather': lambda start, end: SalesService.get_sales_by_factor('weather', 'weather__name', start, end),
+    'sales.sales_by_gender': lambda start, end: SalesService.get_sales_by_factor('gender', 'gender__name', start, end),
+    'sales.weather_timeslot_analysis': SalesService.get_weather_timeslot_analysis,
+    'products.bestsellers': lambda start, end, limit=10: ProductService.get_bestsellers(limit, start, end),
+    'products.discount_analysis': ProductService.get_discount_analysis,
+    'products.dine_in_popular_items': ProductService.get_dine_in_popular_by_timeslot,
+    'products.dine_in_popular': lambda start, end, limit=10: ProductService.get_popular_items_by_type(1, limit, start, end),
+    'products.takeout_popular': lambda start, end, limit=10: ProductService.get_popular_items_by_type(2, limit, start, end),
+    'products.combo_analysis': lambda start, end, min_occurrence=2, limit=10, include_triples=False: (
+        ProductService.get_combo_analysis(min_occurrence, limit, start, end, include_triples)
+    ),
+}
+
+
+class AnalysisService(BaseService):
+    """分析APIの結果を、期間内のデータバージョンをキーにしたキャッシュ経由で返す"""
+
+    @staticmethod
+    def get_cached_analysis(
+        name: str,
+        start_date: Optional[Union[str, date]] = None,
+        end_date: Optional[Union[str, date]] = None,
+        **params: Any
+    ) -> Any:
+        """
+        分析結果をキャッシュ経由で取得する
+        キャッシュキーには分析の名前・追加の引数・期間内のデータバージョンを含める
+
+        Args:
+            name (str): ANALYSESのキー
+            start_date (str or date, optional): 開始日. Defaults to None.
+            end_date (str or date, optional): 終了日. Defaults to None.
+            **params: 分析ごとの追加の引数(limit等)
+
+        Returns:
+            Any: 分析結果
+        """
+        analysis = ANALYSES[name]
+        # 省略した引数も既定値で埋め、同じ条件なら同じキーになるようにする
+        bound = inspect.signature(analysis).bind(start_date, end_date, **params)
+        bound.apply_defaults()
+        extra = list(bound.arguments.items())[2:]
+        endpoint = name + ''.join(f':{key}={value}' for key, value in extra)
+        return DashboardCache.get_or_compute_analysis(
+            endpoint, start_date, end_date, lambda: analysis(start_date, end_date, **params)
+        )
@@ -0,0 +1,111 @@
+from collections import defaultdict
+from itertools import combinations
+from typing import Dict, List, Any, Optional, Union, Tuple
+from datetime import date
+
+from cafe_analytics.models import OrderItem
+from . import BaseService
+from .dimensions import DimensionRegistry
+
+
+class BasketEngine(BaseService):
+    """
+    期間内の (注文ID, 商品名) を1回のクエリで取得し、商品ごとに「含まれる注文」のビットセットを作る
+    組み合わせの出現回数はビットセットのANDとビット数で数えるため、注文ごとのクエリは発行しない
+    """
+
+    def __init__(
+        self,
+        start_date: Optional[Union[str, date]] = None,
+        end_date: Optional[Union[str, date]] = None
+    ):
+        self.start_date = start_date
+        self.end_date = end_date
+
+        # 商品名 -> 含まれる注文のビットセット (注文ごとに1ビット)
+        self.bitsets: Dict[str, int] = {}
+        self.total_orders = 0
+
+        self._run()
+
+    def _run(self) -> None:
+        """注文アイテムを取得し、商品ごとのビットセットを作成する"""
+        rows = OrderItem.objects.filter(
+            **self.timestamp_range_filter(self.start_date, self.end_date, field='order__timestamp')
+        ).values_list('order_id', 'menu_item_id')
+
+        registry = DimensionRegistry.get()
+        names: Dict[int, str] = {}
+        order_indexes: Dict[str, int] = {}
+        # 商品名 -> 含まれる注文の番号 (ビットセットは最後に商品ごとに1回だけ作る)
+        positions: Dict[str, List[int]] = defaultdict(list)
+        for order_id, menu_item_id in rows:
+            index = order_indexes.setdefault(order_id, len(order_indexes))
+            name = names.get(menu_item_id)
+            if name is None:
+                name = names[menu_item_id] = registry.menu_item(menu_item_id)['name']
+            positions[name].append(index)
+
+        self.total_orders = len(order_indexes)
+        size = (self.total_orders + 7) // 8
+        for name, indexes in positions.items():
+            buffer = bytearray(size)
+            for index in indexes:
+                buffer[index >> 3] |= 1 << (index & 7)
+            self.bitsets[name] = int.from_bytes(buffer, 'little')
+
+    def _metrics(self, items: Tuple[str, ...], bits: int) -> Dict[str, Any]:
+        """組み合わせの支持度・確信度・リフト値を計算する"""
+        count = bits.bit_count()
+        support = count / self.total_orders
+        item_supports = {name: self.bitsets[name].bit_count() / self.total_orders for name in items}
+
+        expected = 1.0
+        for value in item_supports.values():
+            expected *= value
+
+        return {
+            'items': items,
+            'occurrence_count': count,
+            'support': support,
+            # 各商品を注文した人が、組み合わせの残りの商品も注文した割合
+            'confidence': {name: support / value for name, value in item_supports.items()},
+            'lift': support / expected,
+        }
+
+    def combos(self, min_occurrence: int = 2, include_triples: bool = False) -> List[Dict[str, Any]]:
+        """
+        出現回数がmin_occurrence以上の商品の組み合わせを取得する
+
+        Args:
+            min_occurrence (int, optional): 最小の出現回数 (1未満は1とみなす). Defaults to 2.
+            include_triples (bool, optional): 3品の組み合わせも含めるか. Defaults to False.
+
+        Returns:
+            List[Dict[str, Any]]: 出現回数の多い順の組み合わせ
+        """
+        # 一緒に注文されたことの無い組み合わせは含めない
+        min_occurrence = max(min_occurrence, 1)
+        names = sorted(self.bitsets)
+        results = []
+
+        frequent_pairs = {}
+        for pair in combinations(names, 2):
+            bits = self.bitsets[pair[0]] & self.bitsets[pair[1]]
+            if bits.bit_count() >= min_occurrence:
+                frequent_pairs[pair] = bits
+                results.append(self._metrics(pair, bits))
+
+        if include_triples:
+            # 3品の組み合わせは、含まれるすべてのペアが条件を満たすものだけを調べる
+            for pair, bits in frequent_pairs.items():
+                for name in names:
+                    if name <= pair[1]:
+                        continue
+                    if (pair[0], name) not in frequent_pairs or (pair[1], name) not in frequent_pairs:
+                        continue
+                    triple_bits = bits & self.bitsets[name]
+                    if triple_bits.bit_count() >= min_occurrence:
+                        results.append(self._metrics(pair + (name,), triple_bits))
+
+        return sorted(results, key=lambda x: (-x['occurrence_count'], x['items']))
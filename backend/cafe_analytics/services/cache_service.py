@@ -0,0 +1,157 @@
+import hashlib
+from typing import Any, Callable, Dict, Iterable
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+
+from cafe_analytics.models import DataVersion
+from . import BaseService
+
+VERSION_KEY_PREFIX = 'data-version'
+RESPONSE_KEY_PREFIX = 'dashboard'
+
+
+class DashboardCache(BaseService):
+    """
+    日付ごとのデータバージョンをキーに含めたレスポンスキャッシュ
+    注文が変更された日付のバージョンのみを上げるため、その日を含む期間だけが再計算される
+    """
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return getattr(settings, 'DASHBOARD_CACHE_ENABLED', True)
+
+    @staticmethod
+    def get_cache():
+        return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'dashboard')]
+
+    @staticmethod
+    def _version_key(day: date) -> str:
+        return f"{VERSION_KEY_PREFIX}:{day.isoformat()}"
+
+    @classmethod
+    def get_versions(cls, start_date: date, end_date: date) -> Dict[date, int]:
+        """
+        期間内の各日付のデータバージョンを取得
+        キャッシュに無い日付のみDBから取得する
+        """
+        days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+        cache = cls.get_cache()
+        cached = cache.get_many([cls._version_key(day) for day in days])
+
+        versions = {}
+        missing = []
+        for day in days:
+            value = cached.get(cls._version_key(day))
+            if value is None:
+                missing.append(day)
+            else:
+                versions[day] = value
+
+        if missing:
+            stored = dict(DataVersion.objects.filter(
+                date__range=[missing[0], missing[-1]]
+            ).values_list('date', 'version'))
+            fetched = {day: stored.get(day, 0) for day in missing}
+            cache.set_many(
+                {cls._version_key(day): version for day, version in fetched.items()},
+                timeout=getattr(settings, 'DASHBOARD_CACHE_VERSION_TTL', 5),
+            )
+            versions.update(fetched)
+
+        return versions
+
+    @classmethod
+    def bump_versions(cls, dates: Iterable[date]) -> None:
+        """指定した日付のデータバージョンを上げる(その日を含むキャッシュを無効化)"""
+        dates = sorted(set(dates))
+        if not dates:
+            return
+
+        with transaction.atomic():
+            DataVersion.objects.filter(date__in=dates).update(version=F('version') + 1)
+            existing = set(DataVersion.objects.filter(date__in=dates).values_list('date', flat=True))
+            DataVersion.objects.bulk_create(
+                [DataVersion(date=day, version=1) for day in dates if day not in existing],
+                ignore_conflicts=True,
+            )
+
+        cls.get_cache().delete_many([cls._version_key(day) for day in dates])
+
+    @classmethod
+    def bump_all_versions(cls) -> None:
+        """
+        すべての日付のデータバージョンを上げる
+        マスターの名称変更等で、注文が変わらなくても全期間の結果(キャッシュ・ETag・スナップショット)が変わる場合に使用する
+        """
+        with transaction.atomic():
+            DataVersion.objects.update(version=F('version') + 1)
+        cls.get_cache().delete_many([
+            cls._version_key(day) for day in DataVersion.objects.values_list('date', flat=True)
+        ])
+
+    @classmethod
+    def make_key(cls, endpoint: str, start_date: date, end_date: date) -> str:
+        """エンドポイント・期間・期間内のデータバージョンからキャッシュキーを生成"""
+        versions = cls.get_versions(start_date, end_date)
+        digest = hashlib.sha1(
+            ','.join(str(versions[day]) for day in sorted(versions)).encode()
+        ).hexdigest()
+        return f"{RESPONSE_KEY_PREFIX}:{endpoint}:{start_date.isoformat()}:{end_date.isoformat()}:{digest}"
+
+    @classmethod
+    def get_etag(cls, endpoint: str, start_date: date, end_date: date) -> str:
+        """エンドポイント・期間・期間内のデータバージョンから条件付きGET用のETagを生成"""
+        return hashlib.sha1(cls.make_key(endpoint, start_date, end_date).encode()).hexdigest()
+
+    @classmethod
+    def get_or_compute(
+        cls,
+        endpoint: str,
+        start_date: date,
+        end_date: date,
+        compute: Callable[[], Any],
+    ) -> Any:
+        """
+        キャッシュ済みの結果を返す。無ければ計算して保存する
+
+        Args:
+            endpoint (str): エンドポイント名
+            start_date (date): 期間の開始日
+            end_date (date): 期間の終了日
+            compute (Callable[[], Any]): 結果を計算する関数
+
+        Returns:
+            Any: 計算結果
+        """
+        if not cls.is_enabled():
+            return compute()
+
+        cache = cls.get_cache()
+        key = cls.make_key(endpoint, start_date, end_date)
+        result = cache.get(key)
+        if result is None:
+            result = compute()
+            cache.set(key, result, timeout=getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', None))
+        return result
+
+    @classmethod
+    def get_or_compute_analysis(
+        cls,
+        endpoint: str,
+        start_date: Any,
+        end_date: Any,
+        compute: Callable[[], Any],
+    ) -> Any:
+        """
+        期間を指定した分析結果をキャッシュ経由で取得する
+        開始日と終了日の両方が正しく指定されていない場合は、キャッシュせずに計算する
+        """
+        start_date_obj = cls.parse_date_param(start_date)
+        end_date_obj = cls.parse_date_param(end_date)
+        if not start_date_obj or not end_date_obj or start_date_obj > end_date_obj:
+            return compute()
+        return cls.get_or_compute(endpoint, start_date_obj, end_date_obj, compute)
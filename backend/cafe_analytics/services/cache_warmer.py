@@ -0,0 +1,149 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from . import BaseService
+from .analysis_service import ANALYSES, AnalysisService
+from .dashboard_service import DashboardService
+from .dimensions import DimensionRegistry
+from .order_service import OrderService
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_PERIODS = ('daily', 'weekly', 'monthly')
+# 分析画面が既定で表示する期間(対象日までの日数)
+DEFAULT_ANALYSIS_DAYS = 30
+
+
+class CacheWarmer(BaseService):
+    """
+    最新の注文日を基準に、直近の期間のダッシュボードと分析結果を計算してキャッシュに保存する
+    デプロイやキャッシュの削除の直後でも、最初の利用者が再計算を待たないようにする
+    """
+
+    def __init__(
+        self,
+        periods: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        anchor: Optional[date] = None,
+        analyses: Optional[Iterable[str]] = None
+    ):
+        self.periods = periods or getattr(settings, 'CACHE_WARM_PERIODS', 1)
+        self.concurrency = concurrency or getattr(settings, 'CACHE_WARM_CONCURRENCY', 4)
+        self.anchor = anchor or OrderService.get_latest_order_date()
+        self.analyses = list(ANALYSES) if analyses is None else list(analyses)
+
+    def get_ranges(self) -> Dict[str, List[Tuple[date, date]]]:
+        """ダッシュボードの種類ごとに、基準日から遡った直近の期間を返す"""
+        ranges = {}
+        for period in DASHBOARD_PERIODS:
+            ranges[period] = []
+            target_date = self.anchor
+            for _ in range(self.periods):
+                start_date, end_date = DashboardService.get_period_range(period, target_date)
+                ranges[period].append((start_date, end_date))
+                target_date = start_date - timedelta(days=1)
+        return ranges
+
+    def get_tasks(self) -> List[Tuple[str, Callable[[], Any]]]:
+        """キャッシュする計算の一覧 (名前, 関数)"""
+        if self.anchor is None:
+            return []
+
+        tasks = []
+        analysis_ranges = []
+        for period, ranges in self.get_ranges().items():
+            for start_date, end_date in ranges:
+                # ダッシュボードのキャッシュキーは期間で決まるため、期間の最終日を対象日にする
+                tasks.append((
+                    f"{period}_dashboard {start_date}..{end_date}",
+                    partial(DashboardService.get_cached_dashboard, period, end_date),
+                ))
+                analysis_ranges.append((start_date, end_date))
+        analysis_ranges.append((self.anchor - timedelta(days=DEFAULT_ANALYSIS_DAYS), self.anchor))
+
+        for start_date, end_date in dict.fromkeys(analysis_ranges):
+            for name in self.analyses:
+                tasks.append((
+                    f"{name} {start_date}..{end_date}",
+                    partial(AnalysisService.get_cached_analysis, name, start_date, end_date),
+                ))
+        return tasks
+
+    @staticmethod
+    def _run_task(name: str, func: Callable[[], Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            func()
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        return {'name': name, 'seconds': time.perf_counter() - started, 'error': error}
+
+    @classmethod
+    def _run_in_worker(cls, task: Tuple[str, Callable[[], Any]]) -> Dict[str, Any]:
+        """ワーカースレッドで実行し、終了時にそのスレッドのDB接続を閉じる"""
+        close_old_connections()
+        try:
+            return cls._run_task(*task)
+        finally:
+            connections.close_all()
+
+    def run(self, progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+        """
+        全ての計算を最大concurrency件ずつ並列に実行する(1の場合は呼び出し元のスレッドで順に実行する)
+
+        Args:
+            progress (Callable[[Dict[str, Any]], None], optional): 計算ごとの結果を受け取る関数. Defaults to None.
+
+        Returns:
+            List[Dict[str, Any]]: 計算ごとの名前・処理時間(秒)・エラー
+        """
+        # プロセス内に保持するマスターの名称も先に読み込んでおく
+        DimensionRegistry.get()
+
+        tasks = self.get_tasks()
+        results = []
+        if self.concurrency <= 1:
+            for task in tasks:
+                results.append(self._run_task(*task))
+                if progress:
+                    progress(results[-1])
+            return results
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='cache-warm') as executor:
+            for result in executor.map(self._run_in_worker, tasks):
+                results.append(result)
+                if progress:
+                    progress(result)
+        return results
+
+    @classmethod
+    def start_in_background(cls) -> threading.Thread:
+        """プロセスの起動時に、リクエストの受付を止めずに別スレッドでキャッシュを温める"""
+        def run():
+            try:
+                results = cls().run()
+                failed = [result for result in results if result['error']]
+                logger.info('Cache warming finished: %d tasks, %d failed', len(results), len(failed))
+            except Exception:
+                logger.exception('Cache warming failed')
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=run, name='cache-warm', daemon=True)
+        thread.start()
+        return thread
+
+
+def warm_on_startup() -> None:
+    """CACHE_WARM_ON_STARTUPが有効な場合に、起動時のキャッシュの温めを開始する(wsgi.py / asgi.pyから呼ぶ)"""
+    if getattr(settings, 'CACHE_WARM_ON_STARTUP', False):
+        CacheWarmer.start_in_background()
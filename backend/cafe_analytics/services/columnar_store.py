@@ -0,0 +1,408 @@
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Any, Optional, Union, Tuple
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from cafe_analytics.models import Order, OrderItem, DataVersion
+from . import BaseService
+from .dimensions import DimensionRegistry
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpyは任意の依存関係
+    np = None
+
+BACKEND_SQL = 'sql'
+BACKEND_COLUMNAR = 'columnar'
+
+# 注文の次元カラム(名称は集計時にDimensionRegistryで付ける)
+ORDER_DIMENSIONS = ('gender', 'order_type', 'weather', 'time_slot')
+
+
+class ColumnarStore(BaseService):
+    """
+    注文と注文アイテムをNumPyの列指向配列としてプロセス内に保持し、集計をベクトル演算で行う
+    注文はtimestamp順に並べるため、期間の絞り込みは二分探索によるスライスになる
+    データバージョン(DataVersion)が変わると次の参照時に読み込み直す
+    配列はIDだけを保持し、名称とメニューのカテゴリーはDimensionRegistryから引くため、マスターの変更はすぐに反映される
+    """
+
+    _instance: Optional['ColumnarStore'] = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        if np is None:
+            raise ImproperlyConfigured('ANALYTICS_BACKEND = "columnar" requires numpy (pip install numpy)')
+        self.fingerprint = self.get_fingerprint()
+        self.checked_at = time.monotonic()
+        self._load()
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return getattr(settings, 'ANALYTICS_BACKEND', BACKEND_SQL) == BACKEND_COLUMNAR
+
+    @staticmethod
+    def get_fingerprint() -> Tuple[Any, ...]:
+        """データの変更を検出するための値(データバージョンの合計と最終更新日時)"""
+        versions = DataVersion.objects.aggregate(
+            total=Sum('version'), days=Count('id'), updated_at=Max('updated_at')
+        )
+        return versions['total'], versions['days'], versions['updated_at']
+
+    @classmethod
+    def get(cls) -> 'ColumnarStore':
+        """
+        読み込み済みのストアを返す
+        一定間隔ごとにデータバージョンを確認し、変わっていれば新しいストアを作ってから差し替える
+        読み込みは1つのスレッドだけが行い、その間も他のスレッドは待たずに前のストアを使う
+        """
+        interval = getattr(settings, 'ANALYTICS_COLUMNAR_REFRESH_INTERVAL', 5)
+        store = cls._instance
+        if store is not None:
+            if time.monotonic() - store.checked_at < interval:
+                return store
+            store.checked_at = time.monotonic()
+            if cls.get_fingerprint() == store.fingerprint:
+                return store
+
+        # 前のストアが無い場合だけ、読み込みの完了を待つ
+        if not cls._lock.acquire(blocking=store is None):
+            return store
+        try:
+            current = cls._instance
+            if current is not None and current is not store:
+                # 他のスレッドが読み込み直した
+                return current
+            cls._instance = cls()
+            return cls._instance
+        finally:
+            cls._lock.release()
+
+    @classmethod
+    def invalidate(cls) -> None:
+        """次の参照時に読み込み直す"""
+        cls._instance = None
+
+    def _load(self) -> None:
+        """注文と注文アイテムを配列に読み込む"""
+        rows = Order.objects.values_list(
+            'id', 'timestamp', 'gender_id', 'order_type_id', 'weather_id', 'time_slot_id', 'total_price', 'discount'
+        ).order_by('timestamp', 'id')
+
+        positions: Dict[str, int] = {}
+        columns = defaultdict(list)
+        for position, (order_id, timestamp, gender, order_type, weather, time_slot, total_price, discount) in enumerate(
+            rows.iterator(chunk_size=5000)
+        ):
+            positions[order_id] = position
+            local = timezone.localtime(timestamp) if timezone.is_aware(timestamp) else timestamp
+            columns['timestamp'].append(timestamp.timestamp())
+            columns['day'].append(local.toordinal())
+            columns['hour'].append(local.hour)
+            columns['gender'].append(gender)
+            columns['order_type'].append(order_type)
+            columns['weather'].append(weather)
+            columns['time_slot'].append(time_slot)
+            columns['total_price'].append(total_price)
+            columns['discount'].append(discount)
+
+        self.timestamp = np.array(columns['timestamp'], dtype=np.float64)
+        self.day = np.array(columns['day'], dtype=np.int64)
+        self.hour = np.array(columns['hour'], dtype=np.int64)
+        self.total_price = np.array(columns['total_price'], dtype=np.int64)
+        self.discount = np.array(columns['discount'], dtype=np.int64)
+        self.dimensions = {
+            field: np.array(columns[field], dtype=np.int64)
+            for field in ORDER_DIMENSIONS
+        }
+
+        # 注文アイテムは注文の位置順に並べ、期間の絞り込みを注文と同じスライスで行う
+        item_rows = [
+            (positions[order_id], menu_item_id, price)
+            for order_id, menu_item_id, price in OrderItem.objects.values_list(
+                'order_id', 'menu_item_id', 'price'
+            ).iterator(chunk_size=5000)
+        ]
+        item_rows.sort()
+        items = np.array(item_rows, dtype=np.int64).reshape(-1, 3)
+        self.item_order = items[:, 0]
+        self.item_menu = items[:, 1]
+        self.item_price = items[:, 2]
+
+    def _order_slice(
+        self,
+        start_date: Optional[Union[str, date]],
+        end_date: Optional[Union[str, date]]
+    ) -> slice:
+        """期間内の注文の範囲を二分探索で求める"""
+        filters = self.timestamp_range_filter(start_date, end_date)
+        start = filters.get('timestamp__gte')
+        end = filters.get('timestamp__lt')
+        lo = int(np.searchsorted(self.timestamp, start.timestamp(), side='left')) if start else 0
+        hi = int(np.searchsorted(self.timestamp, end.timestamp(), side='left')) if end else len(self.timestamp)
+        return slice(lo, hi)
+
+    def _item_slice(self, orders: slice) -> slice:
+        """注文の範囲に対応する注文アイテムの範囲を求める"""
+        lo = int(np.searchsorted(self.item_order, orders.start, side='left'))
+        hi = int(np.searchsorted(self.item_order, orders.stop, side='left'))
+        return slice(lo, hi)
+
+    @staticmethod
+    def _group(keys, *values) -> Tuple[List[Any], List[int], List[List[int]]]:
+        """
+        キーごとの件数と合計を計算する
+
+        Returns:
+            Tuple: (キー, 件数, 値ごとの合計)
+        """
+        if not len(keys):
+            return [], [], [[] for _ in values]
+        unique, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(unique))
+        sums = [
+            np.bincount(inverse, weights=value, minlength=len(unique)).round().astype(np.int64).tolist()
+            for value in values
+        ]
+        return unique.tolist(), counts.tolist(), sums
+
+    @staticmethod
+    def _merge_by_name(keys: List[Any], names, *columns: List[int]) -> Dict[Any, List[int]]:
+        """IDごとの集計を名称ごとにまとめる(SQLの名称でのGROUP BYに合わせる)"""
+        merged: Dict[Any, List[int]] = {}
+        for index, key in enumerate(keys):
+            name = names(key)
+            totals = merged.setdefault(name, [0] * len(columns))
+            for position, column in enumerate(columns):
+                totals[position] += column[index]
+        return merged
+
+    def sales_summary(self, start_date=None, end_date=None) -> Dict[str, Any]:
+        """売上サマリー(SalesService.get_sales_summaryと同じ形式)"""
+        orders = self._order_slice(start_date, end_date)
+        total_orders = orders.stop - orders.start
+        if not total_orders:
+            return {
+                'total_amount': None,
+                'total_orders': 0,
+                'avg_order_value': None,
+                'total_discount': None,
+                'net_sales': None,
+            }
+        total_amount = int(self.total_price[orders].sum())
+        total_discount = int(self.discount[orders].sum())
+        return {
+            'total_amount': total_amount,
+            'total_orders': total_orders,
+            'avg_order_value': total_amount / total_orders,
+            'total_discount': total_discount,
+            'net_sales': total_amount - total_discount,
+        }
+
+    def period_sales(self, period: str, start_date=None, end_date=None) -> List[Dict[str, Any]]:
+        """期間別の売上(SalesService.get_period_salesと同じ形式)"""
+        orders = self._order_slice(start_date, end_date)
+        days, counts, (sales, discounts) = self._group(
+            self.day[orders], self.total_price[orders], self.discount[orders]
+        )
+
+        buckets: Dict[Any, Dict[str, int]] = {}
+        for index, ordinal in enumerate(days):
+            key = self.truncate_period(date.fromordinal(ordinal), period)
+            bucket = buckets.setdefault(key, {'total_sales': 0, 'total_orders': 0, 'total_discount': 0})
+            bucket['total_sales'] += sales[index]
+            bucket['total_orders'] += counts[index]
+            bucket['total_discount'] += discounts[index]
+
+        return [
+            {
+                'period': key,
+                'total_sales': bucket['total_sales'],
+                'total_orders': bucket['total_orders'],
+                'avg_order_value': bucket['total_sales'] / bucket['total_orders'],
+                'total_discount': bucket['total_discount'],
+                'net_sales': Decimal(bucket['total_sales'] - bucket['total_discount']),
+            }
+            for key, bucket in buckets.items()
+        ]
+
+    def sales_by_factor(self, factor_name_field: str, start_date=None, end_date=None) -> List[Dict[str, Any]]:
+        """要素(天気や性別等)別の売上(SalesService.get_sales_by_factorと同じ形式)"""
+        field = factor_name_field.split('__')[0]
+        orders = self._order_slice(start_date, end_date)
+        keys, counts, (sales,) = self._group(self.dimensions[field][orders], self.total_price[orders])
+        registry = DimensionRegistry.get()
+        merged = self._merge_by_name(keys, lambda key: registry.name(field, key), sales, counts)
+
+        return [
+            {
+                factor_name_field: name,
+                'total_sales': total_sales,
+                'total_orders': total_orders,
+                'avg_order_value': total_sales / total_orders,
+            }
+            for name, (total_sales, total_orders) in sorted(merged.items(), key=lambda item: -item[1][0])
+        ]
+
+    def factor_counts(self, factor_name_field: str, start_date=None, end_date=None) -> List[Dict[str, Any]]:
+        """要素別の注文件数"""
+        field = factor_name_field.split('__')[0]
+        orders = self._order_slice(start_date, end_date)
+        keys, counts, _ = self._group(self.dimensions[field][orders])
+        registry = DimensionRegistry.get()
+        merged = self._merge_by_name(keys, lambda key: registry.name(field, key), counts)
+        return [
+            {factor_name_field: name, 'count': count}
+            for name, (count,) in sorted(merged.items(), key=lambda item: -item[1][0])
+        ]
+
+    def weather_timeslot_analysis(self, start_date=None, end_date=None) -> List[Dict[str, Any]]:
+        """天気と時間帯のクロス分析(SalesService.get_weather_timeslot_analysisと同じ形式)"""
+        orders = self._order_slice(start_date, end_date)
+        weather = self.dimensions['weather'][orders]
+        time_slot = self.dimensions['time_slot'][orders]
+        width = int(time_slot.max()) + 1 if len(time_slot) else 1
+        keys, counts, (sales,) = self._group(weather * width + time_slot, self.total_price[orders])
+        registry = DimensionRegistry.get()
+        merged = self._merge_by_name(
+            keys,
+            lambda key: (registry.name('weather', key // width), registry.name('time_slot', key % width)),
+            sales, counts,
+        )
+
+        return [
+            {
+                'weather__name': weather_name,
+                'time_slot__name': time_slot_name,
+                'total_sales': total_sales,
+                'order_count': order_count,
+                'avg_order_value': total_sales / order_count,
+            }
+            for (weather_name, time_slot_name), (total_sales, order_count) in sorted(
+                merged.items(),
+                key=lambda item: (
+                    registry.sort_key('weather', item[0][0]),
+                    registry.sort_key('time_slot', item[0][1]),
+                ),
+            )
+        ]
+
+    def top_categories(self, limit: Optional[int] = 5, start_date=None, end_date=None) -> List[Dict[str, Any]]:
+        """トップカテゴリー(SalesService.get_top_categoriesと同じ形式)"""
+        items = self._item_slice(self._order_slice(start_date, end_date))
+        # メニューごとに集計し、集計時点のメニューのカテゴリーでまとめる
+        keys, counts, (sales,) = self._group(self.item_menu[items], self.item_price[items])
+        registry = DimensionRegistry.get()
+        merged = self._merge_by_name(keys, lambda key: registry.menu_item(key)['category_name'], sales, counts)
+
+        ranking = sorted(merged.items(), key=lambda item: -item[1][0])
+        if limit is not None:
+            ranking = ranking[:limit]
+        return [
+            {'menu_item__category__name': name, 'total_sales': total_sales, 'items_sold': items_sold}
+            for name, (total_sales, items_sold) in ranking
+        ]
+
+    def _menu_item_totals(self, items: slice, order_type_id: Optional[int] = None, extra_key=None):
+        """メニューごと(と任意の注文の要素ごと)の販売数と売上を集計する"""
+        menu = self.item_menu[items]
+        price = self.item_price[items]
+        order_positions = self.item_order[items]
+        if order_type_id is not None:
+            mask = self.dimensions['order_type'][order_positions] == order_type_id
+            menu, price, order_positions = menu[mask], price[mask], order_positions[mask]
+
+        if extra_key is None:
+            keys, counts, (sales,) = self._group(menu, price)
+            return [(None, key, count, total) for key, count, total in zip(keys, counts, sales)]
+
+        extra = self.dimensions[extra_key][order_positions]
+        width = int(menu.max()) + 1 if len(menu) else 1
+        keys, counts, (sales,) = self._group(extra * width + menu, price)
+        return [(key // width, key % width, count, total) for key, count, total in zip(keys, counts, sales)]
+
+    @staticmethod
+    def _menu_item_row(registry: DimensionRegistry, menu_item_id: int) -> Dict[str, Any]:
+        menu_item = registry.menu_item(menu_item_id)
+        return {
+            'menu_item__name': menu_item['name'],
+            'menu_item__category__name': menu_item['category_name'],
+            'menu_item__price': menu_item['price'],
+        }
+
+    def bestsellers(self, limit: int = 10, start_date=None, end_date=None) -> List[Dict[str, Any]]:
+        """ベストセラー商品(ProductService.get_bestsellersと同じ形式)"""
+        items = self._item_slice(self._order_slice(start_date, end_date))
+        totals = sorted(self._menu_item_totals(items), key=lambda row: -row[2])[:limit]
+        registry = DimensionRegistry.get()
+        return [
+            {**registry.menu_item_labels(menu_item_id), 'total_quantity': count, 'total_sales': sales}
+            for _, menu_item_id, count, sales in totals
+        ]
+
+    def popular_items_by_type(self, order_type_id: int, limit: int = 10, start_date=None, end_date=None) -> List[Dict[str, Any]]:
+        """注文タイプ別の人気商品(ProductService.get_popular_items_by_typeと同じ形式)"""
+        items = self._item_slice(self._order_slice(start_date, end_date))
+        totals = sorted(self._menu_item_totals(items, order_type_id), key=lambda row: -row[2])[:limit]
+        registry = DimensionRegistry.get()
+        return [
+            {**self._menu_item_row(registry, menu_item_id), 'total_orders': count, 'total_sales': sales}
+            for _, menu_item_id, count, sales in totals
+        ]
+
+    def popular_items_by_timeslot(self, order_type_id: int, start_date=None, end_date=None) -> Dict[str, List[Dict[str, Any]]]:
+        """時間帯ごとの人気メニュー(ProductService.get_dine_in_popular_by_timeslotと同じ形式)"""
+        items = self._item_slice(self._order_slice(start_date, end_date))
+        registry = DimensionRegistry.get()
+        by_slot = defaultdict(list)
+        for time_slot_id, menu_item_id, count, sales in self._menu_item_totals(items, order_type_id, 'time_slot'):
+            by_slot[registry.name('time_slot', time_slot_id)].append((registry.menu_item(menu_item_id), count, sales))
+
+        result = {}
+        for slot_name in sorted(by_slot, key=lambda name: registry.sort_key('time_slot', name)):
+            ranking = sorted(by_slot[slot_name], key=lambda row: -row[1])[:5]
+            result[slot_name] = [
+                {
+                    'category': menu_item['category_name'],
+                    'menu_item': menu_item['name'],
+                    'menu_item__price': menu_item['price'],
+                    'total_orders': count,
+                    'total_sales': sales,
+                }
+                for menu_item, count, sales in ranking
+            ]
+        return result
+
+    def discount_analysis(self, start_date=None, end_date=None) -> List[Dict[str, Any]]:
+        """割引分析(ProductService.get_discount_analysisと同じ形式)"""
+        orders = self._order_slice(start_date, end_date)
+        discount = self.discount[orders]
+        mask = discount != 0
+        total_price = self.total_price[orders][mask]
+        discount = discount[mask]
+        keys, counts, (discounts, sales) = self._group(
+            self.dimensions['time_slot'][orders][mask], discount, total_price
+        )
+        registry = DimensionRegistry.get()
+        merged = self._merge_by_name(keys, lambda key: registry.name('time_slot', key), counts, discounts, sales)
+
+        return [
+            {
+                'time_slot__name': name,
+                'total_orders': total_orders,
+                'total_discount': total_discount,
+                'avg_discount': total_discount / total_orders,
+                'total_sales_before_discount': total_sales,
+                'total_sales_after_discount': total_sales - total_discount,
+            }
+            for name, (total_orders, total_discount, total_sales) in sorted(
+                merged.items(), key=lambda item: registry.sort_key('time_slot', item[0])
+            )
+        ]
@@ -0,0 +1,212 @@
+from collections import Counter, defaultdict
+from typing import Dict, List, Any, Optional
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractHour, TruncDate
+
+from cafe_analytics.models import Order, OrderItem
+from cafe_analytics.pagination import encode_cursor, keyset_page
+from . import BaseService
+from .order_service import OrderService
+from .rollup_service import RollupService
+from .dimensions import DimensionRegistry
+from .execution import run_queries, timed
+
+TAKEOUT_ORDER_TYPE = 'テイクアウト'
+# 売上の集計軸(デイリーダッシュボードでは時刻も加える)
+SALES_GROUP_FIELDS = ('date', 'order_type_id', 'weather_id', 'gender_id')
+
+
+class DashboardEngine(BaseService):
+    """
+    日付×注文タイプ×天気×性別(デイリーは時刻も)の売上とメニューアイテム別の売上から、ダッシュボードの全指標を計算する
+    ロールアップ済みの期間はロールアップから、それ以外は注文をDBで集計して取得する
+    集計結果の行数は軸の組み合わせの数で決まり、注文一覧は先頭の1ページ分だけ取得するため、
+    クエリ数・処理時間・メモリ使用量は期間内の注文件数に依存しない
+    """
+
+    def __init__(self, start_date: date, end_date: date, page_size: Optional[int] = None, hourly: bool = False):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.page_size = page_size or getattr(settings, 'DASHBOARD_ORDERS_PAGE_SIZE', 50)
+        self.hourly_enabled = hourly
+        self.use_rollups = RollupService.is_covered(start_date, end_date)
+
+        # 注文一覧の先頭ページと、続きを取得するためのカーソル
+        self.orders: List[Dict[str, Any]] = []
+        self.orders_cursor: Optional[str] = None
+        self.total_orders = 0
+        self.total_amount = 0
+        self.total_discount = 0
+        self.takeout_orders = 0
+        self.gender_counts = Counter()
+        self.weather_counts = Counter()
+        self.hourly = defaultdict(lambda: {'total_sales': 0, 'order_count': 0})
+        self.daily = defaultdict(lambda: {'total_sales': 0, 'total_orders': 0, 'total_discount': 0})
+        self.categories: List[Dict[str, Any]] = []
+
+        self._run()
+
+    def _fetch_orders_page(self) -> tuple[List[Dict[str, Any]], bool]:
+        """注文一覧の先頭ページ(次のページの有無の判定用に1件多く読む)"""
+        return keyset_page(OrderService.get_order_rows(self.start_date, self.end_date), None, self.page_size)
+
+    def _sales_group_fields(self) -> tuple:
+        return (*SALES_GROUP_FIELDS, 'hour') if self.hourly_enabled else SALES_GROUP_FIELDS
+
+    def _fetch_sales(self) -> List[Dict[str, Any]]:
+        if self.use_rollups:
+            return RollupService.get_sales_rows(self._sales_group_fields(), self.start_date, self.end_date)
+
+        queryset = Order.objects.filter(
+            **self.timestamp_range_filter(self.start_date, self.end_date)
+        ).annotate(date=TruncDate('timestamp'))
+        if self.hourly_enabled:
+            queryset = queryset.annotate(hour=ExtractHour('timestamp'))
+        return list(queryset.values(*self._sales_group_fields()).annotate(
+            order_count=Count('id'),
+            total_sales=Sum('total_price'),
+            total_discount=Sum('discount'),
+        ).order_by())
+
+    def _fetch_categories(self) -> List[Dict[str, Any]]:
+        if self.use_rollups:
+            return RollupService.get_menu_item_sales(self.start_date, self.end_date)
+
+        return list(OrderItem.objects.filter(
+            **self.timestamp_range_filter(self.start_date, self.end_date, field='order__timestamp')
+        ).values('menu_item_id').annotate(
+            total_sales=Sum('price'),
+            items_sold=Count('id'),
+        ).order_by())
+
+    def _run(self) -> None:
+        """注文一覧の先頭ページ・売上の集計・カテゴリー別の売上を取得し、全指標を計算する"""
+        # 3つのクエリは互いに独立しているため、concurrentモードでは同時に実行する
+        rows = run_queries({
+            'orders_query': self._fetch_orders_page,
+            'sales_query': self._fetch_sales,
+            'categories_query': self._fetch_categories,
+        })
+        registry = DimensionRegistry.get()
+        self.categories = registry.merge(
+            rows['categories_query'],
+            lambda row: {'menu_item__category__name': registry.menu_item(row['menu_item_id'])['category_name']},
+            ('total_sales', 'items_sold'),
+        )
+        with timed('aggregate'):
+            self._aggregate(rows['sales_query'])
+
+        order_rows, has_next = rows['orders_query']
+        with timed('orders_page'):
+            self.orders = OrderService.serialize_orders(order_rows)
+        if has_next:
+            self.orders_cursor = encode_cursor(order_rows[-1])
+
+    def _aggregate(self, sales_rows: List[Dict[str, Any]]) -> None:
+        """集計済みの行を合計する(性別と天気はIDで数え、最後に名称の順でまとめる)"""
+        registry = DimensionRegistry.get()
+        takeout_ids = set(registry.ids_named('order_type', TAKEOUT_ORDER_TYPE))
+        gender_counts = Counter()
+        weather_counts = Counter()
+        for row in sales_rows:
+            order_count = row['order_count']
+            total_sales = row['total_sales'] or 0
+            total_discount = row['total_discount'] or 0
+            if not order_count:
+                continue
+
+            self.total_orders += order_count
+            self.total_amount += total_sales
+            self.total_discount += total_discount
+            if row['order_type_id'] in takeout_ids:
+                self.takeout_orders += order_count
+            gender_counts[row['gender_id']] += order_count
+            weather_counts[row['weather_id']] += order_count
+
+            if self.hourly_enabled:
+                hourly = self.hourly[row['hour']]
+                hourly['total_sales'] += total_sales
+                hourly['order_count'] += order_count
+
+            daily = self.daily[row['date']]
+            daily['total_sales'] += total_sales
+            daily['total_orders'] += order_count
+            daily['total_discount'] += total_discount
+
+        for dimension, counts, target in (
+            ('gender', gender_counts, self.gender_counts),
+            ('weather', weather_counts, self.weather_counts),
+        ):
+            names = [(registry.name(dimension, pk), count) for pk, count in counts.items()]
+            for name, count in sorted(names, key=lambda item: registry.sort_key(dimension, item[0])):
+                target[name] += count
+
+    def sales_summary(self) -> Dict[str, Any]:
+        """売上サマリー(SalesService.get_sales_summaryと同じ形式)"""
+        if not self.total_orders:
+            return {
+                'total_amount': None,
+                'total_orders': 0,
+                'avg_order_value': None,
+                'total_discount': None,
+                'net_sales': None,
+            }
+        return {
+            'total_amount': self.total_amount,
+            'total_orders': self.total_orders,
+            'avg_order_value': self.total_amount / self.total_orders,
+            'total_discount': self.total_discount,
+            'net_sales': self.total_amount - self.total_discount,
+        }
+
+    def takeout_rate(self) -> float:
+        return (self.takeout_orders / self.total_orders * 100) if self.total_orders > 0 else 0
+
+    def top_categories(self, limit: int = 5) -> List[Dict[str, Any]]:
+        """トップカテゴリー(SalesService.get_top_categoriesと同じ形式)"""
+        return sorted(self.categories, key=lambda row: row['total_sales'], reverse=True)[:limit]
+
+    def hourly_sales(self) -> List[Dict[str, Any]]:
+        """時間別の売上(SalesService.get_hourly_salesと同じ形式)"""
+        return [
+            {'hour': hour, **self.hourly[hour]}
+            for hour in sorted(self.hourly)
+        ]
+
+    def customer_demographics(self) -> Dict[str, Any]:
+        return {
+            'gender_distribution': [
+                {'gender__name': name, 'count': count}
+                for name, count in self.gender_counts.items()
+            ],
+        }
+
+    def weather_distribution(self) -> List[Dict[str, Any]]:
+        return [
+            {'weather__name': name, 'count': count}
+            for name, count in self.weather_counts.most_common()
+        ]
+
+    def period_sales(self, period: str) -> List[Dict[str, Any]]:
+        """期間別の売上(SalesService.get_period_salesと同じ形式)"""
+        buckets = defaultdict(lambda: {'total_sales': 0, 'total_orders': 0, 'total_discount': 0})
+        for day in sorted(self.daily):
+            bucket = buckets[self.truncate_period(day, period)]
+            for field, value in self.daily[day].items():
+                bucket[field] += value
+
+        return [
+            {
+                'period': key,
+                'total_sales': bucket['total_sales'],
+                'total_orders': bucket['total_orders'],
+                'avg_order_value': bucket['total_sales'] / bucket['total_orders'],
+                'total_discount': bucket['total_discount'],
+                'net_sales': Decimal(bucket['total_sales'] - bucket['total_discount']),
+            }
+            for key, bucket in buckets.items()
+        ]
@@ -1,12 +1,13 @@
 from typing import Dict, List, Optional, Any, Union
 from datetime import date, datetime, timedelta
 
-from cafe_analytics.models import Order
 from . import BaseService
-from .sales_service import SalesService
 from .order_service import OrderService
-from .product_service import ProductService
+from .dashboard_engine import DashboardEngine
+from .cache_service import DashboardCache
+from .single_flight import coalesce_requests
 
+@coalesce_requests('get_daily_dashboard', 'get_weekly_dashboard', 'get_monthly_dashboard', 'get_cached_dashboard')
 class DashboardService(BaseService):
     """ダッシュボード表示に必要なデータを提供するサービス"""
 
@@ -17,20 +18,21 @@ class DashboardService(BaseService):
         if not target_date_obj:
             raise ValueError("Invalid date format")
 
-        orders = OrderService.get_orders_in_period(target_date_obj, target_date_obj)
-        sales_summary = SalesService.get_sales_summary(target_date_obj, target_date_obj)
+        engine = DashboardEngine(target_date_obj, target_date_obj, hourly=True)
+        sales_summary = engine.sales_summary()
 
         return {
             'date': target_date_obj,
             'sales_summary': sales_summary,
-            'orders': OrderService.get_orders_summary(orders),
-            'takeout_rate': SalesService.calculate_takeout_rate(orders),
-            'popular_items': SalesService.get_top_categories(limit=5, start_date=target_date_obj, end_date=target_date_obj),
+            'orders': engine.orders,
+            'orders_cursor': engine.orders_cursor,
+            'takeout_rate': engine.takeout_rate(),
+            'popular_items': engine.top_categories(limit=5),
             'customer_count': sales_summary['total_orders'],
             'avg_order_value': sales_summary['avg_order_value'],
             'total_discount': sales_summary['total_discount'],
-            'hourly_sales': SalesService.get_hourly_sales(orders),
-            'customer_demographics': OrderService.get_customer_demographics(orders)
+            'hourly_sales': engine.hourly_sales(),
+            'customer_demographics': engine.customer_demographics()
         }
 
     @classmethod
@@ -41,22 +43,23 @@ class DashboardService(BaseService):
             raise ValueError("Invalid date format")
 
         start_date, end_date = OrderService.get_date_range(target_date_obj, 'week')
-        orders = OrderService.get_orders_in_period(start_date, end_date)
-        sales_summary = SalesService.get_sales_summary(start_date, end_date)
+        engine = DashboardEngine(start_date, end_date)
+        sales_summary = engine.sales_summary()
 
         return {
             'week_start': start_date,
             'week_end': end_date,
             'sales_summary': sales_summary,
-            'weather_distribution': OrderService.get_weather_distribution(orders),
-            'orders': OrderService.get_orders_summary(orders),
-            'takeout_rate': SalesService.calculate_takeout_rate(orders),
-            'popular_items': SalesService.get_top_categories(limit=5, start_date=start_date, end_date=end_date),
+            'weather_distribution': engine.weather_distribution(),
+            'orders': engine.orders,
+            'orders_cursor': engine.orders_cursor,
+            'takeout_rate': engine.takeout_rate(),
+            'popular_items': engine.top_categories(limit=5),
             'customer_count': sales_summary['total_orders'],
             'avg_order_value': sales_summary['avg_order_value'],
             'total_discount': sales_summary['total_discount'],
-            'daily_sales_breakdown': SalesService.get_period_sales('daily', start_date, end_date),
-            'customer_demographics': OrderService.get_customer_demographics(orders)
+            'daily_sales_breakdown': engine.period_sales('daily'),
+            'customer_demographics': engine.customer_demographics()
         }
 
     @classmethod
@@ -67,20 +70,60 @@ class DashboardService(BaseService):
             raise ValueError("Invalid date format")
 
         start_date, end_date = OrderService.get_date_range(target_date_obj, 'month')
-        orders = OrderService.get_orders_in_period(start_date, end_date)
-        sales_summary = SalesService.get_sales_summary(start_date, end_date)
+        engine = DashboardEngine(start_date, end_date)
+        sales_summary = engine.sales_summary()
 
         return {
             'month_start': start_date,
             'month_end': end_date,
             'sales_summary': sales_summary,
-            'weather_distribution': OrderService.get_weather_distribution(orders),
-            'orders': OrderService.get_orders_summary(orders),
-            'takeout_rate': SalesService.calculate_takeout_rate(orders),
-            'popular_items': SalesService.get_top_categories(limit=5, start_date=start_date, end_date=end_date),
+            'weather_distribution': engine.weather_distribution(),
+            'orders': engine.orders,
+            'orders_cursor': engine.orders_cursor,
+            'takeout_rate': engine.takeout_rate(),
+            'popular_items': engine.top_categories(limit=5),
             'customer_count': sales_summary['total_orders'],
             'avg_order_value': sales_summary['avg_order_value'],
             'total_discount': sales_summary['total_discount'],
-            'weekly_sales_breakdown': SalesService.get_period_sales('weekly', start_date, end_date),
-            'customer_demographics': OrderService.get_customer_demographics(orders)
+            'weekly_sales_breakdown': engine.period_sales('weekly'),
+            'customer_demographics': engine.customer_demographics()
         }
+
+    @staticmethod
+    def get_period_range(period: str, target_date: date) -> tuple[date, date]:
+        """ダッシュボードの種類('daily', 'weekly', 'monthly')に対応する期間を返す"""
+        range_periods = {'daily': 'day', 'weekly': 'week', 'monthly': 'month'}
+        if period not in range_periods:
+            raise ValueError(f"Invalid period: {period}")
+        return OrderService.get_date_range(target_date, range_periods[period])
+
+    @classmethod
+    def get_cached_dashboard(cls, period: str, target_date: Union[str, date]) -> Dict[str, Any]:
+        """
+        期間別のダッシュボードをキャッシュ経由で取得
+        期間内のデータが変更されていなければキャッシュ済みの結果を返す
+
+        Args:
+            period (str): 'daily', 'weekly', 'monthly'のいずれか
+            target_date (str or date): 対象日
+
+        Returns:
+            Dict[str, Any]: ダッシュボードデータ
+        """
+        target_date_obj = cls.parse_date_param(target_date)
+        if not target_date_obj:
+            raise ValueError("Invalid date format")
+
+        builders = {
+            'daily': cls.get_daily_dashboard,
+            'weekly': cls.get_weekly_dashboard,
+            'monthly': cls.get_monthly_dashboard,
+        }
+        start_date, end_date = cls.get_period_range(period, target_date_obj)
+        builder = builders[period]
+        return DashboardCache.get_or_compute(
+            f'{period}_dashboard',
+            start_date,
+            end_date,
+            lambda: builder(target_date_obj),
+        )
@@ -0,0 +1,127 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from django.conf import settings
+
+from cafe_analytics.models import Category, Gender, OrderType, WeatherType, TimeSlot, MenuItem
+
+# 名称を保持する次元と取得元
+DIMENSION_MODELS = {
+    'gender': Gender,
+    'order_type': OrderType,
+    'weather': WeatherType,
+    'time_slot': TimeSlot,
+    'category': Category,
+}
+
+
+class DimensionRegistry:
+    """
+    性別・注文タイプ・天気・時間帯・カテゴリー・メニューアイテムをプロセス内に1回だけ読み込み、IDから名称を引く
+    集計クエリは外部キーのIDでGROUP BYし、名称はこのレジストリで付けるため、マスターとのJOINが不要になる
+    マスターの保存・削除のシグナルで破棄し、他のプロセスでの変更は未知のIDの参照とDIMENSION_REGISTRY_TTLで読み込み直す
+    """
+
+    _instance: Optional['DimensionRegistry'] = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.loaded_at = time.monotonic()
+        self.names: Dict[str, Dict[int, str]] = {}
+        # 名称の並び順(DBの照合順序でのORDER BY nameと同じ順)
+        self.name_order: Dict[str, Dict[str, int]] = {}
+        for dimension, model in DIMENSION_MODELS.items():
+            rows = list(model.objects.order_by('name', 'id').values_list('id', 'name'))
+            self.names[dimension] = dict(rows)
+            order = self.name_order[dimension] = {}
+            for _, name in rows:
+                order.setdefault(name, len(order))
+
+        self.menu_items: Dict[int, Dict[str, Any]] = {
+            pk: {'name': name, 'price': price, 'category_id': category_id}
+            for pk, name, price, category_id in MenuItem.objects.values_list('id', 'name', 'price', 'category_id')
+        }
+
+    @classmethod
+    def get(cls) -> 'DimensionRegistry':
+        """読み込み済みのレジストリを返す(DIMENSION_REGISTRY_TTL秒を過ぎていれば読み込み直す)"""
+        ttl = getattr(settings, 'DIMENSION_REGISTRY_TTL', 300)
+        with cls._lock:
+            registry = cls._instance
+            if registry is None or (ttl > 0 and time.monotonic() - registry.loaded_at >= ttl):
+                registry = cls._instance = cls()
+            return registry
+
+    @classmethod
+    def invalidate(cls) -> None:
+        """次の参照時に読み込み直す"""
+        with cls._lock:
+            cls._instance = None
+
+    def _reload(self) -> 'DimensionRegistry':
+        """未知のIDを参照したときに読み込み直す(他のスレッドが読み込み直していればそれを使う)"""
+        cls = type(self)
+        with cls._lock:
+            if cls._instance is None or cls._instance is self:
+                cls._instance = cls()
+            return cls._instance
+
+    def name(self, dimension: str, pk: Optional[int]) -> Optional[str]:
+        """IDの名称を返す"""
+        names = self.names[dimension]
+        if pk is None or pk in names:
+            return names.get(pk)
+        return self._reload().names[dimension].get(pk)
+
+    def menu_item(self, pk: int) -> Dict[str, Any]:
+        """メニューアイテムの名称・価格・カテゴリー名を返す"""
+        registry = self if pk in self.menu_items else self._reload()
+        menu_item = registry.menu_items.get(pk, {'name': None, 'price': None, 'category_id': None})
+        return {**menu_item, 'category_name': registry.name('category', menu_item['category_id'])}
+
+    def ids_named(self, dimension: str, name: str) -> List[int]:
+        """名称が一致するIDの一覧"""
+        return [pk for pk, value in self.names[dimension].items() if value == name]
+
+    def sort_key(self, dimension: str, name: Optional[str]) -> int:
+        """名称の並び順(名称でのORDER BYに合わせるためのキー)"""
+        order = self.name_order[dimension]
+        return order.get(name, len(order))
+
+    @staticmethod
+    def merge(
+        rows: Iterable[Dict[str, Any]],
+        labels: Callable[[Dict[str, Any]], Dict[str, Any]],
+        totals: Sequence[str]
+    ) -> List[Dict[str, Any]]:
+        """
+        IDごとに集計した行を名称ごとにまとめる(SQLの名称でのGROUP BYと同じ結果になる)
+
+        Args:
+            rows (Iterable[Dict[str, Any]]): IDごとの集計結果の行
+            labels (Callable): 行から名称の列の辞書を作る関数
+            totals (Sequence[str]): 合計する列
+
+        Returns:
+            List[Dict[str, Any]]: 名称の列と合計の列からなる行(最初に現れた順)
+        """
+        merged: Dict[tuple, Dict[str, Any]] = {}
+        for row in rows:
+            label = labels(row)
+            key = tuple(label.values())
+            entry = merged.get(key)
+            if entry is None:
+                entry = merged[key] = {**label, **{field: 0 for field in totals}}
+            for field in totals:
+                entry[field] += row[field] or 0
+        return list(merged.values())
+
+    def menu_item_labels(self, pk: int) -> Dict[str, Any]:
+        """メニューアイテムの集計結果に付ける名称の列(名称でのGROUP BYと同じ列名)"""
+        menu_item = self.menu_item(pk)
+        return {
+            'menu_item__category__name': menu_item['category_name'],
+            'menu_item__name': menu_item['name'],
+            'menu_item__price': menu_item['price'],
+        }
@@ -0,0 +1,127 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from cafe_analytics.metrics import collect_queries, current_collector
+
+EXECUTION_SERIAL = 'serial'
+EXECUTION_CONCURRENT = 'concurrent'
+
+_state = threading.local()
+_executor: Optional[ThreadPoolExecutor] = None
+_db_slots: Optional[threading.BoundedSemaphore] = None
+_init_lock = threading.Lock()
+
+
+def is_concurrent() -> bool:
+    return getattr(settings, 'DASHBOARD_EXECUTION_MODE', EXECUTION_SERIAL) == EXECUTION_CONCURRENT
+
+
+def _get_pool() -> Tuple[ThreadPoolExecutor, threading.BoundedSemaphore]:
+    """
+    プロセス全体で共有するスレッドプールと、DB接続を使うワーカー数の上限を返す
+    ワーカーはスレッドごとに1つのDB接続を使う
+    """
+    global _executor, _db_slots
+    with _init_lock:
+        if _executor is None:
+            max_workers = getattr(settings, 'DASHBOARD_MAX_DB_WORKERS', 8)
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='dashboard-query')
+            _db_slots = threading.BoundedSemaphore(max_workers)
+    return _executor, _db_slots
+
+
+@contextmanager
+def section_timings():
+    """ブロック内で計測した処理ごとの時間(秒)を収集する"""
+    previous = getattr(_state, 'timings', None)
+    timings: List[Tuple[str, float]] = []
+    _state.timings = timings
+    try:
+        yield timings
+    finally:
+        _state.timings = previous
+
+
+def _record(timings: Optional[List[Tuple[str, float]]], name: str, started: float) -> None:
+    if timings is not None:
+        timings.append((name, time.perf_counter() - started))
+
+
+@contextmanager
+def timed(name: str):
+    """処理時間を計測し、section_timings()の収集先に記録する"""
+    timings = getattr(_state, 'timings', None)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(timings, name, started)
+
+
+def _run_serial(queries: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+    """各クエリを呼び出し元のスレッドで順に実行し、クエリごとの時間を記録する"""
+    results = {}
+    for name, func in queries.items():
+        with timed(name):
+            results[name] = func()
+    return results
+
+
+def run_queries(queries: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+    """
+    互いに独立したクエリを実行する
+    concurrentモードではスレッドプールで同時に実行し、それ以外は順に実行する
+
+    1リクエストが使うワーカー数はDASHBOARD_QUERY_WORKERS、プロセス全体ではDASHBOARD_MAX_DB_WORKERSが上限
+    空きが無い場合は待たずに呼び出し元のスレッドで実行するため、接続プールを使い切ることはない
+
+    Args:
+        queries (Dict[str, Callable[[], Any]]): 名前とクエリを実行する関数
+
+    Returns:
+        Dict[str, Any]: 名前ごとの実行結果
+    """
+    if not is_concurrent() or len(queries) < 2:
+        return _run_serial(queries)
+
+    executor, db_slots = _get_pool()
+    timings = getattr(_state, 'timings', None)
+    collector = current_collector()
+    per_request = getattr(settings, 'DASHBOARD_QUERY_WORKERS', 2)
+
+    def run_in_worker(name, func):
+        started = time.perf_counter()
+        close_old_connections()
+        try:
+            # ワーカーで実行したクエリも呼び出し元のリクエストの計測に含める
+            with collect_queries(collector):
+                return func()
+        finally:
+            # リクエストの終了時と同じく、CONN_MAX_AGEを超えた接続を閉じる
+            close_old_connections()
+            db_slots.release()
+            _record(timings, name, started)
+
+    futures = {}
+    inline = {}
+    for name, func in queries.items():
+        if len(futures) < per_request and db_slots.acquire(blocking=False):
+            futures[name] = executor.submit(run_in_worker, name, func)
+        else:
+            inline[name] = func
+
+    results = _run_serial(inline)
+    for name, future in futures.items():
+        results[name] = future.result()
+    return {name: results[name] for name in queries}
+
+
+def format_server_timing(timings: List[Tuple[str, float]]) -> str:
+    """計測結果をServer-Timingヘッダーの形式(ミリ秒)に変換する"""
+    return ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings)
@@ -0,0 +1,196 @@
+import csv
+import json
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+from datetime import date, datetime
+
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.utils.encoders import JSONEncoder
+
+from cafe_analytics.models import OrderItem
+from cafe_analytics.pagination import keyset_page
+from . import BaseService
+from .order_service import OrderService
+from .product_service import ProductService
+from .sales_service import SalesService
+
+FORMAT_CSV = 'csv'
+FORMAT_JSONL = 'jsonl'
+EXPORT_FORMATS = (FORMAT_CSV, FORMAT_JSONL)
+
+CONTENT_TYPES = {
+    FORMAT_CSV: 'text/csv; charset=utf-8',
+    FORMAT_JSONL: 'application/x-ndjson; charset=utf-8',
+}
+
+ORDER_EXPORT_FIELDS = (
+    'id', 'timestamp', 'gender__name', 'order_type__name', 'weather__name', 'time_slot__name',
+    'total_price', 'discount',
+)
+ORDER_ITEM_EXPORT_FIELDS = (
+    'id', 'order_id', 'order__timestamp', 'menu_item_id', 'menu_item__name',
+    'menu_item__category__name', 'menu_item__price', 'price',
+)
+# 行がない期間でもCSVのヘッダーを出力できるよう、列が決まっているデータの列
+EXPORT_COLUMNS = {
+    'orders': ORDER_EXPORT_FIELDS,
+    'order_items': ORDER_ITEM_EXPORT_FIELDS,
+}
+
+_timestamp_field = serializers.DateTimeField()
+
+
+class _Echo:
+    """csv.writerの出力をバッファせずにそのまま返すための書き込み先"""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def _to_text(value: Any) -> Any:
+    """CSVとJSON Linesに書き出す値に変換する(日時はAPIと同じ形式)"""
+    if isinstance(value, datetime):
+        return _timestamp_field.to_representation(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return ' / '.join(str(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, cls=JSONEncoder, ensure_ascii=False)
+    return value
+
+
+def iter_csv(rows: Iterable[Dict[str, Any]], columns: Optional[Sequence[str]] = None) -> Iterator[str]:
+    """
+    辞書の行をCSVの行として1行ずつ返す
+    columnsを指定した場合は行がなくてもBOMとヘッダーを先に返し、省略した場合は1行目の列をヘッダーにする
+    """
+    writer = csv.writer(_Echo())
+    # Excelで文字化けしないようにBOMを付ける
+    if columns is not None:
+        columns = list(columns)
+        yield '\ufeff' + writer.writerow(columns)
+    for row in rows:
+        if columns is None:
+            columns = list(row)
+            yield '\ufeff' + writer.writerow(columns)
+        yield writer.writerow([_to_text(row.get(column)) for column in columns])
+
+
+def iter_jsonl(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """辞書の行をJSON Linesとして1行ずつ返す"""
+    for row in rows:
+        yield json.dumps({key: _to_text(value) for key, value in row.items()}, cls=JSONEncoder, ensure_ascii=False) + '\n'
+
+
+class ExportService(BaseService):
+    """
+    注文・注文アイテムと各集計結果をCSVまたはJSON Linesで1行ずつ書き出す
+    注文と注文アイテムはキーセットで一定件数ずつ読み込むため、期間が長くてもメモリ使用量は一定
+    """
+
+    @staticmethod
+    def get_chunk_size() -> int:
+        return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+    @classmethod
+    def iter_orders(
+        cls,
+        start_date: Optional[Union[str, date]] = None,
+        end_date: Optional[Union[str, date]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """期間内の注文を (timestamp, id) の順に一定件数ずつ読み込んで返す"""
+        queryset = OrderService.get_order_rows(start_date, end_date).values(*ORDER_EXPORT_FIELDS)
+        position = None
+        while True:
+            rows, has_next = keyset_page(queryset, position, cls.get_chunk_size())
+            yield from rows
+            if not has_next:
+                return
+            position = (rows[-1]['timestamp'], rows[-1]['id'])
+
+    @classmethod
+    def iter_order_items(
+        cls,
+        start_date: Optional[Union[str, date]] = None,
+        end_date: Optional[Union[str, date]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """期間内の注文アイテムをIDの順に一定件数ずつ読み込んで返す"""
+        queryset = OrderItem.objects.filter(
+            **cls.timestamp_range_filter(start_date, end_date, field='order__timestamp')
+        ).values(*ORDER_ITEM_EXPORT_FIELDS).order_by('id')
+        chunk_size = cls.get_chunk_size()
+        last_id = None
+        while True:
+            page = queryset if last_id is None else queryset.filter(id__gt=last_id)
+            rows = list(page[:chunk_size])
+            yield from rows
+            if len(rows) < chunk_size:
+                return
+            last_id = rows[-1]['id']
+
+    @staticmethod
+    def _flatten_timeslot_ranking(ranking: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """時間帯ごとのランキングを、時間帯の列を持つ行に展開する"""
+        return [
+            {'time_slot': time_slot, 'rank': rank, **item}
+            for time_slot, items in ranking.items()
+            for rank, item in enumerate(items, start=1)
+        ]
+
+    @classmethod
+    def get_datasets(cls) -> Dict[str, Callable[[Any, Any], Iterable[Dict[str, Any]]]]:
+        """書き出せるデータの名前と、期間を受け取って行を返す関数の対応"""
+        return {
+            'orders': cls.iter_orders,
+            'order_items': cls.iter_order_items,
+            'sales_summary': lambda start, end: [SalesService.get_sales_summary(start, end)],
+            'daily_sales': lambda start, end: SalesService.get_period_sales('daily', start, end),
+            'weekly_sales': lambda start, end: SalesService.get_period_sales('weekly', start, end),
+            'monthly_sales': lambda start, end: SalesService.get_period_sales('monthly', start, end),
+            'category_sales': lambda start, end: SalesService.get_top_categories(None, start, end),
+            'sales_by_weather': lambda start, end: SalesService.get_sales_by_factor('weather', 'weather__name', start, end),
+            'sales_by_gender': lambda start, end: SalesService.get_sales_by_factor('gender', 'gender__name', start, end),
+            'sales_by_time_slot': lambda start, end: SalesService.get_sales_by_factor('time_slot', 'time_slot__name', start, end),
+            'sales_by_order_type': lambda start, end: SalesService.get_sales_by_factor('order_type', 'order_type__name', start, end),
+            'weather_timeslot_analysis': SalesService.get_weather_timeslot_analysis,
+            'bestsellers': lambda start, end: ProductService.get_bestsellers(None, start, end),
+            'discount_analysis': ProductService.get_discount_analysis,
+            'dine_in_popular': lambda start, end: ProductService.get_popular_items_by_type(1, None, start, end),
+            'takeout_popular': lambda start, end: ProductService.get_popular_items_by_type(2, None, start, end),
+            'dine_in_popular_items': lambda start, end: cls._flatten_timeslot_ranking(
+                ProductService.get_dine_in_popular_by_timeslot(start, end)
+            ),
+            'combo_analysis': lambda start, end: ProductService.get_combo_analysis(2, None, start, end),
+        }
+
+    @classmethod
+    def iter_export(
+        cls,
+        dataset: str,
+        export_format: str = FORMAT_CSV,
+        start_date: Optional[Union[str, date]] = None,
+        end_date: Optional[Union[str, date]] = None,
+        columns: Optional[Sequence[str]] = None
+    ) -> Iterator[str]:
+        """
+        指定したデータを書き出す行を1行ずつ返す
+
+        Args:
+            dataset (str): get_datasets()のキー
+            export_format (str, optional): 'csv'または'jsonl'. Defaults to 'csv'.
+            start_date (str or date, optional): 開始日. Defaults to None.
+            end_date (str or date, optional): 終了日. Defaults to None.
+            columns (Sequence[str], optional): CSVのヘッダーにする列. Defaults to None (1行目の列).
+
+        Returns:
+            Iterator[str]: 書き出す行
+        """
+        datasets = cls.get_datasets()
+        if dataset not in datasets:
+            raise ValueError(f"Unknown dataset: {dataset}")
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Invalid format: {export_format}")
+
+        rows = datasets[dataset](start_date, end_date)
+        return iter_csv(rows, columns) if export_format == FORMAT_CSV else iter_jsonl(rows)
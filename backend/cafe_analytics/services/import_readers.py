@@ -0,0 +1,141 @@
+import csv
+import json
+import re
+from itertools import islice
+from typing import Any, Dict, IO, Iterable, Iterator, List
+
+READ_CHUNK_SIZE = 64 * 1024
+
+JSON_LINES_EXTENSIONS = ('.jsonl', '.ndjson')
+CSV_EXTENSIONS = ('.csv',)
+XLSX_EXTENSIONS = ('.xlsx', '.xlsm')
+
+
+def iter_json_array(fp: IO[str], chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Any]:
+    """
+    JSON配列の要素をファイル全体を読み込まずに1件ずつ返す
+
+    Args:
+        fp (IO[str]): JSON配列を含むファイル
+        chunk_size (int, optional): 1回に読み込む文字数. Defaults to READ_CHUNK_SIZE.
+
+    Yields:
+        Any: 配列の要素
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    started = False
+
+    def fill() -> bool:
+        nonlocal buffer, pos, eof
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    while True:
+        # 空白と区切りのカンマを読み飛ばす
+        while True:
+            while pos < len(buffer) and (buffer[pos].isspace() or (started and buffer[pos] == ',')):
+                pos += 1
+            if pos < len(buffer) or not fill():
+                break
+
+        if pos >= len(buffer):
+            if started:
+                raise json.JSONDecodeError('Unterminated array', buffer, pos)
+            return
+
+        if not started:
+            if buffer[pos] != '[':
+                raise json.JSONDecodeError('Expecting JSON array', buffer, pos)
+            started = True
+            pos += 1
+            continue
+
+        if buffer[pos] == ']':
+            return
+
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                break
+            except json.JSONDecodeError:
+                if eof or not fill():
+                    raise
+        pos = end
+        yield value
+
+
+def iter_json_lines(fp: IO[str]) -> Iterator[Any]:
+    """JSON Lines形式のファイルから1行ずつ値を返す"""
+    for line_number, line in enumerate(fp, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise json.JSONDecodeError(f'line {line_number}: {e.msg}', e.doc, e.pos) from e
+
+
+def iter_csv_records(path: str) -> Iterator[Dict[str, Any]]:
+    """CSVファイルからヘッダーをキーとした辞書を1行ずつ返す"""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        yield from csv.DictReader(f)
+
+
+def open_workbook(path: str):
+    """XLSXファイルを行ストリーミング(読み取り専用)モードで開く"""
+    try:
+        import openpyxl
+    except ImportError as e:
+        raise ImportError('XLSX import requires openpyxl (pip install openpyxl)') from e
+    return openpyxl.load_workbook(path, read_only=True, data_only=True)
+
+
+def iter_sheet_records(worksheet) -> Iterator[Dict[str, Any]]:
+    """ワークシートの1行目をヘッダーとして、辞書を1行ずつ返す"""
+    rows = worksheet.iter_rows(values_only=True)
+    header = next(rows, None)
+    if not header:
+        return
+    columns = [str(column).strip() if column is not None else '' for column in header]
+    for row in rows:
+        if row is None or all(value is None for value in row):
+            continue
+        yield dict(zip(columns, row))
+
+
+def sheet_key(title: str) -> str:
+    """シート名を比較用のキーに変換する (例: 'Order Items' -> 'order_items')"""
+    return re.sub(r'[^0-9a-z]+', '_', title.strip().lower()).strip('_')
+
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """ファイルの拡張子に応じてレコードを1件ずつ読み込む"""
+    if path.lower().endswith(CSV_EXTENSIONS):
+        yield from iter_csv_records(path)
+        return
+
+    with open(path, encoding='utf-8') as f:
+        if path.lower().endswith(JSON_LINES_EXTENSIONS):
+            yield from iter_json_lines(f)
+        else:
+            yield from iter_json_array(f)
+
+
+def batched(iterable: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """iterableをsize件ずつのリストに分割する"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
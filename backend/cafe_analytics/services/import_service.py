@@ -0,0 +1,754 @@
+import glob
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import time
+from datetime import date, datetime, timezone as dt_timezone
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from cafe_analytics.models import (
+    Category, Gender, OrderType, WeatherType, TimeSlot,
+    MenuItem, Order, OrderItem,
+)
+from . import BaseService
+from .import_readers import (
+    batched, iter_records, iter_sheet_records, open_workbook, sheet_key,
+    CSV_EXTENSIONS, JSON_LINES_EXTENSIONS, XLSX_EXTENSIONS,
+)
+from .cache_service import DashboardCache
+from .rollup_service import RollupService, to_local_date
+from .dimensions import DimensionRegistry
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 競合(既存ID)時の動作
+CONFLICT_IGNORE = 'ignore'
+CONFLICT_UPDATE = 'update'
+CONFLICT_ERROR = 'error'
+CONFLICT_UPSERT = 'upsert'
+CONFLICT_CHOICES = (CONFLICT_IGNORE, CONFLICT_UPDATE, CONFLICT_ERROR, CONFLICT_UPSERT)
+
+MAX_REPORTED_ERRORS = 20
+
+# マスターデータのキーとモデル・更新対象フィールドの対応
+MASTER_TABLES = (
+    ('categories', Category, ('name',)),
+    ('genders', Gender, ('name',)),
+    ('order_types', OrderType, ('name',)),
+    ('weather_types', WeatherType, ('name',)),
+    ('time_slots', TimeSlot, ('name',)),
+    ('menu_items', MenuItem, ('name', 'price', 'category_id')),
+)
+
+# 非正規化された名称カラムからマスターデータを導出するための対応
+# (IDカラム, モデル, 名称カラムの候補)
+DIMENSION_COLUMNS = (
+    ('gender_id', Gender, ('gender_name', 'gender')),
+    ('order_type_id', OrderType, ('order_type_name', 'order_type')),
+    ('weather_id', WeatherType, ('weather_name', 'weather')),
+    ('time_slot_id', TimeSlot, ('time_slot_name', 'time_slot')),
+)
+
+# カテゴリー別のメニューシート名とカテゴリー名の対応
+MENU_SHEET_CATEGORIES = {
+    'drinks': 'ドリンク',
+    'sandwiches': 'サンドイッチ',
+    'cakes': 'ケーキ',
+}
+
+# ファイルの種類
+SOURCE_MASTER = 'master'
+SOURCE_ORDERS = 'orders'
+SOURCE_ORDER_ITEMS = 'order_items'
+SOURCE_WORKBOOK = 'workbook'
+
+SOURCE_EXTENSIONS = ('.json',) + JSON_LINES_EXTENSIONS + CSV_EXTENSIONS + XLSX_EXTENSIONS
+
+ORDER_FIELDS = ('timestamp', 'gender_id', 'order_type_id', 'weather_id', 'time_slot_id', 'total_price', 'discount')
+ORDER_ITEM_FIELDS = ('order_id', 'menu_item_id', 'price')
+
+
+class ImportStats:
+    """インポート処理の件数と処理速度を保持"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.read = 0
+        self.written = 0
+        self.invalid = 0
+        # ignoreモードで既存IDのため登録しなかった行数
+        self.skipped = 0
+        # upsertモードでの内訳
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.errors: List[str] = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.parse_elapsed = 0.0
+
+    def add_error(self, message: str) -> None:
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+    def finish(self) -> 'ImportStats':
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def start_writing(self) -> 'ImportStats':
+        """ワーカーでの解析時間を記録し、書き込みの計測を開始する"""
+        self.parse_elapsed = self.elapsed
+        self.elapsed = 0.0
+        self.started = time.perf_counter()
+        return self
+
+    @property
+    def rows_per_sec(self) -> float:
+        elapsed = self.elapsed or (time.perf_counter() - self.started)
+        return self.read / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        summary = (
+            f"{self.label}: read {self.read}, written {self.written}, invalid {self.invalid} "
+            f"in {self.elapsed:.2f}s ({self.rows_per_sec:,.0f} rows/s)"
+        )
+        if self.skipped:
+            summary += f" [skipped {self.skipped} existing]"
+        if self.inserted or self.updated or self.unchanged:
+            summary += f" [inserted {self.inserted}, updated {self.updated}, unchanged {self.unchanged}]"
+        if self.parse_elapsed:
+            summary += f", parsed in {self.parse_elapsed:.2f}s"
+        return summary
+
+
+def parse_timestamp(value: Any) -> datetime:
+    """注文日時を解析し、タイムゾーン付きのdatetimeに変換する"""
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = datetime.strptime(str(value).strip(), TIMESTAMP_FORMAT)
+    if settings.USE_TZ and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_non_negative_int(value: Any, field: str) -> int:
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be an integer: {value!r}")
+    if number < 0:
+        raise ValueError(f"{field} must not be negative: {number}")
+    return number
+
+
+def blank_to_none(value: Any) -> Any:
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    return value
+
+
+def detect_source_kind(path: str) -> str:
+    """ファイル名と拡張子からインポートするデータの種類を判定する"""
+    name = os.path.basename(path).lower()
+    if name.endswith(XLSX_EXTENSIONS):
+        return SOURCE_WORKBOOK
+    if 'master' in name:
+        return SOURCE_MASTER
+    if 'item' in name:
+        return SOURCE_ORDER_ITEMS
+    if name.endswith(CSV_EXTENSIONS):
+        # CSVはヘッダーにmenu_item_idがあれば注文アイテムとみなす
+        with open(path, encoding='utf-8-sig') as f:
+            header = f.readline()
+        return SOURCE_ORDER_ITEMS if 'menu_item_id' in header else SOURCE_ORDERS
+    return SOURCE_ORDERS
+
+
+def parse_id(value: Any, field: str) -> str:
+    text = '' if value is None else str(value).strip()
+    if not text:
+        raise ValueError(f"{field} is required")
+    return text
+
+
+def compute_row_hash(obj: Any, fields: Iterable[str]) -> str:
+    """取り込む行の内容からハッシュを計算する(再インポート時の変更検出用)"""
+    values = []
+    for field in fields:
+        value = getattr(obj, field)
+        if isinstance(value, datetime) and timezone.is_aware(value):
+            value = value.astimezone(dt_timezone.utc)
+        values.append('' if value is None else str(value))
+    return hashlib.sha1('\x1f'.join(values).encode('utf-8')).hexdigest()
+
+
+def expand_sources(patterns: Iterable[str]) -> List[str]:
+    """ディレクトリやglobパターンを取り込み対象のファイル一覧に展開する"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.extend(
+                os.path.join(pattern, name) for name in sorted(os.listdir(pattern))
+                if name.lower().endswith(SOURCE_EXTENSIONS) and os.path.isfile(os.path.join(pattern, name))
+            )
+        elif glob.has_magic(pattern):
+            paths.extend(sorted(glob.glob(pattern)))
+        else:
+            paths.append(pattern)
+    # 同じファイルが複数のパターンに一致しても1回だけ取り込む
+    return list(dict.fromkeys(paths))
+
+
+def validate_rows(rows: Iterable[Dict[str, Any]], validate: Callable[[Dict[str, Any]], Any], stats: ImportStats) -> List[Any]:
+    """各行を検証・変換し、不正な行はエラーとして記録する"""
+    objects = []
+    for row in rows:
+        stats.read += 1
+        try:
+            objects.append(validate(row))
+        except (ValueError, TypeError, AttributeError) as e:
+            row_id = row.get('id') if isinstance(row, dict) else None
+            stats.add_error(f"{row_id or f'row {stats.read}'}: {e}")
+    return objects
+
+
+def parse_order_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    注文の1行を型変換する(DBを参照しないためワーカープロセスで実行できる)
+    性別・注文タイプ・天気・時間帯は、IDと名称カラムの先頭のキーに正規化する
+    """
+    values = {
+        'id': parse_id(row.get('id'), 'id'),
+        'timestamp': parse_timestamp(row.get('timestamp')),
+        'total_price': parse_non_negative_int(row.get('total_price'), 'total_price'),
+        'discount': parse_non_negative_int(row.get('discount', 0), 'discount'),
+    }
+    for field, _, name_columns in DIMENSION_COLUMNS:
+        value = blank_to_none(row.get(field))
+        values[field] = None if value is None else parse_non_negative_int(value, field)
+        name = next(
+            (str(row[column]).strip() for column in name_columns if blank_to_none(row.get(column)) is not None),
+            None,
+        )
+        if name is not None:
+            values[name_columns[0]] = name
+    return values
+
+
+def parse_order_item_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """注文アイテムの1行を型変換する(DBを参照しない)"""
+    return {
+        'id': parse_id(row.get('id'), 'id'),
+        'order_id': parse_id(row.get('order_id'), 'order_id'),
+        'menu_item_id': parse_non_negative_int(row.get('menu_item_id'), 'menu_item_id'),
+        'price': parse_non_negative_int(row.get('price'), 'price'),
+    }
+
+
+def read_workbook_master_data(sheets: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    ワークブックのマスターデータとカテゴリー別メニューのシートを読み込む
+    メニューのカテゴリーはシート名から決まるため、category_nameとして保持する
+    """
+    # マスターデータのシートは小さいため全件読み込む
+    master_data = {
+        key: list(iter_sheet_records(sheets[key]))
+        for key, _, _ in MASTER_TABLES if key in sheets
+    }
+    menu_items = master_data.setdefault('menu_items', [])
+    for key, worksheet in sheets.items():
+        if key in master_data or key in (SOURCE_ORDERS, SOURCE_ORDER_ITEMS):
+            continue
+        category_name = MENU_SHEET_CATEGORIES.get(key, worksheet.title)
+        menu_items.extend(
+            dict(row, category_name=category_name)
+            for row in iter_sheet_records(worksheet)
+            if blank_to_none(row.get('id')) is not None and 'price' in row
+        )
+    return master_data
+
+
+class ParsedSource:
+    """
+    ワーカープロセスで解析したファイルの内容(DBへの書き込み前)
+    解析した行はバッチごとに一時ファイルへ書き出し、書き込み時に1バッチずつ読み込む
+    """
+
+    def __init__(self, path: str, kind: str):
+        self.path = path
+        self.kind = kind
+        self.master_data: Dict[str, List[Dict[str, Any]]] = {}
+        self.order_stats: Optional[ImportStats] = None
+        self.order_item_stats: Optional[ImportStats] = None
+        self.spool_path: Optional[str] = None
+        self.parse_elapsed = 0.0
+
+    @property
+    def rows(self) -> int:
+        return sum(stats.read for stats in (self.order_stats, self.order_item_stats) if stats)
+
+    def iter_batches(self) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        """解析した行を (SOURCE_ORDERSまたはSOURCE_ORDER_ITEMS, 行のリスト) として1バッチずつ返す"""
+        if self.spool_path is None:
+            return
+        with open(self.spool_path, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    def close(self) -> None:
+        """一時ファイルを削除する"""
+        if self.spool_path is not None:
+            Path(self.spool_path).unlink(missing_ok=True)
+            self.spool_path = None
+
+
+def parse_source_file(path: str, kind: Optional[str] = None, batch_size: int = 1000) -> ParsedSource:
+    """
+    ファイルを読み込み、各行を型変換・検証する
+    DBにはアクセスしないため、ProcessPoolExecutorのワーカーで並列に実行できる
+    解析した行はbatch_size件ずつ一時ファイルに書き出すため、ファイル全体をメモリに保持しない
+
+    Args:
+        path (str): 取り込むファイルのパス
+        kind (Optional[str], optional): データの種類. Defaults to None (ファイル名から判定).
+        batch_size (int, optional): 一時ファイルに書き出す行数. Defaults to 1000.
+
+    Returns:
+        ParsedSource: 解析結果と行ごとのエラー (使用後にclose()で一時ファイルを削除する)
+    """
+    started = time.perf_counter()
+    kind = kind or detect_source_kind(path)
+    parsed = ParsedSource(path, kind)
+    label = os.path.basename(path)
+    spool = None
+
+    def parse_rows(section, rows, parse, stats):
+        nonlocal spool
+        if spool is None:
+            spool = tempfile.NamedTemporaryFile('wb', prefix='import-', suffix='.parsed', delete=False)
+            parsed.spool_path = spool.name
+        for batch in batched(rows, batch_size):
+            pickle.dump((section, validate_rows(batch, parse, stats)), spool, protocol=pickle.HIGHEST_PROTOCOL)
+        stats.finish()
+
+    def parse_orders(rows, stats_label):
+        parsed.order_stats = ImportStats(stats_label)
+        parse_rows(SOURCE_ORDERS, rows, parse_order_row, parsed.order_stats)
+
+    def parse_order_items(rows, stats_label):
+        parsed.order_item_stats = ImportStats(stats_label)
+        parse_rows(SOURCE_ORDER_ITEMS, rows, parse_order_item_row, parsed.order_item_stats)
+
+    try:
+        if kind == SOURCE_MASTER:
+            with open(path, encoding='utf-8') as f:
+                parsed.master_data = json.load(f)
+        elif kind == SOURCE_WORKBOOK:
+            workbook = open_workbook(path)
+            try:
+                sheets = {sheet_key(worksheet.title): worksheet for worksheet in workbook.worksheets}
+                parsed.master_data = read_workbook_master_data(sheets)
+                if SOURCE_ORDERS in sheets:
+                    parse_orders(iter_sheet_records(sheets[SOURCE_ORDERS]), f'{label}:{sheets[SOURCE_ORDERS].title}')
+                if SOURCE_ORDER_ITEMS in sheets:
+                    parse_order_items(
+                        iter_sheet_records(sheets[SOURCE_ORDER_ITEMS]), f'{label}:{sheets[SOURCE_ORDER_ITEMS].title}'
+                    )
+            finally:
+                workbook.close()
+        elif kind == SOURCE_ORDER_ITEMS:
+            parse_order_items(iter_records(path), label)
+        else:
+            parse_orders(iter_records(path), label)
+    except BaseException:
+        if spool is not None:
+            spool.close()
+        parsed.close()
+        raise
+    if spool is not None:
+        spool.close()
+
+    parsed.parse_elapsed = time.perf_counter() - started
+    return parsed
+
+
+class BulkImporter(BaseService):
+    """
+    注文データをバッチ単位で検証し、bulk_createで一括登録する
+    バッチごとにコミットし、ロールアップは登録された日付のみ最後に集計し直す
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 1000,
+        on_conflict: str = CONFLICT_IGNORE,
+        progress: Optional[Callable[[ImportStats], None]] = None,
+    ):
+        if on_conflict not in CONFLICT_CHOICES:
+            raise ValueError(f"Invalid conflict mode: {on_conflict}")
+        self.batch_size = batch_size
+        self.on_conflict = on_conflict
+        self.progress = progress
+        self.dirty_dates: Set[date] = set()
+        # 既存のマスターの名称等が変わったか(変わった場合は全期間のデータバージョンを上げる)
+        self.dimensions_changed = False
+        self._master_ids: Optional[Dict[str, Set[int]]] = None
+        self._dimension_names: Optional[Dict[str, Dict[str, int]]] = None
+
+    def _bulk_options(self, update_fields: Iterable[str]) -> Dict[str, Any]:
+        """競合時の動作に応じたbulk_createの引数を返す"""
+        if self.on_conflict == CONFLICT_IGNORE:
+            return {'ignore_conflicts': True}
+        if self.on_conflict in (CONFLICT_UPDATE, CONFLICT_UPSERT):
+            options = {'update_conflicts': True, 'update_fields': list(update_fields)}
+            # MySQLはON DUPLICATE KEY UPDATEのため対象カラムを指定できない
+            if connection.features.supports_update_conflicts_with_target:
+                options['unique_fields'] = ['id']
+            return options
+        return {}
+
+    def import_master_data(self, master_data: Dict[str, List[Dict[str, Any]]]) -> Dict[str, int]:
+        """マスターデータを一括登録する"""
+        counts = {}
+        before = DimensionRegistry.get()
+        with transaction.atomic():
+            for key, model, fields in MASTER_TABLES:
+                rows = master_data.get(key, [])
+                if key == 'menu_items':
+                    rows = self._resolve_categories(rows)
+                model.objects.bulk_create(
+                    [model(id=row['id'], **{field: row[field] for field in fields}) for row in rows],
+                    batch_size=self.batch_size,
+                    **self._bulk_options(fields),
+                )
+                counts[key] = len(rows)
+        self._master_ids = None
+        # bulk_createはシグナルを送らないため、名称のレジストリをここで破棄する
+        DimensionRegistry.invalidate()
+        after = DimensionRegistry.get()
+        if any(
+            after.names[dimension].get(pk) != name
+            for dimension, names in before.names.items()
+            for pk, name in names.items()
+        ) or any(after.menu_items.get(pk) != menu_item for pk, menu_item in before.menu_items.items()):
+            self.dimensions_changed = True
+        return counts
+
+    @staticmethod
+    def _resolve_categories(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """category_idの代わりにcategory_nameを持つメニューのカテゴリーIDを解決する"""
+        category_ids = {}
+        resolved = []
+        for row in rows:
+            if 'category_id' not in row and 'category_name' in row:
+                name = row['category_name']
+                if name not in category_ids:
+                    category_ids[name] = Category.objects.get_or_create(name=name)[0].pk
+                row = dict(row, category_id=category_ids[name])
+            resolved.append(row)
+        return resolved
+
+    @property
+    def master_ids(self) -> Dict[str, Set[int]]:
+        """外部キーの検証用にマスターデータのIDを保持"""
+        if self._master_ids is None:
+            self._master_ids = {
+                'gender_id': set(Gender.objects.values_list('id', flat=True)),
+                'order_type_id': set(OrderType.objects.values_list('id', flat=True)),
+                'weather_id': set(WeatherType.objects.values_list('id', flat=True)),
+                'time_slot_id': set(TimeSlot.objects.values_list('id', flat=True)),
+                'menu_item_id': set(MenuItem.objects.values_list('id', flat=True)),
+            }
+        return self._master_ids
+
+    @property
+    def dimension_names(self) -> Dict[str, Dict[str, int]]:
+        """名称からIDを引くためのマスターデータのキャッシュ"""
+        if self._dimension_names is None:
+            self._dimension_names = {
+                field: {name: pk for pk, name in model.objects.values_list('id', 'name')}
+                for field, model, _ in DIMENSION_COLUMNS
+            }
+        return self._dimension_names
+
+    def resolve_dimensions(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        名称カラム(gender_name等)から性別・注文タイプ・天気・時間帯のIDを解決する
+        未登録の値はマスターデータとして登録し、以降はキャッシュから引く
+        """
+        for field, model, name_columns in DIMENSION_COLUMNS:
+            name = next(
+                (str(row[column]).strip() for column in name_columns if blank_to_none(row.get(column)) is not None),
+                None,
+            )
+            if name is None:
+                continue
+
+            names = self.dimension_names[field]
+            value = blank_to_none(row.get(field))
+            if value is None:
+                value = names.get(name)
+                if value is None:
+                    value = model.objects.create(name=name).pk
+            else:
+                value = parse_non_negative_int(value, field)
+                if value not in self.master_ids[field]:
+                    model.objects.get_or_create(id=value, defaults={'name': name})
+
+            names.setdefault(name, value)
+            self.master_ids[field].add(value)
+            row[field] = value
+        return row
+
+    def build_order(self, values: Dict[str, Any]) -> Order:
+        """型変換済みの注文のマスターデータを解決・検証し、Orderインスタンスに変換する"""
+        self.resolve_dimensions(values)
+        for field, _, _ in DIMENSION_COLUMNS:
+            value = parse_non_negative_int(values.get(field), field)
+            if value not in self.master_ids[field]:
+                raise ValueError(f"unknown {field}: {value}")
+            values[field] = value
+        order = Order(**{field: values[field] for field in ('id',) + ORDER_FIELDS})
+        order.row_hash = compute_row_hash(order, ORDER_FIELDS)
+        return order
+
+    def build_order_item(self, values: Dict[str, Any]) -> OrderItem:
+        """型変換済みの注文アイテムのメニューを検証し、OrderItemインスタンスに変換する"""
+        if values['menu_item_id'] not in self.master_ids['menu_item_id']:
+            raise ValueError(f"unknown menu_item_id: {values['menu_item_id']}")
+        item = OrderItem(**values)
+        item.row_hash = compute_row_hash(item, ORDER_ITEM_FIELDS)
+        return item
+
+    def validate_order(self, row: Dict[str, Any]) -> Order:
+        """注文の1行を検証し、Orderインスタンスに変換する"""
+        return self.build_order(parse_order_row(row))
+
+    def validate_order_item(self, row: Dict[str, Any]) -> OrderItem:
+        """注文アイテムの1行を検証し、OrderItemインスタンスに変換する"""
+        return self.build_order_item(parse_order_item_row(row))
+
+    def upsert(self, model, objects: List[Any], fields: Iterable[str], date_field: str, stats: ImportStats) -> List[Any]:
+        """
+        既存行の値をバッチごとに1回のクエリで取得してハッシュを比較し、
+        新規の行は一括登録、内容が変わった行だけを一括更新する
+        保存済みのrow_hashは取込以外(マイグレーション前の行・ORMや管理画面での変更)では空または古いため、
+        既存行のハッシュは現在の値から計算する
+
+        Args:
+            model: 登録先のモデル (OrderまたはOrderItem)
+            objects (List[Any]): 検証済みのインスタンス
+            fields (Iterable[str]): ハッシュの対象かつ更新するフィールド
+            date_field (str): 更新前の行の注文日時を参照するフィールド
+            stats (ImportStats): 件数を記録するインポート結果
+
+        Returns:
+            List[Any]: 登録または更新したインスタンス
+        """
+        fields = list(fields)
+        # 同じIDが複数回含まれる場合は後の行を採用する
+        objects = list({obj.pk: obj for obj in objects}.values())
+        existing = {
+            pk: (compute_row_hash(SimpleNamespace(**dict(zip(fields, values))), fields), timestamp)
+            for pk, timestamp, *values in model.objects.filter(
+                pk__in=[obj.pk for obj in objects]
+            ).values_list('pk', date_field, *fields)
+        }
+
+        created, changed = [], []
+        for obj in objects:
+            current = existing.get(obj.pk)
+            if current is None:
+                created.append(obj)
+            elif current[0] != obj.row_hash:
+                changed.append(obj)
+                # 注文日時が変わった場合に備えて、変更前の日付も集計し直す
+                self.dirty_dates.add(to_local_date(current[1]))
+
+        model.objects.bulk_create(created)
+        model.objects.bulk_update(changed, fields + ['row_hash'])
+
+        stats.inserted += len(created)
+        stats.updated += len(changed)
+        stats.unchanged += len(objects) - len(created) - len(changed)
+        stats.written += len(created) + len(changed)
+        return created + changed
+
+    def skip_existing(self, model, objects: List[Any], stats: ImportStats) -> List[Any]:
+        """
+        既存のIDをバッチごとに1回のクエリで確認し、未登録の行だけを返す
+        ignore_conflictsでスキップされた行を登録件数に数えないようにする
+        """
+        # 同じIDが複数回含まれる場合は最初の行を採用する(ignore_conflictsと同じ)
+        unique = {}
+        for obj in objects:
+            unique.setdefault(obj.pk, obj)
+        existing = set(model.objects.filter(pk__in=list(unique)).values_list('pk', flat=True))
+        created = [obj for pk, obj in unique.items() if pk not in existing]
+        stats.skipped += len(objects) - len(created)
+        return created
+
+    def write_orders(self, orders: List[Order], stats: ImportStats) -> None:
+        """検証済みの注文を一括登録する"""
+        if self.on_conflict == CONFLICT_UPSERT:
+            orders = self.upsert(Order, orders, ORDER_FIELDS, 'timestamp', stats)
+        else:
+            if self.on_conflict == CONFLICT_IGNORE:
+                orders = self.skip_existing(Order, orders, stats)
+            Order.objects.bulk_create(orders, **self._bulk_options(ORDER_FIELDS + ('row_hash',)))
+            stats.written += len(orders)
+        self.dirty_dates.update(to_local_date(order.timestamp) for order in orders)
+
+    def write_order_items(self, items: List[OrderItem], stats: ImportStats) -> None:
+        """検証済みの注文アイテムを、注文が存在するものだけ一括登録する"""
+        # 注文IDの存在をバッチごとに1回のクエリで確認する
+        order_ids = {item.order_id for item in items}
+        existing = set(Order.objects.filter(id__in=order_ids).values_list('id', flat=True))
+        valid_items = []
+        for item in items:
+            if item.order_id in existing:
+                valid_items.append(item)
+            else:
+                stats.add_error(f"{item.id}: unknown order_id: {item.order_id}")
+
+        if self.on_conflict == CONFLICT_UPSERT:
+            valid_items = self.upsert(OrderItem, valid_items, ORDER_ITEM_FIELDS, 'order__timestamp', stats)
+        else:
+            if self.on_conflict == CONFLICT_IGNORE:
+                valid_items = self.skip_existing(OrderItem, valid_items, stats)
+            OrderItem.objects.bulk_create(valid_items, **self._bulk_options(ORDER_ITEM_FIELDS + ('row_hash',)))
+            stats.written += len(valid_items)
+        self.dirty_dates.update(
+            Order.objects.filter(id__in={item.order_id for item in valid_items}).annotate(
+                order_date=TruncDate('timestamp')
+            ).values_list('order_date', flat=True).distinct()
+        )
+
+    def import_orders(self, rows: Iterable[Dict[str, Any]], label: str = 'orders') -> ImportStats:
+        """注文データをバッチ単位で一括登録する"""
+        stats = ImportStats(label)
+        for batch in batched(rows, self.batch_size):
+            orders = validate_rows(batch, self.validate_order, stats)
+            with transaction.atomic():
+                self.write_orders(orders, stats)
+            if self.progress:
+                self.progress(stats)
+        return stats.finish()
+
+    def import_order_items(self, rows: Iterable[Dict[str, Any]], label: str = 'order_items') -> ImportStats:
+        """注文アイテムデータをバッチ単位で一括登録する"""
+        stats = ImportStats(label)
+        for batch in batched(rows, self.batch_size):
+            items = validate_rows(batch, self.validate_order_item, stats)
+            with transaction.atomic():
+                self.write_order_items(items, stats)
+            if self.progress:
+                self.progress(stats)
+        return stats.finish()
+
+    def import_parsed(self, parsed: ParsedSource) -> List[ImportStats]:
+        """
+        ワーカーで解析済みのファイルを1つのトランザクションで登録する
+        解析結果は一時ファイルから1バッチずつ読み込む
+        途中で失敗した場合はそのファイルの変更をすべてロールバックする
+
+        Args:
+            parsed (ParsedSource): parse_source_fileの結果
+
+        Returns:
+            List[ImportStats]: 注文・注文アイテムごとのインポート結果
+        """
+        sections = {
+            SOURCE_ORDERS: (parsed.order_stats, self.build_order, self.write_orders),
+            SOURCE_ORDER_ITEMS: (parsed.order_item_stats, self.build_order_item, self.write_order_items),
+        }
+        results = [stats for stats, _, _ in sections.values() if stats is not None]
+        # 解析時点で読み込み済みのため、検証のエラーだけを加える
+        reads = [stats.read for stats in results]
+        for stats in results:
+            stats.start_writing()
+
+        with transaction.atomic():
+            if parsed.master_data:
+                self.import_master_data(parsed.master_data)
+
+            for section, rows in parsed.iter_batches():
+                stats, build, write = sections[section]
+                objects = validate_rows(rows, build, stats)
+                write(objects, stats)
+                if self.progress:
+                    self.progress(stats)
+
+        for stats, read in zip(results, reads):
+            stats.read = read
+            stats.finish()
+        return results
+
+    def import_workbook(self, path: str) -> List[ImportStats]:
+        """
+        XLSXワークブックを読み取り専用モードで開き、シートを依存順に取り込む
+        マスターデータ → カテゴリー別メニュー → 注文 → 注文アイテムの順
+
+        Args:
+            path (str): ワークブックのパス
+
+        Returns:
+            List[ImportStats]: シートごとのインポート結果
+        """
+        workbook = open_workbook(path)
+        label = os.path.basename(path)
+        try:
+            sheets = {sheet_key(worksheet.title): worksheet for worksheet in workbook.worksheets}
+
+            self.import_master_data(read_workbook_master_data(sheets))
+
+            results = []
+            if SOURCE_ORDERS in sheets:
+                results.append(self.import_orders(
+                    iter_sheet_records(sheets[SOURCE_ORDERS]), label=f'{label}:{sheets[SOURCE_ORDERS].title}'
+                ))
+            if SOURCE_ORDER_ITEMS in sheets:
+                results.append(self.import_order_items(
+                    iter_sheet_records(sheets[SOURCE_ORDER_ITEMS]), label=f'{label}:{sheets[SOURCE_ORDER_ITEMS].title}'
+                ))
+            return results
+        finally:
+            workbook.close()
+
+    def import_file(self, path: str, kind: Optional[str] = None) -> List[ImportStats]:
+        """ファイルの種類に応じてインポートする"""
+        kind = kind or detect_source_kind(path)
+        label = os.path.basename(path)
+        if kind == SOURCE_WORKBOOK:
+            return self.import_workbook(path)
+        if kind == SOURCE_MASTER:
+            with open(path, encoding='utf-8') as f:
+                self.import_master_data(json.load(f))
+            return []
+        if kind == SOURCE_ORDER_ITEMS:
+            return [self.import_order_items(iter_records(path), label=label)]
+        return [self.import_orders(iter_records(path), label=label)]
+
+    def finalize(self) -> int:
+        """登録された日付のロールアップを集計し直し、キャッシュを無効化する"""
+        dates = sorted(self.dirty_dates)
+        RollupService.refresh_days(dates)
+        self.dirty_dates.clear()
+        if self.dimensions_changed:
+            DashboardCache.bump_all_versions()
+            self.dimensions_changed = False
+        return len(dates)
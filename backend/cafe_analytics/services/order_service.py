@@ -1,13 +1,17 @@
-from typing import Dict, List, Optional, Union, Any
+from typing import Dict, Iterator, List, Optional, Union, Any
 from datetime import date, datetime, timedelta
 
 from django.db.models import QuerySet, Max
 from django.utils import timezone
 from django.utils.dateparse import parse_date
 
-from cafe_analytics.models import Order
-from cafe_analytics.serializers import OrderSerializer
+from cafe_analytics.models import Order, OrderItem
+from cafe_analytics.pagination import keyset_page
+from cafe_analytics.serializers import (
+    OrderSerializer, ORDER_VALUE_FIELDS, ORDER_ITEM_VALUE_FIELDS, serialize_order_rows,
+)
 from . import BaseService
+from .dimensions import DimensionRegistry
 
 class OrderService(BaseService):
     """注文に関連するビジネスロジックを提供"""
@@ -15,9 +19,12 @@ class OrderService(BaseService):
     @staticmethod
     def get_latest_order_date() -> Optional[date]:
         """最新の注文日を取得"""
-        return Order.objects.aggregate(
-            latest_date=Max('timestamp__date')
-        )['latest_date']
+        latest_timestamp = Order.objects.aggregate(
+            latest_timestamp=Max('timestamp')
+        )['latest_timestamp']
+        if latest_timestamp is None:
+            return None
+        return timezone.localtime(latest_timestamp).date() if timezone.is_aware(latest_timestamp) else latest_timestamp.date()
 
     @staticmethod
     def get_target_date(date_str: Optional[str] = None) -> Optional[date]:
@@ -56,7 +63,7 @@ class OrderService(BaseService):
         end_date_obj = BaseService.parse_date_param(end_date) if not isinstance(end_date, date) else end_date
 
         return Order.objects.filter(
-            timestamp__date__range=[start_date_obj, end_date_obj]
+            **BaseService.timestamp_range_filter(start_date_obj, end_date_obj)
         ).select_related(
             'order_type',
             'weather',
@@ -66,6 +73,43 @@ class OrderService(BaseService):
             'items__menu_item__category'
         )
 
+    @staticmethod
+    def get_order_rows(
+        start_date: Optional[Union[str, date]] = None,
+        end_date: Optional[Union[str, date]] = None
+    ) -> QuerySet:
+        """期間内の注文をvalues()の行として取得するクエリセット"""
+        return Order.objects.filter(
+            **BaseService.timestamp_range_filter(start_date, end_date)
+        ).values(*ORDER_VALUE_FIELDS)
+
+    @staticmethod
+    def serialize_orders(order_rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """注文の行に注文アイテムを1回のクエリで付け、OrderSerializerと同じ形式に変換する"""
+        item_rows = OrderItem.objects.filter(
+            order_id__in=[row['id'] for row in order_rows]
+        ).values(*ORDER_ITEM_VALUE_FIELDS).order_by('id')
+        return serialize_order_rows(order_rows, item_rows)
+
+    @classmethod
+    def iter_orders(
+        cls,
+        start_date: Optional[Union[str, date]] = None,
+        end_date: Optional[Union[str, date]] = None,
+        batch_size: int = 500
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        期間内の注文を (timestamp, id) のキーセットでbatch_size件ずつ読み込み、1件ずつ返す
+        全件をメモリに載せないため、件数が多くてもメモリ使用量は一定
+        """
+        position = None
+        while True:
+            rows, has_next = keyset_page(cls.get_order_rows(start_date, end_date), position, batch_size)
+            yield from cls.serialize_orders(rows)
+            if not has_next:
+                return
+            position = (rows[-1]['timestamp'], rows[-1]['id'])
+
     @staticmethod
     def get_orders_summary(orders: QuerySet) -> List[Dict[str, Any]]:
         """注文一覧の詳細データを取得"""
@@ -90,10 +134,13 @@ class OrderService(BaseService):
         """顧客の人口統計学的分析"""
         from django.db.models import Count
 
+        registry = DimensionRegistry.get()
         return {
-            'gender_distribution': list(orders.values('gender__name').annotate(
-                count=Count('id')
-            )),
+            'gender_distribution': registry.merge(
+                orders.values('gender_id').annotate(count=Count('id')).order_by(),
+                lambda row: {'gender__name': registry.name('gender', row['gender_id'])},
+                ('count',),
+            ),
         }
 
     @staticmethod
@@ -101,7 +148,10 @@ class OrderService(BaseService):
         """指定された注文の天気分布を取得"""
         from django.db.models import Count
 
-        return list(orders
-            .values('weather__name')
-            .annotate(count=Count('id'))
-            .order_by('-count'))
+        registry = DimensionRegistry.get()
+        merged = registry.merge(
+            orders.values('weather_id').annotate(count=Count('id')).order_by(),
+            lambda row: {'weather__name': registry.name('weather', row['weather_id'])},
+            ('count',),
+        )
+        return sorted(merged, key=lambda row: -row['count'])
@@ -7,7 +7,17 @@ from django.utils.dateparse import parse_date
 
 from cafe_analytics.models import OrderItem
 from . import BaseService
-
+from .slow_query_log import capture_slow_queries
+from .single_flight import coalesce_requests
+from .basket_engine import BasketEngine
+from .columnar_store import ColumnarStore
+from .dimensions import DimensionRegistry
+
+@coalesce_requests(
+    'get_bestsellers', 'get_popular_items_by_type', 'get_dine_in_popular_by_timeslot',
+    'get_discount_analysis', 'get_combo_analysis',
+)
+@capture_slow_queries
 class ProductService(BaseService):
     """商品分析に関連するビジネスロジックを提供"""
 
@@ -18,28 +28,25 @@ class ProductService(BaseService):
         end_date: Optional[Union[str, date]] = None
     ) -> List[Dict[str, Any]]:
         """ベストセラー商品を取得"""
-        queryset = OrderItem.objects.all()
-
-        if start_date:
-            start_date_obj = BaseService.parse_date_param(start_date)
-            if start_date_obj:
-                queryset = queryset.filter(order__timestamp__date__gte=start_date_obj)
-
-        if end_date:
-            end_date_obj = BaseService.parse_date_param(end_date)
-            if end_date_obj:
-                queryset = queryset.filter(order__timestamp__date__lte=end_date_obj)
-
-        bestsellers = queryset.values(
-            'menu_item__category__name',
-            'menu_item__name',
-            'menu_item__price'
-        ).annotate(
+        if ColumnarStore.is_enabled():
+            return ColumnarStore.get().bestsellers(limit, start_date, end_date)
+
+        queryset = OrderItem.objects.filter(
+            **BaseService.timestamp_range_filter(start_date, end_date, field='order__timestamp')
+        )
+
+        rows = queryset.values('menu_item_id').annotate(
             total_quantity=Count('id'),
             total_sales=Sum('price')
-        ).order_by('-total_quantity')[:limit]
+        ).order_by()
 
-        return list(bestsellers)
+        registry = DimensionRegistry.get()
+        bestsellers = registry.merge(
+            rows,
+            lambda row: registry.menu_item_labels(row['menu_item_id']),
+            ('total_quantity', 'total_sales'),
+        )
+        return sorted(bestsellers, key=lambda row: -row['total_quantity'])[:limit]
 
     @staticmethod
     def get_popular_items_by_type(
@@ -49,28 +56,38 @@ class ProductService(BaseService):
         end_date: Optional[Union[str, date]] = None
     ) -> List[Dict[str, Any]]:
         """指定された注文タイプの人気商品を取得"""
+        if ColumnarStore.is_enabled():
+            return ColumnarStore.get().popular_items_by_type(order_type_id, limit, start_date, end_date)
+
         queryset = OrderItem.objects.filter(
             order__order_type_id=order_type_id
         )
 
-        if start_date:
-            start_date_obj = BaseService.parse_date_param(start_date)
-            if start_date_obj:
-                queryset = queryset.filter(order__timestamp__date__gte=start_date_obj)
-
-        if end_date:
-            end_date_obj = BaseService.parse_date_param(end_date)
-            if end_date_obj:
-                queryset = queryset.filter(order__timestamp__date__lte=end_date_obj)
-
-        return list(queryset.values(
-            'menu_item__name',
-            'menu_item__category__name',
-            'menu_item__price'
-        ).annotate(
+        queryset = queryset.filter(
+            **BaseService.timestamp_range_filter(start_date, end_date, field='order__timestamp')
+        )
+
+        rows = queryset.values('menu_item_id').annotate(
             total_orders=Count('id'),
             total_sales=Sum('price')
-        ).order_by('-total_orders')[:limit])
+        ).order_by()
+
+        registry = DimensionRegistry.get()
+        items = registry.merge(
+            rows,
+            lambda row: registry.menu_item_labels(row['menu_item_id']),
+            ('total_orders', 'total_sales'),
+        )
+        return [
+            {
+                'menu_item__name': item['menu_item__name'],
+                'menu_item__category__name': item['menu_item__category__name'],
+                'menu_item__price': item['menu_item__price'],
+                'total_orders': item['total_orders'],
+                'total_sales': item['total_sales'],
+            }
+            for item in sorted(items, key=lambda item: -item['total_orders'])[:limit]
+        ]
 
     @staticmethod
     def get_dine_in_popular_by_timeslot(
@@ -78,32 +95,35 @@ class ProductService(BaseService):
         end_date: Optional[Union[str, date]] = None
     ) -> Dict[str, List[Dict[str, Any]]]:
         """店内飲食の時間帯ごとの人気メニューランキングを取得"""
+        if ColumnarStore.is_enabled():
+            return ColumnarStore.get().popular_items_by_timeslot(1, start_date, end_date)
+
         queryset = OrderItem.objects.filter(
             order__order_type_id=1  # 店内飲食のorder_type_id
         )
 
-        if start_date:
-            start_date_obj = BaseService.parse_date_param(start_date)
-            if start_date_obj:
-                queryset = queryset.filter(order__timestamp__date__gte=start_date_obj)
-
-        if end_date:
-            end_date_obj = BaseService.parse_date_param(end_date)
-            if end_date_obj:
-                queryset = queryset.filter(order__timestamp__date__lte=end_date_obj)
-
-        popular_items = queryset.values(
-            'order__time_slot__name',
-            'menu_item__name',
-            'menu_item__category__name',
-            'menu_item__price'
-        ).annotate(
+        queryset = queryset.filter(
+            **BaseService.timestamp_range_filter(start_date, end_date, field='order__timestamp')
+        )
+
+        rows = queryset.values('order__time_slot_id', 'menu_item_id').annotate(
             total_orders=Count('id'),
             total_sales=Sum('price')
-        ).order_by(
-            'order__time_slot__name',
-            '-total_orders'
+        ).order_by()
+
+        registry = DimensionRegistry.get()
+        popular_items = registry.merge(
+            rows,
+            lambda row: {
+                'order__time_slot__name': registry.name('time_slot', row['order__time_slot_id']),
+                **registry.menu_item_labels(row['menu_item_id']),
+            },
+            ('total_orders', 'total_sales'),
         )
+        popular_items.sort(key=lambda item: (
+            registry.sort_key('time_slot', item['order__time_slot__name']),
+            -item['total_orders'],
+        ))
 
         # 時間帯ごとにTop5を抽出
         result = {}
@@ -138,75 +158,48 @@ class ProductService(BaseService):
         end_date: Optional[Union[str, date]] = None
     ) -> List[Dict[str, Any]]:
         """割引分析を取得"""
+        if ColumnarStore.is_enabled():
+            return ColumnarStore.get().discount_analysis(start_date, end_date)
+
         from cafe_analytics.models import Order
 
         queryset = Order.objects.exclude(discount=0)
 
-        if start_date:
-            start_date_obj = BaseService.parse_date_param(start_date)
-            if start_date_obj:
-                queryset = queryset.filter(timestamp__date__gte=start_date_obj)
+        queryset = queryset.filter(**BaseService.timestamp_range_filter(start_date, end_date))
 
-        if end_date:
-            end_date_obj = BaseService.parse_date_param(end_date)
-            if end_date_obj:
-                queryset = queryset.filter(timestamp__date__lte=end_date_obj)
-
-        discount_data = queryset.values(
-            'time_slot__name'
-        ).annotate(
+        rows = queryset.values('time_slot_id').annotate(
             total_orders=Count('id'),
             total_discount=Sum('discount'),
-            avg_discount=Avg('discount'),
             total_sales_before_discount=Sum('total_price'),
             total_sales_after_discount=Sum(F('total_price') - F('discount'))
-        ).order_by('time_slot__name')
+        ).order_by()
 
-        return list(discount_data)
+        registry = DimensionRegistry.get()
+        merged = registry.merge(
+            rows,
+            lambda row: {'time_slot__name': registry.name('time_slot', row['time_slot_id'])},
+            ('total_orders', 'total_discount', 'total_sales_before_discount', 'total_sales_after_discount'),
+        )
+        return [
+            {
+                'time_slot__name': row['time_slot__name'],
+                'total_orders': row['total_orders'],
+                'total_discount': row['total_discount'],
+                'avg_discount': row['total_discount'] / row['total_orders'],
+                'total_sales_before_discount': row['total_sales_before_discount'],
+                'total_sales_after_discount': row['total_sales_after_discount'],
+            }
+            for row in sorted(merged, key=lambda row: registry.sort_key('time_slot', row['time_slot__name']))
+        ]
 
     @staticmethod
-    def get_combo_analysis(min_occurrence: int = 2, limit: int = 10) -> List[Dict[str, Any]]:
-        """よく一緒に注文される商品の組み合わせ分析を取得"""
-        from django.db.models import Count
-        from cafe_analytics.models import OrderItem
-
-        # 同じ注文のない商品の組み合わせを分岐
-        combos = OrderItem.objects.values(
-            'order_id'
-        ).annotate(
-            order_count=Count('id')
-        ).filter(
-            order_count__gte=2  # 二つ以上のアイテムがある注文に限定
-        ).values_list('order_id', flat=True)
-
-        combo_results = []
-        processed_pairs = set()
-
-        for order_id in combos:
-            items = OrderItem.objects.filter(
-                order_id=order_id
-            ).values_list('menu_item__name', flat=True)
-
-            items = list(items)
-            for i in range(len(items)):
-                for j in range(i+1, len(items)):
-                    pair = tuple(sorted([items[i], items[j]]))
-                    if pair not in processed_pairs:
-                        processed_pairs.add(pair)
-
-                        # この組み合わせが出現する回数を計算
-                        pair_count = OrderItem.objects.filter(
-                            order_id__in=combos
-                        ).filter(
-                            menu_item__name__in=pair
-                        ).values('order_id').annotate(
-                            count=Count('id')
-                        ).filter(count=2).count()
-
-                        if pair_count >= min_occurrence:
-                            combo_results.append({
-                                'items': pair,
-                                'occurrence_count': pair_count
-                            })
-
-        return sorted(combo_results, key=lambda x: x['occurrence_count'], reverse=True)[:limit]
+    def get_combo_analysis(
+        min_occurrence: int = 2,
+        limit: int = 10,
+        start_date: Optional[Union[str, date]] = None,
+        end_date: Optional[Union[str, date]] = None,
+        include_triples: bool = False
+    ) -> List[Dict[str, Any]]:
+        """よく一緒に注文される商品の組み合わせ分析を取得(支持度・確信度・リフト値付き)"""
+        engine = BasketEngine(start_date, end_date)
+        return engine.combos(min_occurrence, include_triples)[:limit]
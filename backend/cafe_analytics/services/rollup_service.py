@@ -0,0 +1,582 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Union, Any
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Sum, Count, Min, Max, F
+from django.db.models.functions import ExtractHour, TruncDate
+from django.utils import timezone
+
+from cafe_analytics.models import (
+    Order, OrderItem,
+    DailySalesRollup, DailyMenuItemRollup, RollupDay,
+)
+from . import BaseService
+from .cache_service import DashboardCache
+from .dimensions import DimensionRegistry
+
+# ロールアップの集計軸
+SALES_DIMENSIONS = ('time_slot_id', 'order_type_id', 'weather_id', 'gender_id')
+# 売上ロールアップの日付以外のキー(時刻と集計軸)
+SALES_KEY_FIELDS = ('hour', *SALES_DIMENSIONS)
+
+_state = threading.local()
+
+
+def to_local_date(value: datetime) -> date:
+    """注文日時をロールアップの日付(ローカルタイムゾーン)に変換"""
+    if timezone.is_aware(value):
+        return timezone.localtime(value).date()
+    return value.date()
+
+
+def to_local_hour(value: datetime) -> int:
+    """注文日時をロールアップの時刻(ローカルタイムゾーン)に変換"""
+    if timezone.is_aware(value):
+        return timezone.localtime(value).hour
+    return value.hour
+
+
+class RollupUpdater:
+    """
+    ロールアップへの差分を蓄積し、まとめて適用する
+    集計済みの日付は差分を加算し、未集計の日付はその日だけ集計し直す
+    """
+
+    def __init__(self):
+        self.sales_deltas = defaultdict(lambda: [0, 0, 0])
+        self.item_deltas = defaultdict(lambda: [0, 0])
+        self.order_dates: Dict[str, Optional[date]] = {}
+
+    def add_order(self, order_date: date, dimensions: tuple, total_price: int, discount: int, sign: int = 1):
+        """注文1件分の差分を追加(dimensionsはSALES_KEY_FIELDSの順の値)"""
+        delta = self.sales_deltas[(order_date, *dimensions)]
+        delta[0] += sign
+        delta[1] += sign * total_price
+        delta[2] += sign * discount
+
+    def add_item(self, order_date: date, menu_item_id: int, price: int, sign: int = 1, count: int = 1):
+        """注文アイテムの差分を追加"""
+        delta = self.item_deltas[(order_date, menu_item_id)]
+        delta[0] += sign * count
+        delta[1] += sign * price
+
+    @property
+    def dates(self) -> set:
+        return {key[0] for key in self.sales_deltas} | {key[0] for key in self.item_deltas}
+
+    @staticmethod
+    def _apply(model, lookup: Dict[str, Any], deltas: Dict[str, int]) -> None:
+        """
+        キーの行に差分を加算し、行が無く件数(最初の値)が正であれば作成する
+        他のトランザクションが同じキーの行を先に作成した場合(一意制約違反)は、その行に加算し直す
+        """
+        increments = {field: F(field) + value for field, value in deltas.items()}
+        if model.objects.filter(**lookup).update(**increments) or next(iter(deltas.values())) <= 0:
+            return
+        try:
+            with transaction.atomic():
+                model.objects.create(**lookup, **deltas)
+        except IntegrityError:
+            model.objects.filter(**lookup).update(**increments)
+
+    @transaction.atomic
+    def flush(self) -> None:
+        """蓄積した差分をロールアップに適用"""
+        dates = self.dates
+        if not dates:
+            return
+
+        built_dates = set(RollupDay.objects.filter(date__in=dates).values_list('date', flat=True))
+
+        for key, (order_count, total_sales, total_discount) in self.sales_deltas.items():
+            if key[0] not in built_dates or (order_count, total_sales, total_discount) == (0, 0, 0):
+                continue
+            self._apply(DailySalesRollup, dict(zip(('date', *SALES_KEY_FIELDS), key)), {
+                'order_count': order_count,
+                'total_sales': total_sales,
+                'total_discount': total_discount,
+            })
+
+        for (order_date, menu_item_id), (items_sold, total_sales) in self.item_deltas.items():
+            if order_date not in built_dates or (items_sold, total_sales) == (0, 0):
+                continue
+            self._apply(DailyMenuItemRollup, {'date': order_date, 'menu_item_id': menu_item_id}, {
+                'items_sold': items_sold,
+                'total_sales': total_sales,
+            })
+
+        # 未集計の日付はその日のみ生データから集計する
+        for order_date in sorted(dates - built_dates):
+            RollupService.build(order_date, order_date)
+
+        # 変更のあった日付を含むダッシュボードのキャッシュを無効化
+        DashboardCache.bump_versions(dates)
+
+        self.sales_deltas.clear()
+        self.item_deltas.clear()
+
+    @staticmethod
+    def current() -> Optional['RollupUpdater']:
+        """deferred()で有効になっている更新器を返す"""
+        return getattr(_state, 'updater', None)
+
+    @classmethod
+    @contextmanager
+    def deferred(cls):
+        """
+        ブロック内の差分を蓄積し、終了時に一括で適用する
+        一括インポートなど大量の書き込みで1行ごとの更新を避けるために使用
+        """
+        if cls.current() is not None:
+            yield cls.current()
+            return
+
+        updater = cls()
+        _state.updater = updater
+        try:
+            yield updater
+        finally:
+            _state.updater = None
+        updater.flush()
+
+    @classmethod
+    @contextmanager
+    def collect(cls):
+        """差分を適用する更新器を返す(deferred中はそちらに蓄積する)"""
+        updater = cls.current()
+        if updater is not None:
+            yield updater
+            return
+
+        updater = cls()
+        yield updater
+        updater.flush()
+
+
+class RollupService(BaseService):
+    """
+    日次ロールアップテーブルの構築と参照を提供
+    集計済みの期間は生の注文データを走査せずにロールアップから回答する
+    """
+
+    @staticmethod
+    def iter_days(start_date: date, end_date: date):
+        """開始日から終了日までの日付を順に返す"""
+        current = start_date
+        while current <= end_date:
+            yield current
+            current += timedelta(days=1)
+
+    @staticmethod
+    def get_order_date_bounds() -> tuple[Optional[date], Optional[date]]:
+        """注文データの最初と最後の日付を取得"""
+        bounds = Order.objects.aggregate(
+            first_timestamp=Min('timestamp'),
+            last_timestamp=Max('timestamp'),
+        )
+        if bounds['first_timestamp'] is None:
+            return None, None
+        return to_local_date(bounds['first_timestamp']), to_local_date(bounds['last_timestamp'])
+
+    @classmethod
+    @transaction.atomic
+    def build(cls, start_date: date, end_date: date) -> Dict[str, int]:
+        """
+        指定期間のロールアップを(再)構築する
+
+        Args:
+            start_date (date): 開始日
+            end_date (date): 終了日
+
+        Returns:
+            Dict[str, int]: 作成したロールアップの件数
+        """
+        days = list(cls.iter_days(start_date, end_date))
+
+        DailySalesRollup.objects.filter(date__range=[start_date, end_date]).delete()
+        DailyMenuItemRollup.objects.filter(date__range=[start_date, end_date]).delete()
+        RollupDay.objects.filter(date__range=[start_date, end_date]).delete()
+
+        sales_rows = Order.objects.filter(
+            **cls.timestamp_range_filter(start_date, end_date)
+        ).annotate(
+            order_date=TruncDate('timestamp'),
+            order_hour=ExtractHour('timestamp'),
+        ).values(
+            'order_date', 'order_hour', *SALES_DIMENSIONS
+        ).annotate(
+            order_count=Count('id'),
+            total_sales=Sum('total_price'),
+            total_discount=Sum('discount'),
+        ).order_by()
+
+        sales_rollups = DailySalesRollup.objects.bulk_create([
+            DailySalesRollup(
+                date=row['order_date'],
+                hour=row['order_hour'],
+                time_slot_id=row['time_slot_id'],
+                order_type_id=row['order_type_id'],
+                weather_id=row['weather_id'],
+                gender_id=row['gender_id'],
+                order_count=row['order_count'],
+                total_sales=row['total_sales'] or 0,
+                total_discount=row['total_discount'] or 0,
+            )
+            for row in sales_rows
+        ], batch_size=1000)
+
+        item_rows = OrderItem.objects.filter(
+            **cls.timestamp_range_filter(start_date, end_date, field='order__timestamp')
+        ).annotate(
+            order_date=TruncDate('order__timestamp')
+        ).values(
+            'order_date', 'menu_item_id'
+        ).annotate(
+            items_sold=Count('id'),
+            total_sales=Sum('price'),
+        ).order_by()
+
+        item_rollups = DailyMenuItemRollup.objects.bulk_create([
+            DailyMenuItemRollup(
+                date=row['order_date'],
+                menu_item_id=row['menu_item_id'],
+                items_sold=row['items_sold'],
+                total_sales=row['total_sales'] or 0,
+            )
+            for row in item_rows
+        ], batch_size=1000)
+
+        RollupDay.objects.bulk_create(
+            [RollupDay(date=day) for day in days],
+            batch_size=1000,
+        )
+
+        return {
+            'days': len(days),
+            'sales_rollups': len(sales_rollups),
+            'menu_item_rollups': len(item_rollups),
+        }
+
+    @classmethod
+    def refresh_days(cls, dates: Iterable[date]) -> None:
+        """
+        指定した日付のロールアップを集計し直し、データバージョンを上げる
+        シグナルを経由しない一括登録の後に使用する
+        """
+        dates = sorted(set(dates))
+        if not dates:
+            return
+
+        # 連続する日付はまとめて集計する
+        run_start = previous = dates[0]
+        for day in dates[1:] + [None]:
+            if day is not None and day == previous + timedelta(days=1):
+                previous = day
+                continue
+            cls.build(run_start, previous)
+            run_start = previous = day
+
+        DashboardCache.bump_versions(dates)
+
+    @classmethod
+    def _raw_day_snapshot(cls, day: date) -> tuple[Dict[tuple, tuple], Dict[int, tuple]]:
+        """生データから1日分の集計値を取得"""
+        sales = {
+            tuple(row[field] for field in SALES_KEY_FIELDS): (
+                row['order_count'], row['total_sales'] or 0, row['total_discount'] or 0,
+            )
+            for row in Order.objects.filter(
+                **cls.timestamp_range_filter(day, day)
+            ).annotate(hour=ExtractHour('timestamp')).values(*SALES_KEY_FIELDS).annotate(
+                order_count=Count('id'),
+                total_sales=Sum('total_price'),
+                total_discount=Sum('discount'),
+            ).order_by()
+        }
+        items = {
+            row['menu_item_id']: (row['items_sold'], row['total_sales'] or 0)
+            for row in OrderItem.objects.filter(
+                **cls.timestamp_range_filter(day, day, field='order__timestamp')
+            ).values('menu_item_id').annotate(
+                items_sold=Count('id'),
+                total_sales=Sum('price'),
+            ).order_by()
+        }
+        return sales, items
+
+    @staticmethod
+    def _rollup_day_snapshot(day: date) -> tuple[Dict[tuple, tuple], Dict[int, tuple]]:
+        """ロールアップから1日分の集計値を取得"""
+        sales = {
+            tuple(row[field] for field in SALES_KEY_FIELDS): (
+                row['order_count'], row['total_sales'], row['total_discount'],
+            )
+            for row in DailySalesRollup.objects.filter(
+                date=day, order_count__gt=0
+            ).values(*SALES_KEY_FIELDS, 'order_count', 'total_sales', 'total_discount')
+        }
+        items = {
+            row['menu_item_id']: (row['items_sold'], row['total_sales'])
+            for row in DailyMenuItemRollup.objects.filter(
+                date=day, items_sold__gt=0
+            ).values('menu_item_id', 'items_sold', 'total_sales')
+        }
+        return sales, items
+
+    @classmethod
+    def check_day(cls, day: date, repair: bool = False) -> List[Dict[str, Any]]:
+        """
+        1日分のロールアップを生データと比較し、差異を返す
+
+        Args:
+            day (date): 対象日
+            repair (bool, optional): 差異があればその日を集計し直す. Defaults to False.
+
+        Returns:
+            List[Dict[str, Any]]: 差異の一覧
+        """
+        if not RollupDay.objects.filter(date=day).exists():
+            return []
+
+        raw_sales, raw_items = cls._raw_day_snapshot(day)
+        rollup_sales, rollup_items = cls._rollup_day_snapshot(day)
+
+        mismatches = []
+        for key in raw_sales.keys() | rollup_sales.keys():
+            expected, actual = raw_sales.get(key), rollup_sales.get(key)
+            if expected != actual:
+                mismatches.append({
+                    'date': day,
+                    'table': DailySalesRollup._meta.db_table,
+                    'key': dict(zip(SALES_KEY_FIELDS, key)),
+                    'expected': expected,
+                    'actual': actual,
+                })
+        for key in raw_items.keys() | rollup_items.keys():
+            expected, actual = raw_items.get(key), rollup_items.get(key)
+            if expected != actual:
+                mismatches.append({
+                    'date': day,
+                    'table': DailyMenuItemRollup._meta.db_table,
+                    'key': {'menu_item_id': key},
+                    'expected': expected,
+                    'actual': actual,
+                })
+
+        if mismatches and repair:
+            cls.build(day, day)
+
+        return mismatches
+
+    @classmethod
+    def is_covered(cls, start_date: Optional[Union[str, date]], end_date: Optional[Union[str, date]]) -> bool:
+        """指定期間の全日付がロールアップ済みかどうかを判定"""
+        start_date_obj = cls.parse_date_param(start_date)
+        end_date_obj = cls.parse_date_param(end_date)
+        if not start_date_obj or not end_date_obj or start_date_obj > end_date_obj:
+            return False
+
+        expected_days = (end_date_obj - start_date_obj).days + 1
+        built_days = RollupDay.objects.filter(
+            date__range=[start_date_obj, end_date_obj]
+        ).count()
+        return built_days == expected_days
+
+    @staticmethod
+    def _sales_rollups(start_date: date, end_date: date):
+        return DailySalesRollup.objects.filter(date__range=[start_date, end_date])
+
+    @staticmethod
+    def _menu_item_rollups(start_date: date, end_date: date):
+        return DailyMenuItemRollup.objects.filter(date__range=[start_date, end_date])
+
+    @classmethod
+    def get_sales_rows(cls, fields: Iterable[str], start_date: date, end_date: date) -> List[Dict[str, Any]]:
+        """ロールアップから指定した軸(date, hour, *_id)ごとの注文数・売上合計・割引合計を取得"""
+        return list(cls._sales_rollups(start_date, end_date).values(*fields).annotate(
+            order_count=Sum('order_count'),
+            total_sales=Sum('total_sales'),
+            total_discount=Sum('total_discount'),
+        ).filter(order_count__gt=0).order_by())
+
+    @classmethod
+    def get_menu_item_sales(cls, start_date: date, end_date: date) -> List[Dict[str, Any]]:
+        """ロールアップからメニューアイテムごとの販売数・売上合計を取得"""
+        return list(cls._menu_item_rollups(start_date, end_date).values('menu_item_id').annotate(
+            total_sales=Sum('total_sales'),
+            items_sold=Sum('items_sold'),
+        ).filter(items_sold__gt=0).order_by())
+
+    @classmethod
+    def get_sales_summary(cls, start_date: date, end_date: date) -> Dict[str, Any]:
+        """ロールアップから売上サマリーを取得"""
+        totals = cls._sales_rollups(start_date, end_date).aggregate(
+            total_amount=Sum('total_sales'),
+            total_orders=Sum('order_count'),
+            total_discount=Sum('total_discount'),
+        )
+        total_amount = totals['total_amount']
+        total_orders = totals['total_orders'] or 0
+        total_discount = totals['total_discount']
+
+        return {
+            'total_amount': total_amount,
+            'total_orders': total_orders,
+            'avg_order_value': (total_amount / total_orders) if total_orders else None,
+            'total_discount': total_discount,
+            'net_sales': (total_amount - total_discount) if total_orders else None,
+        }
+
+    @classmethod
+    def get_period_sales(cls, period: str, start_date: date, end_date: date) -> List[Dict[str, Any]]:
+        """ロールアップから期間別の売上データを取得"""
+        daily_rows = cls._sales_rollups(start_date, end_date).values(
+            'date'
+        ).annotate(
+            total_sales=Sum('total_sales'),
+            total_orders=Sum('order_count'),
+            total_discount=Sum('total_discount'),
+        ).order_by('date')
+
+        buckets: Dict[Any, Dict[str, int]] = {}
+        for row in daily_rows:
+            if not row['total_orders']:
+                continue
+            key = cls.truncate_period(row['date'], period)
+            bucket = buckets.setdefault(key, {'total_sales': 0, 'total_orders': 0, 'total_discount': 0})
+            bucket['total_sales'] += row['total_sales']
+            bucket['total_orders'] += row['total_orders']
+            bucket['total_discount'] += row['total_discount']
+
+        return [
+            {
+                'period': key,
+                'total_sales': bucket['total_sales'],
+                'total_orders': bucket['total_orders'],
+                'avg_order_value': bucket['total_sales'] / bucket['total_orders'],
+                'total_discount': bucket['total_discount'],
+                'net_sales': Decimal(bucket['total_sales'] - bucket['total_discount']),
+            }
+            for key, bucket in buckets.items()
+        ]
+
+    @classmethod
+    def get_sales_by_factor(cls, factor_name_field: str, start_date: date, end_date: date) -> List[Dict[str, Any]]:
+        """ロールアップから要素(天気や性別等)別の売上データを取得"""
+        factor_field = factor_name_field.split('__')[0]
+        rows = cls._sales_rollups(start_date, end_date).values(
+            f'{factor_field}_id'
+        ).annotate(
+            total_sales=Sum('total_sales'),
+            total_orders=Sum('order_count'),
+        ).filter(total_orders__gt=0).order_by()
+
+        registry = DimensionRegistry.get()
+        merged = registry.merge(
+            rows,
+            lambda row: {factor_name_field: registry.name(factor_field, row[f'{factor_field}_id'])},
+            ('total_sales', 'total_orders'),
+        )
+        return [
+            {
+                factor_name_field: row[factor_name_field],
+                'total_sales': row['total_sales'],
+                'total_orders': row['total_orders'],
+                'avg_order_value': row['total_sales'] / row['total_orders'],
+            }
+            for row in sorted(merged, key=lambda row: -row['total_sales'])
+        ]
+
+    @classmethod
+    def get_weather_timeslot_analysis(cls, start_date: date, end_date: date) -> List[Dict[str, Any]]:
+        """ロールアップから天気と時間帯のクロス分析を取得"""
+        rows = cls._sales_rollups(start_date, end_date).values(
+            'weather_id',
+            'time_slot_id'
+        ).annotate(
+            total_sales=Sum('total_sales'),
+            order_count=Sum('order_count'),
+        ).filter(order_count__gt=0).order_by()
+
+        registry = DimensionRegistry.get()
+        merged = registry.merge(
+            rows,
+            lambda row: {
+                'weather__name': registry.name('weather', row['weather_id']),
+                'time_slot__name': registry.name('time_slot', row['time_slot_id']),
+            },
+            ('total_sales', 'order_count'),
+        )
+        merged.sort(key=lambda row: (
+            registry.sort_key('weather', row['weather__name']),
+            registry.sort_key('time_slot', row['time_slot__name']),
+        ))
+
+        return [
+            {
+                'weather__name': row['weather__name'],
+                'time_slot__name': row['time_slot__name'],
+                'total_sales': row['total_sales'],
+                'order_count': row['order_count'],
+                'avg_order_value': row['total_sales'] / row['order_count'],
+            }
+            for row in merged
+        ]
+
+    @classmethod
+    def get_factor_counts(cls, factor_name_field: str, start_date: date, end_date: date) -> List[Dict[str, Any]]:
+        """ロールアップから要素別の注文件数を取得"""
+        factor_field = factor_name_field.split('__')[0]
+        rows = cls._sales_rollups(start_date, end_date).values(
+            f'{factor_field}_id'
+        ).annotate(
+            count=Sum('order_count')
+        ).filter(count__gt=0).order_by()
+
+        registry = DimensionRegistry.get()
+        merged = registry.merge(
+            rows,
+            lambda row: {factor_name_field: registry.name(factor_field, row[f'{factor_field}_id'])},
+            ('count',),
+        )
+        return sorted(merged, key=lambda row: -row['count'])
+
+    @classmethod
+    def calculate_takeout_rate(cls, start_date: date, end_date: date) -> float:
+        """ロールアップからテイクアウト率を計算"""
+        totals = {
+            row['order_type__name']: row['count']
+            for row in cls.get_factor_counts('order_type__name', start_date, end_date)
+        }
+        total_orders = sum(totals.values())
+        takeout_orders = totals.get('テイクアウト', 0)
+        return (takeout_orders / total_orders * 100) if total_orders > 0 else 0
+
+    @classmethod
+    def get_top_categories(cls, limit: Optional[int], start_date: date, end_date: date) -> List[Dict[str, Any]]:
+        """ロールアップからトップカテゴリーを取得"""
+        rows = cls._menu_item_rollups(start_date, end_date).values(
+            'menu_item_id'
+        ).annotate(
+            total_sales=Sum('total_sales'),
+            items_sold=Sum('items_sold'),
+        ).filter(items_sold__gt=0).order_by()
+
+        registry = DimensionRegistry.get()
+        result = sorted(
+            registry.merge(
+                rows,
+                lambda row: {'menu_item__category__name': registry.menu_item(row['menu_item_id'])['category_name']},
+                ('total_sales', 'items_sold'),
+            ),
+            key=lambda row: -row['total_sales'],
+        )
+
+        if limit is not None:
+            result = result[:limit]
+
+        return result
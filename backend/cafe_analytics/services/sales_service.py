@@ -8,7 +8,12 @@ from django.utils.dateparse import parse_date
 
 from cafe_analytics.models import Order, OrderItem
 from . import BaseService
+from .slow_query_log import capture_slow_queries
+from .rollup_service import RollupService
+from .columnar_store import ColumnarStore
+from .dimensions import DimensionRegistry
 
+@capture_slow_queries
 class SalesService(BaseService):
     """
     売上分析に関連するビジネスロジックを提供
@@ -26,17 +31,16 @@ class SalesService(BaseService):
         Returns:
             Dict[str, Any]: 売上サマリー
         """
-        queryset = Order.objects.all()
+        if ColumnarStore.is_enabled():
+            return ColumnarStore.get().sales_summary(start_date, end_date)
 
-        if start_date:
-            start_date_obj = BaseService.parse_date_param(start_date)
-            if start_date_obj:
-                queryset = queryset.filter(timestamp__date__gte=start_date_obj)
+        if RollupService.is_covered(start_date, end_date):
+            return RollupService.get_sales_summary(
+                BaseService.parse_date_param(start_date),
+                BaseService.parse_date_param(end_date),
+            )
 
-        if end_date:
-            end_date_obj = BaseService.parse_date_param(end_date)
-            if end_date_obj:
-                queryset = queryset.filter(timestamp__date__lte=end_date_obj)
+        queryset = Order.objects.filter(**BaseService.timestamp_range_filter(start_date, end_date))
 
         return queryset.aggregate(
             total_amount=Sum('total_price'),
@@ -59,17 +63,17 @@ class SalesService(BaseService):
                 'monthly': TruncMonth
             }.get(period, TruncDate)
 
-            queryset = Order.objects.all()
+            if ColumnarStore.is_enabled():
+                return ColumnarStore.get().period_sales(period, start_date, end_date)
 
-            if start_date:
-                start_date_obj = BaseService.parse_date_param(start_date)
-                if start_date_obj:
-                    queryset = queryset.filter(timestamp__date__gte=start_date_obj)
+            if RollupService.is_covered(start_date, end_date):
+                return RollupService.get_period_sales(
+                    period,
+                    BaseService.parse_date_param(start_date),
+                    BaseService.parse_date_param(end_date),
+                )
 
-            if end_date:
-                end_date_obj = BaseService.parse_date_param(end_date)
-                if end_date_obj:
-                    queryset = queryset.filter(timestamp__date__lte=end_date_obj)
+            queryset = Order.objects.filter(**BaseService.timestamp_range_filter(start_date, end_date))
 
             return list(queryset.annotate(
                 period=trunc_func('timestamp')
@@ -94,25 +98,34 @@ class SalesService(BaseService):
         end_date: Optional[Union[str, date]] = None
     ) -> List[Dict[str, Any]]:
         """指定された要素(天気や性別等)別の売上データを取得"""
-        queryset = Order.objects.all()
+        if ColumnarStore.is_enabled():
+            return ColumnarStore.get().sales_by_factor(factor_name_field, start_date, end_date)
 
-        if start_date:
-            start_date_obj = BaseService.parse_date_param(start_date)
-            if start_date_obj:
-                queryset = queryset.filter(timestamp__date__gte=start_date_obj)
+        if RollupService.is_covered(start_date, end_date):
+            return RollupService.get_sales_by_factor(
+                factor_name_field,
+                BaseService.parse_date_param(start_date),
+                BaseService.parse_date_param(end_date),
+            )
 
-        if end_date:
-            end_date_obj = BaseService.parse_date_param(end_date)
-            if end_date_obj:
-                queryset = queryset.filter(timestamp__date__lte=end_date_obj)
+        queryset = Order.objects.filter(**BaseService.timestamp_range_filter(start_date, end_date))
 
-        return list(queryset.values(
-            factor_name_field
-        ).annotate(
+        # マスターとJOINせずに外部キーで集計し、名称はレジストリで付ける
+        rows = queryset.values(f'{factor_field}_id').annotate(
             total_sales=Sum('total_price'),
             total_orders=Count('id'),
-            avg_order_value=Avg('total_price'),
-        ).order_by('-total_sales'))
+        ).order_by()
+
+        registry = DimensionRegistry.get()
+        merged = registry.merge(
+            rows,
+            lambda row: {factor_name_field: registry.name(factor_field, row[f'{factor_field}_id'])},
+            ('total_sales', 'total_orders'),
+        )
+        return [
+            {**row, 'avg_order_value': row['total_sales'] / row['total_orders']}
+            for row in sorted(merged, key=lambda row: -row['total_sales'])
+        ]
 
     @staticmethod
     def get_top_categories(
@@ -121,36 +134,48 @@ class SalesService(BaseService):
         end_date: Optional[Union[str, date]] = None
     ) -> List[Dict[str, Any]]:
         """トップカテゴリーを取得"""
-        queryset = OrderItem.objects.all()
-
-        if start_date:
-            start_date_obj = BaseService.parse_date_param(start_date)
-            if start_date_obj:
-                queryset = queryset.filter(order__timestamp__date__gte=start_date_obj)
-
-        if end_date:
-            end_date_obj = BaseService.parse_date_param(end_date)
-            if end_date_obj:
-                queryset = queryset.filter(order__timestamp__date__lte=end_date_obj)
+        if ColumnarStore.is_enabled():
+            return ColumnarStore.get().top_categories(limit, start_date, end_date)
+
+        if RollupService.is_covered(start_date, end_date):
+            return RollupService.get_top_categories(
+                limit,
+                BaseService.parse_date_param(start_date),
+                BaseService.parse_date_param(end_date),
+            )
+
+        queryset = OrderItem.objects.filter(
+            **BaseService.timestamp_range_filter(start_date, end_date, field='order__timestamp')
+        )
 
-        result = queryset.values(
-            'menu_item__category__name'
-        ).annotate(
+        rows = queryset.values('menu_item_id').annotate(
             total_sales=Sum('price'),
             items_sold=Count('id')
-        ).order_by('-total_sales')
+        ).order_by()
+
+        registry = DimensionRegistry.get()
+        result = sorted(
+            registry.merge(
+                rows,
+                lambda row: {'menu_item__category__name': registry.menu_item(row['menu_item_id'])['category_name']},
+                ('total_sales', 'items_sold'),
+            ),
+            key=lambda row: -row['total_sales'],
+        )
 
         # limitがNoneの場合は全てのカテゴリーを返す
         if limit is not None:
             result = result[:limit]
 
-        return list(result)
+        return result
 
     @staticmethod
     def calculate_takeout_rate(orders: QuerySet) -> float:
         """テイクアウト率を計算"""
         total_orders = orders.count()
-        takeout_orders = orders.filter(order_type__name='テイクアウト').count()
+        takeout_orders = orders.filter(
+            order_type_id__in=DimensionRegistry.get().ids_named('order_type', 'テイクアウト')
+        ).count()
         return (takeout_orders / total_orders * 100) if total_orders > 0 else 0
 
     @staticmethod
@@ -171,23 +196,35 @@ class SalesService(BaseService):
         end_date: Optional[Union[str, date]] = None
     ) -> List[Dict[str, Any]]:
         """天気と時間帯のクロス分析を取得"""
-        queryset = Order.objects.all()
-
-        if start_date:
-            start_date_obj = BaseService.parse_date_param(start_date)
-            if start_date_obj:
-                queryset = queryset.filter(timestamp__date__gte=start_date_obj)
-
-        if end_date:
-            end_date_obj = BaseService.parse_date_param(end_date)
-            if end_date_obj:
-                queryset = queryset.filter(timestamp__date__lte=end_date_obj)
-
-        return list(queryset.values(
-            'weather__name',
-            'time_slot__name'
-        ).annotate(
+        if ColumnarStore.is_enabled():
+            return ColumnarStore.get().weather_timeslot_analysis(start_date, end_date)
+
+        if RollupService.is_covered(start_date, end_date):
+            return RollupService.get_weather_timeslot_analysis(
+                BaseService.parse_date_param(start_date),
+                BaseService.parse_date_param(end_date),
+            )
+
+        queryset = Order.objects.filter(**BaseService.timestamp_range_filter(start_date, end_date))
+
+        rows = queryset.values('weather_id', 'time_slot_id').annotate(
             total_sales=Sum('total_price'),
             order_count=Count('id'),
-            avg_order_value=Avg('total_price'),
-        ).order_by('weather__name', 'time_slot__name'))
+        ).order_by()
+
+        registry = DimensionRegistry.get()
+        merged = registry.merge(
+            rows,
+            lambda row: {
+                'weather__name': registry.name('weather', row['weather_id']),
+                'time_slot__name': registry.name('time_slot', row['time_slot_id']),
+            },
+            ('total_sales', 'order_count'),
+        )
+        return [
+            {**row, 'avg_order_value': row['total_sales'] / row['order_count']}
+            for row in sorted(merged, key=lambda row: (
+                registry.sort_key('weather', row['weather__name']),
+                registry.sort_key('time_slot', row['time_slot__name']),
+            ))
+        ]
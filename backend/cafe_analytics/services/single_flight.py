@@ -0,0 +1,148 @@
+import functools
+import inspect
+import threading
+from datetime import date
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from django.conf import settings
+from rest_framework.exceptions import APIException
+
+from . import BaseService
+
+
+class CoalescedCallTimeout(APIException):
+    """同じ計算の完了を待つ間にタイムアウトした(APIでは503を返す)"""
+    status_code = 503
+    default_detail = 'The same analysis is still being computed. Please retry later.'
+    default_code = 'coalesced_call_timeout'
+
+
+class _Call:
+    """実行中の計算と、その結果を待つリクエストの間で共有する状態"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.owner = threading.get_ident()
+        # 完了を待っている呼び出しの数(タイムアウト時のメッセージに含める)
+        self.waiters = 0
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    同じキーの計算が実行中なら、後から来た呼び出しはその完了を待って同じ結果(または例外)を受け取る
+    計算は1回だけ実行されるため、キャッシュが空のときに同じ分析が集中してもDBへの負荷は1リクエスト分になる
+    """
+
+    _lock = threading.Lock()
+    _calls: Dict[Hashable, _Call] = {}
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return getattr(settings, 'SINGLE_FLIGHT_ENABLED', True)
+
+    @staticmethod
+    def get_timeout() -> float:
+        """実行中の計算を待つ最大秒数"""
+        return getattr(settings, 'SINGLE_FLIGHT_TIMEOUT', 30)
+
+    @classmethod
+    def do(cls, key: Hashable, func: Callable[[], Any]) -> Any:
+        """
+        keyの計算が実行中なら完了を待って結果を返し、無ければfuncを実行して結果を共有する
+
+        Args:
+            key (Hashable): 同じ計算を識別するキー
+            func (Callable[[], Any]): 結果を計算する関数
+
+        Returns:
+            Any: 計算結果
+        """
+        with cls._lock:
+            call = cls._calls.get(key)
+            if call is None:
+                call = cls._calls[key] = _Call()
+                leader = True
+            elif call.owner == threading.get_ident():
+                # 計算中のスレッド自身が同じキーを呼んだ場合は、待たずにそのまま実行する
+                return func()
+            else:
+                call.waiters += 1
+                leader = False
+
+        if leader:
+            try:
+                call.result = func()
+                return call.result
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with cls._lock:
+                    cls._calls.pop(key, None)
+                call.done.set()
+
+        try:
+            completed = call.done.wait(cls.get_timeout())
+        finally:
+            with cls._lock:
+                waiters = call.waiters
+                call.waiters -= 1
+        if not completed:
+            raise CoalescedCallTimeout(
+                f"{CoalescedCallTimeout.default_detail} ({waiters} requests are waiting for the same result)"
+            )
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+def _normalize(value: Any) -> Hashable:
+    """同じ条件の呼び出しが同じキーになるように引数を正規化する(日付の文字列はdateにする)"""
+    if isinstance(value, str):
+        parsed = BaseService.parse_date_param(value)
+        return parsed if parsed else value
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(item) for item in value)
+    if value is None or isinstance(value, (bool, int, float, date)):
+        return value
+    # クエリセット等はまとめない
+    raise TypeError(f"Unsupported argument: {type(value).__name__}")
+
+
+def _coalesce(method_name: str, func, skip_first: bool):
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not SingleFlight.is_enabled():
+            return func(*args, **kwargs)
+        try:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = list(bound.arguments.items())[1 if skip_first else 0:]
+            key = (method_name, tuple((name, _normalize(value)) for name, value in arguments))
+        except TypeError:
+            return func(*args, **kwargs)
+        return SingleFlight.do(key, lambda: func(*args, **kwargs))
+
+    return wrapper
+
+
+def coalesce_requests(*method_names: str):
+    """
+    指定したサービスクラスのメソッドを、同じメソッド・同じ引数の同時呼び出しで1回だけ計算するようにするクラスデコレーター
+    まとめる価値があるのはDBを読む重い計算だけのため、対象のメソッドは名前で指定する
+
+    例: @coalesce_requests('get_cached_dashboard')
+    """
+    def decorator(cls):
+        for name in method_names:
+            attr = vars(cls).get(name)
+            if not isinstance(attr, (staticmethod, classmethod)):
+                raise TypeError(f"{cls.__name__}.{name} is not a staticmethod or classmethod")
+            method_name = f"{cls.__name__}.{name}"
+            setattr(cls, name, type(attr)(_coalesce(method_name, attr.__func__, isinstance(attr, classmethod))))
+        return cls
+    return decorator
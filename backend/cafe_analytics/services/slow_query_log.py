@@ -0,0 +1,147 @@
+import functools
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import QuerySet
+from django.utils import timezone
+
+_state = threading.local()
+
+
+class SlowQueryLog:
+    """
+    処理時間がしきい値を超えたサービスメソッドと、そのメソッドが実行したSQL・パラメータ・実行計画を保持する
+    古い記録から捨てるリングバッファのため、メモリ使用量は一定
+    """
+
+    _lock = threading.Lock()
+    _entries: Optional[deque] = None
+
+    @staticmethod
+    def get_threshold() -> float:
+        """記録するメソッドの処理時間のしきい値(秒)。0以下なら記録しない"""
+        return getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 500) / 1000
+
+    @classmethod
+    def _buffer(cls) -> deque:
+        if cls._entries is None:
+            cls._entries = deque(maxlen=getattr(settings, 'SLOW_QUERY_LOG_SIZE', 100))
+        return cls._entries
+
+    @classmethod
+    def add(cls, entry: Dict[str, Any]) -> None:
+        with cls._lock:
+            cls._buffer().append(entry)
+
+    @classmethod
+    def get_entries(cls) -> List[Dict[str, Any]]:
+        """記録を新しい順に取得する"""
+        with cls._lock:
+            return list(reversed(cls._buffer()))
+
+    @classmethod
+    def clear(cls) -> None:
+        with cls._lock:
+            cls._entries = None
+
+
+def _to_json_value(value: Any) -> Any:
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_to_json_value(item) for item in value]
+    if isinstance(value, QuerySet):
+        # 文字列にするとクエリが実行されるため、モデル名だけを記録する
+        return f"<QuerySet {value.model.__name__}>"
+    return str(value)
+
+
+def explain(sql: str, params) -> List[Any]:
+    """SELECT文の実行計画を取得する(DBごとのEXPLAIN構文はDjangoの設定に従う)"""
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return []
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+            return [_to_json_value(row) for row in cursor.fetchall()]
+    except Exception as e:
+        return [f"EXPLAIN failed: {e}"]
+
+
+class _QueryRecorder:
+    """メソッドの実行中に発行したSQLと実行時間を記録する"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, params, many, time.perf_counter() - started))
+
+
+def _capture(method_name: str, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        threshold = SlowQueryLog.get_threshold()
+        # 記録中のメソッドから呼ばれた場合は、呼び出し元の記録に含める
+        if threshold <= 0 or getattr(_state, 'recording', False):
+            return func(*args, **kwargs)
+
+        recorder = _QueryRecorder()
+        _state.recording = True
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(recorder):
+                return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            _state.recording = False
+            if elapsed >= threshold:
+                _record(method_name, args, kwargs, elapsed, recorder.queries)
+
+    return wrapper
+
+
+def _record(method_name: str, args, kwargs, elapsed: float, queries) -> None:
+    """遅いメソッドのSQLを、時間のかかった順に実行計画と合わせて記録する"""
+    max_queries = getattr(settings, 'SLOW_QUERY_MAX_EXPLAINS', 5)
+    slowest = sorted(queries, key=lambda query: query[3], reverse=True)[:max_queries]
+    SlowQueryLog.add({
+        'method': method_name,
+        'arguments': {
+            'args': [_to_json_value(arg) for arg in args],
+            'kwargs': {key: _to_json_value(value) for key, value in kwargs.items()},
+        },
+        'duration_ms': round(elapsed * 1000, 1),
+        'query_count': len(queries),
+        'captured_at': timezone.now(),
+        'queries': [
+            {
+                'sql': sql,
+                'params': _to_json_value(params),
+                'duration_ms': round(duration * 1000, 1),
+                'explain': [] if many else explain(sql, params),
+            }
+            for sql, params, many, duration in slowest
+        ],
+    })
+
+
+def capture_slow_queries(cls):
+    """
+    サービスクラスの公開メソッドを、処理時間がSLOW_QUERY_THRESHOLD_MSを超えたときに
+    SQLと実行計画をSlowQueryLogに記録するようにするクラスデコレーター
+    """
+    for name, attr in list(vars(cls).items()):
+        if name.startswith('_') or not isinstance(attr, (staticmethod, classmethod)):
+            continue
+        method_name = f"{cls.__name__}.{name}"
+        setattr(cls, name, type(attr)(_capture(method_name, attr.__func__)))
+    return cls
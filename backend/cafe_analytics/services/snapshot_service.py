@@ -0,0 +1,294 @@
+import hashlib
+import json
+import os
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+from cafe_analytics.models import DataVersion, OrderItem
+from . import BaseService
+from .rollup_service import RollupService
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrowは任意の依存関係
+    pa = None
+
+FORMAT_PARQUET = 'parquet'
+FORMAT_ARROW = 'arrow'
+SNAPSHOT_FORMATS = (FORMAT_PARQUET, FORMAT_ARROW)
+
+MANIFEST_NAME = 'manifest.json'
+
+# スナップショットの列 (列名, values()のフィールド, 型名)
+SNAPSHOT_COLUMNS = (
+    ('order_id', 'order_id', 'string'),
+    ('timestamp', 'order__timestamp', 'timestamp'),
+    ('gender', 'order__gender__name', 'dictionary'),
+    ('order_type', 'order__order_type__name', 'dictionary'),
+    ('weather', 'order__weather__name', 'dictionary'),
+    ('time_slot', 'order__time_slot__name', 'dictionary'),
+    ('total_price', 'order__total_price', 'int32'),
+    ('discount', 'order__discount', 'int32'),
+    ('order_item_id', 'id', 'string'),
+    ('menu_item_id', 'menu_item_id', 'int32'),
+    ('menu_item', 'menu_item__name', 'dictionary'),
+    ('category', 'menu_item__category__name', 'dictionary'),
+    ('price', 'price', 'int32'),
+)
+
+
+def month_key(day: date) -> str:
+    return day.strftime('%Y-%m')
+
+
+def parse_month(value: str) -> Optional[date]:
+    """'YYYY-MM' を月初の日付に変換する。不正な場合はNone"""
+    try:
+        return datetime.strptime(value, '%Y-%m').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def month_range(month: date) -> Tuple[date, date]:
+    """月の初日と末日を返す"""
+    first = month.replace(day=1)
+    last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return first, last
+
+
+class SnapshotService(BaseService):
+    """
+    注文アイテムに注文と各マスターの名称を結合した行を、月ごとのParquetまたはArrow IPCファイルに書き出す
+    月内の日付のデータバージョン(DataVersion)から作った値をマニフェストに記録し、
+    データが変わった月のファイルだけを作り直す
+    """
+
+    @staticmethod
+    def check_available() -> None:
+        if pa is None:
+            raise ImproperlyConfigured('Snapshots require pyarrow (pip install pyarrow)')
+
+    @staticmethod
+    def get_directory() -> Path:
+        return Path(getattr(settings, 'SNAPSHOT_DIR', settings.BASE_DIR / 'snapshots'))
+
+    @staticmethod
+    def get_default_format() -> str:
+        return getattr(settings, 'SNAPSHOT_FORMAT', FORMAT_PARQUET)
+
+    @staticmethod
+    def get_filename(month: date, snapshot_format: str) -> str:
+        return f"orders_{month_key(month)}.{snapshot_format}"
+
+    @classmethod
+    def get_manifest(cls) -> Dict[str, Dict[str, Any]]:
+        """書き出し済みの月ごとのファイル名・行数・データバージョンを取得する"""
+        try:
+            with open(cls.get_directory() / MANIFEST_NAME, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    @classmethod
+    def _save_manifest(cls, manifest: Dict[str, Dict[str, Any]]) -> None:
+        path = cls.get_directory() / MANIFEST_NAME
+        temp_path = path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def get_fingerprints(start_month: date, end_month: date) -> Dict[str, str]:
+        """月ごとに、月内の日付のデータバージョンからハッシュ値を作る"""
+        versions = defaultdict(list)
+        rows = DataVersion.objects.filter(
+            date__range=[start_month, month_range(end_month)[1]]
+        ).values_list('date', 'version').order_by('date')
+        for day, version in rows:
+            versions[month_key(day)].append(f"{day.isoformat()}:{version}")
+        return {
+            month: hashlib.sha1(','.join(values).encode()).hexdigest()
+            for month, values in versions.items()
+        }
+
+    @staticmethod
+    def iter_months(start_month: date, end_month: date):
+        """開始月から終了月までの月初の日付を順に返す"""
+        current = start_month.replace(day=1)
+        while current <= end_month:
+            yield current
+            current = month_range(current)[1] + timedelta(days=1)
+
+    @staticmethod
+    def _schema():
+        types = {
+            'string': pa.string(),
+            'timestamp': pa.timestamp('us', tz='UTC'),
+            'dictionary': pa.dictionary(pa.int32(), pa.string()),
+            'int32': pa.int32(),
+        }
+        return pa.schema([(name, types[type_name]) for name, _, type_name in SNAPSHOT_COLUMNS])
+
+    @classmethod
+    def build_table(cls, month: date):
+        """月内の注文アイテムを注文日時順に読み込み、Arrowのテーブルを作る"""
+        cls.check_available()
+        first, last = month_range(month)
+        rows = OrderItem.objects.filter(
+            **cls.timestamp_range_filter(first, last, field='order__timestamp')
+        ).values_list(*(field for _, field, _ in SNAPSHOT_COLUMNS)).order_by('order__timestamp', 'order_id', 'id')
+
+        columns = [[] for _ in SNAPSHOT_COLUMNS]
+        for row in rows.iterator(chunk_size=5000):
+            for values, value in zip(columns, row):
+                values.append(value)
+
+        schema = cls._schema()
+        arrays = []
+        for values, field in zip(columns, schema):
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, type=field.type))
+        return pa.Table.from_arrays(arrays, schema=schema)
+
+    @classmethod
+    def write_table(cls, table, path: Path, snapshot_format: str) -> None:
+        """一時ファイルに書き出してから置き換える(読み込み中のファイルを壊さない)"""
+        temp_path = path.with_suffix(path.suffix + '.tmp')
+        try:
+            if snapshot_format == FORMAT_ARROW:
+                with pa.OSFile(str(temp_path), 'wb') as sink:
+                    with ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+            else:
+                pq.write_table(table, str(temp_path), compression='zstd')
+            os.replace(temp_path, path)
+        finally:
+            # 書き出しに失敗した場合は途中までの一時ファイルを残さない
+            temp_path.unlink(missing_ok=True)
+
+    @classmethod
+    def get_stale_months(
+        cls,
+        start_month: Optional[date] = None,
+        end_month: Optional[date] = None,
+        snapshot_format: Optional[str] = None
+    ) -> List[date]:
+        """ファイルが無い、または書き出した後にデータが変わった月を取得する"""
+        first_date, last_date = RollupService.get_order_date_bounds()
+        if first_date is None:
+            return []
+        start_month = (start_month or first_date).replace(day=1)
+        end_month = (end_month or last_date).replace(day=1)
+        snapshot_format = snapshot_format or cls.get_default_format()
+
+        manifest = cls.get_manifest()
+        fingerprints = cls.get_fingerprints(start_month, end_month)
+        directory = cls.get_directory()
+
+        stale = []
+        for month in cls.iter_months(start_month, end_month):
+            entry = manifest.get(month_key(month))
+            if (
+                entry is None
+                or entry.get('format') != snapshot_format
+                or entry.get('fingerprint') != fingerprints.get(month_key(month), '')
+                or not (directory / entry['file']).exists()
+            ):
+                stale.append(month)
+        return stale
+
+    @classmethod
+    def build(
+        cls,
+        start_month: Optional[date] = None,
+        end_month: Optional[date] = None,
+        snapshot_format: Optional[str] = None,
+        force: bool = False
+    ) -> Dict[str, Any]:
+        """
+        データが変わった月のスナップショットを書き出す
+
+        Args:
+            start_month (date, optional): 開始月. Defaults to None (最初の注文の月).
+            end_month (date, optional): 終了月. Defaults to None (最後の注文の月).
+            snapshot_format (str, optional): 'parquet'または'arrow'. Defaults to None (SNAPSHOT_FORMAT).
+            force (bool, optional): 変更の無い月も書き出すか. Defaults to False.
+
+        Returns:
+            Dict[str, Any]: 書き出した月と、変更が無く書き出さなかった月
+        """
+        cls.check_available()
+        snapshot_format = snapshot_format or cls.get_default_format()
+        if snapshot_format not in SNAPSHOT_FORMATS:
+            raise ValueError(f"Invalid format: {snapshot_format}")
+
+        first_date, last_date = RollupService.get_order_date_bounds()
+        if first_date is None:
+            return {'built': [], 'skipped': []}
+        start_month = (start_month or first_date).replace(day=1)
+        end_month = (end_month or last_date).replace(day=1)
+
+        months = list(cls.iter_months(start_month, end_month))
+        targets = months if force else cls.get_stale_months(start_month, end_month, snapshot_format)
+
+        directory = cls.get_directory()
+        directory.mkdir(parents=True, exist_ok=True)
+        manifest = cls.get_manifest()
+
+        for month in targets:
+            # 書き出し中に変更されても次回作り直されるよう、読み込む前のバージョンを記録する
+            fingerprint = cls.get_fingerprints(month, month).get(month_key(month), '')
+            table = cls.build_table(month)
+            filename = cls.get_filename(month, snapshot_format)
+            cls.write_table(table, directory / filename, snapshot_format)
+
+            previous = manifest.get(month_key(month))
+            if previous and previous['file'] != filename:
+                (directory / previous['file']).unlink(missing_ok=True)
+
+            manifest[month_key(month)] = {
+                'file': filename,
+                'format': snapshot_format,
+                'rows': table.num_rows,
+                'fingerprint': fingerprint,
+                'built_at': timezone.now().isoformat(),
+            }
+            cls._save_manifest(manifest)
+
+        return {
+            'built': [month_key(month) for month in targets],
+            'skipped': [month_key(month) for month in months if month not in targets],
+        }
+
+    @classmethod
+    def get_snapshot_path(cls, month: str) -> Optional[Path]:
+        """書き出し済みの月のファイルのパスを取得する。無ければNone"""
+        entry = cls.get_manifest().get(month)
+        if entry is None:
+            return None
+        path = cls.get_directory() / entry['file']
+        return path if path.exists() else None
+
+    @classmethod
+    def read_snapshot(cls, month: str):
+        """
+        書き出し済みの月のファイルをメモリマップで読み込む
+        Arrow IPCファイルはコピーせずに参照するため、大きな月でもすぐに読み込める
+        """
+        cls.check_available()
+        path = cls.get_snapshot_path(month)
+        if path is None:
+            raise FileNotFoundError(f"No snapshot for {month}")
+        if path.suffix == f'.{FORMAT_ARROW}':
+            return ipc.open_file(pa.memory_map(str(path), 'r')).read_all()
+        return pq.read_table(str(path), memory_map=True)
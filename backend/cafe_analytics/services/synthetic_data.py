@@ -0,0 +1,182 @@
+import json
+import random
+from collections import Counter, defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from .import_readers import iter_records
+from .import_service import BulkImporter, ImportStats, TIMESTAMP_FORMAT, parse_order_row, parse_order_item_row
+
+DEFAULT_ORDERS_SAMPLE = settings.BASE_DIR.parent / 'data' / 'orders_2024_04.csv'
+DEFAULT_ORDER_ITEMS_SAMPLE = settings.BASE_DIR / 'cafe_analytics' / 'data' / 'order_items_2024-04.json'
+DEFAULT_MASTER_DATA = settings.BASE_DIR / 'cafe_analytics' / 'data' / 'master_data_2024-04.json'
+
+
+class SampleProfile:
+    """
+    サンプルの注文データから、合成データの元になる分布を集計する
+    日ごとの注文数と天気、注文ごとの (時間帯, 時, 性別, 注文タイプ)、時間帯ごとの商品、
+    注文あたりの商品数、割引率をサンプルの値のまま保持し、そこから抽出する
+    """
+
+    def __init__(
+        self,
+        orders_path: str = DEFAULT_ORDERS_SAMPLE,
+        order_items_path: str = DEFAULT_ORDER_ITEMS_SAMPLE,
+        master_data_path: str = DEFAULT_MASTER_DATA
+    ):
+        with open(master_data_path, encoding='utf-8') as f:
+            self.master_data = json.load(f)
+        self.menu_prices = {row['id']: row['price'] for row in self.master_data['menu_items']}
+
+        orders = [parse_order_row(row) for row in iter_records(str(orders_path))]
+        baskets = defaultdict(list)
+        for row in iter_records(str(order_items_path)):
+            item = parse_order_item_row(row)
+            baskets[item['order_id']].append(item)
+
+        day_counts = Counter()
+        day_weather = {}
+        self.templates: List[Tuple[int, int, int, int]] = []
+        self.items_by_time_slot: Dict[int, List[int]] = defaultdict(list)
+        self.basket_sizes: List[int] = []
+        self.discount_rates: List[float] = []
+
+        for order in orders:
+            local = timezone.localtime(order['timestamp'])
+            day_counts[local.date()] += 1
+            day_weather[local.date()] = order['weather_id']
+            self.templates.append((order['time_slot_id'], local.hour, order['gender_id'], order['order_type_id']))
+
+            items = baskets.get(order['id'], [])
+            if not items:
+                continue
+            self.basket_sizes.append(len(items))
+            self.items_by_time_slot[order['time_slot_id']].extend(item['menu_item_id'] for item in items)
+            subtotal = sum(item['price'] for item in items)
+            self.discount_rates.append(order['discount'] / subtotal if subtotal else 0.0)
+
+        if not orders or not self.basket_sizes:
+            raise ValueError('Sample data contains no orders with items')
+
+        # 1日の注文数と天気はサンプルの日単位で組にして抽出する
+        self.days = [(count, day_weather[day]) for day, count in sorted(day_counts.items())]
+        self.sample_month = min(day_counts).replace(day=1)
+
+
+class SyntheticDataGenerator:
+    """
+    SampleProfileの分布に従って、指定した倍率の注文と注文アイテムを日ごとに生成する
+    日付とシードから乱数を初期化するため、同じ条件なら何度実行しても同じデータになる
+    行はimport_dataと同じ形式のため、BulkImporterでそのまま取り込める
+    """
+
+    def __init__(self, profile: SampleProfile, scale: float = 1.0, seed: int = 0, id_prefix: str = 'S'):
+        self.profile = profile
+        self.scale = scale
+        self.seed = seed
+        self.id_prefix = id_prefix
+
+    def generate_day(self, day: date) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """1日分の注文と注文アイテムの行を生成する"""
+        profile = self.profile
+        rng = random.Random(f"{self.seed}:{day.isoformat()}")
+
+        sample_count, weather_id = rng.choice(profile.days)
+        count = max(int(round(sample_count * self.scale)), 0)
+
+        timestamps = []
+        for time_slot_id, hour, gender_id, order_type_id in rng.choices(profile.templates, k=count):
+            moment = datetime.combine(day, time(hour)) + timedelta(seconds=rng.randrange(3600))
+            timestamps.append((moment, time_slot_id, gender_id, order_type_id))
+        timestamps.sort()
+
+        orders, items = [], []
+        for number, (moment, time_slot_id, gender_id, order_type_id) in enumerate(timestamps, start=1):
+            order_id = f"{self.id_prefix}{day:%Y%m%d}-{number:05d}"
+            menu_item_ids = rng.choices(
+                profile.items_by_time_slot[time_slot_id], k=rng.choice(profile.basket_sizes)
+            )
+            subtotal = 0
+            for position, menu_item_id in enumerate(menu_item_ids, start=1):
+                price = profile.menu_prices[menu_item_id]
+                subtotal += price
+                items.append({
+                    'id': f"{order_id}-{position:02d}",
+                    'order_id': order_id,
+                    'menu_item_id': menu_item_id,
+                    'price': price,
+                })
+
+            # 割引は10円単位
+            discount = int(subtotal * rng.choice(profile.discount_rates)) // 10 * 10
+            orders.append({
+                'id': order_id,
+                'timestamp': moment.strftime(TIMESTAMP_FORMAT),
+                'gender_id': gender_id,
+                'order_type_id': order_type_id,
+                'weather_id': weather_id,
+                'time_slot_id': time_slot_id,
+                'total_price': subtotal - discount,
+                'discount': discount,
+            })
+        return orders, items
+
+    def iter_months(self, start_month: date, months: int) -> Iterator[Tuple[date, List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        """開始月から指定した月数分、月ごとに (月初の日付, 注文, 注文アイテム) を返す"""
+        month = start_month.replace(day=1)
+        for _ in range(months):
+            next_month = (month + timedelta(days=32)).replace(day=1)
+            orders, items = [], []
+            day = month
+            while day < next_month:
+                day_orders, day_items = self.generate_day(day)
+                orders.extend(day_orders)
+                items.extend(day_items)
+                day += timedelta(days=1)
+            yield month, orders, items
+            month = next_month
+
+    def import_months(
+        self,
+        importer: BulkImporter,
+        start_month: date,
+        months: int,
+        progress: Optional[Callable[[ImportStats], None]] = None
+    ) -> Dict[str, int]:
+        """
+        生成した注文と注文アイテムを月ごとに取り込み、最後にロールアップを更新する
+
+        Args:
+            importer (BulkImporter): 取り込みに使うインポーター
+            start_month (date): 開始月
+            months (int): 月数
+            progress (Callable[[ImportStats], None], optional): 月ごとの取り込み結果を受け取る関数. Defaults to None.
+
+        Returns:
+            Dict[str, int]: 登録した注文と注文アイテムの件数
+        """
+        importer.import_master_data(self.profile.master_data)
+
+        summary = {'orders': 0, 'order_items': 0}
+        for month, orders, items in self.iter_months(start_month, months):
+            for key, stats in (
+                ('orders', importer.import_orders(orders, label=f'orders {month:%Y-%m}')),
+                ('order_items', importer.import_order_items(items, label=f'order_items {month:%Y-%m}')),
+            ):
+                summary[key] += stats.written
+                if progress:
+                    progress(stats)
+
+        importer.finalize()
+        return summary
+
+
+def next_month_after(day: Optional[date]) -> Optional[date]:
+    """日付の翌月の月初を返す"""
+    if day is None:
+        return None
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
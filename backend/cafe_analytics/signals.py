@@ -0,0 +1,164 @@
+import threading
+
+from django.db.models import Count, Sum
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from .models import Order, OrderItem, MenuItem
+from .services.cache_service import DashboardCache
+from .services.dimensions import DimensionRegistry, DIMENSION_MODELS
+from .services.rollup_service import RollupUpdater, SALES_DIMENSIONS, to_local_date, to_local_hour
+
+_state = threading.local()
+
+
+def _deleting_orders() -> set:
+    """削除処理中の注文IDを返す(カスケード削除時の二重計上を防ぐ)"""
+    if not hasattr(_state, 'deleting_orders'):
+        _state.deleting_orders = set()
+    return _state.deleting_orders
+
+
+def _order_dimensions(values) -> tuple:
+    """売上ロールアップのキー(時刻と集計軸)"""
+    return (to_local_hour(values['timestamp']), *(values[field] for field in SALES_DIMENSIONS))
+
+
+def _order_item_totals(order_id: str):
+    """注文に含まれるアイテムをメニューアイテム別に集計"""
+    return OrderItem.objects.filter(order_id=order_id).values('menu_item_id').annotate(
+        count=Count('id'),
+        total=Sum('price'),
+    ).order_by()
+
+
+@receiver(pre_save, sender=Order)
+def capture_previous_order(sender, instance, raw=False, **kwargs):
+    """更新前の注文内容を保持"""
+    if raw:
+        instance._rollup_previous = None
+        return
+    instance._rollup_previous = Order.objects.filter(pk=instance.pk).values(
+        'timestamp', 'total_price', 'discount', *SALES_DIMENSIONS
+    ).first()
+
+
+@receiver(post_save, sender=Order)
+def apply_order_save(sender, instance, created, raw=False, **kwargs):
+    """注文の作成・更新をロールアップに反映"""
+    if raw:
+        return
+
+    previous = getattr(instance, '_rollup_previous', None)
+    instance._rollup_previous = None
+    current = {field: getattr(instance, field) for field in ('timestamp', *SALES_DIMENSIONS)}
+    new_date = to_local_date(instance.timestamp)
+
+    with RollupUpdater.collect() as updater:
+        if previous:
+            old_date = to_local_date(previous['timestamp'])
+            updater.add_order(
+                old_date, _order_dimensions(previous),
+                previous['total_price'], previous['discount'], sign=-1,
+            )
+            # 注文日が変わった場合はアイテムの計上日も移動する
+            if old_date != new_date:
+                for row in _order_item_totals(instance.pk):
+                    updater.add_item(old_date, row['menu_item_id'], row['total'], sign=-1, count=row['count'])
+                    updater.add_item(new_date, row['menu_item_id'], row['total'], count=row['count'])
+
+        updater.add_order(
+            new_date, _order_dimensions(current),
+            instance.total_price, instance.discount,
+        )
+        updater.order_dates[instance.pk] = new_date
+
+
+@receiver(pre_delete, sender=Order)
+def capture_deleted_order(sender, instance, **kwargs):
+    """削除される注文のアイテム集計を保持"""
+    _deleting_orders().add(instance.pk)
+    instance._rollup_items = list(_order_item_totals(instance.pk))
+
+
+@receiver(post_delete, sender=Order)
+def apply_order_delete(sender, instance, **kwargs):
+    """注文の削除をロールアップに反映"""
+    _deleting_orders().discard(instance.pk)
+    order_date = to_local_date(instance.timestamp)
+
+    with RollupUpdater.collect() as updater:
+        updater.order_dates.pop(instance.pk, None)
+        updater.add_order(
+            order_date,
+            _order_dimensions({field: getattr(instance, field) for field in ('timestamp', *SALES_DIMENSIONS)}),
+            instance.total_price, instance.discount, sign=-1,
+        )
+        for row in getattr(instance, '_rollup_items', []):
+            updater.add_item(order_date, row['menu_item_id'], row['total'], sign=-1, count=row['count'])
+
+
+def _order_date(order_id: str, updater: RollupUpdater):
+    """注文日を取得(同じ更新器内ではキャッシュする)"""
+    if order_id not in updater.order_dates:
+        timestamp = Order.objects.filter(pk=order_id).values_list('timestamp', flat=True).first()
+        updater.order_dates[order_id] = to_local_date(timestamp) if timestamp else None
+    return updater.order_dates[order_id]
+
+
+@receiver(pre_save, sender=OrderItem)
+def capture_previous_order_item(sender, instance, raw=False, **kwargs):
+    """更新前の注文アイテム内容を保持"""
+    if raw:
+        instance._rollup_previous = None
+        return
+    instance._rollup_previous = OrderItem.objects.filter(pk=instance.pk).values(
+        'order_id', 'menu_item_id', 'price'
+    ).first()
+
+
+@receiver(post_save, sender=OrderItem)
+def apply_order_item_save(sender, instance, created, raw=False, **kwargs):
+    """注文アイテムの作成・更新をロールアップに反映"""
+    if raw:
+        return
+
+    previous = getattr(instance, '_rollup_previous', None)
+    instance._rollup_previous = None
+
+    with RollupUpdater.collect() as updater:
+        if previous:
+            old_date = _order_date(previous['order_id'], updater)
+            if old_date:
+                updater.add_item(old_date, previous['menu_item_id'], previous['price'], sign=-1)
+
+        new_date = _order_date(instance.order_id, updater)
+        if new_date:
+            updater.add_item(new_date, instance.menu_item_id, instance.price)
+
+
+@receiver(post_delete, sender=OrderItem)
+def apply_order_item_delete(sender, instance, **kwargs):
+    """注文アイテムの削除をロールアップに反映"""
+    if instance.order_id in _deleting_orders():
+        return
+
+    with RollupUpdater.collect() as updater:
+        order_date = _order_date(instance.order_id, updater)
+        if order_date:
+            updater.add_item(order_date, instance.menu_item_id, instance.price, sign=-1)
+
+
+def invalidate_dimensions(sender, created=False, raw=False, **kwargs):
+    """
+    マスターの保存・削除で名称のレジストリを破棄
+    既存のマスターの変更は集計済みの名称を変えるため、全期間のデータバージョンも上げる
+    """
+    DimensionRegistry.invalidate()
+    if not created and not raw:
+        DashboardCache.bump_all_versions()
+
+
+for _model in (*DIMENSION_MODELS.values(), MenuItem):
+    post_save.connect(invalidate_dimensions, sender=_model)
+    post_delete.connect(invalidate_dimensions, sender=_model)
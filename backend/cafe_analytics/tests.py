@@ -1,3 +1,1078 @@
-from django.test import TestCase
+import csv
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+import threading
+import time
+from datetime import date, datetime, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import signals
+from .models import (
+    Category, Gender, OrderType, WeatherType, TimeSlot,
+    MenuItem, Order, OrderItem, DailySalesRollup, DailyMenuItemRollup, RollupDay,
+)
+from .services import BaseService, columnar_store, execution, snapshot_service
+from .services.analysis_service import AnalysisService
+from .services.basket_engine import BasketEngine
+from .services.cache_service import DashboardCache
+from .services.columnar_store import ColumnarStore
+from .services.dashboard_service import DashboardService
+from .services.dimensions import DimensionRegistry
+from .services.export_service import ExportService, ORDER_EXPORT_FIELDS, ORDER_ITEM_EXPORT_FIELDS
+from .services.import_service import BulkImporter, parse_source_file
+from .services.product_service import ProductService
+from .services.rollup_service import RollupService, RollupUpdater, SALES_KEY_FIELDS
+from .services.sales_service import SalesService
+from .services.snapshot_service import SnapshotService
+from .services.single_flight import CoalescedCallTimeout, SingleFlight, coalesce_requests
+from .services.slow_query_log import SlowQueryLog
+from .services.synthetic_data import SampleProfile, SyntheticDataGenerator
+
+
+def create_master_data():
+    """テスト用のマスターデータを作成"""
+    drink = Category.objects.create(id=1, name='ドリンク')
+    cake = Category.objects.create(id=2, name='ケーキ')
+    Gender.objects.create(id=1, name='男')
+    Gender.objects.create(id=2, name='女')
+    OrderType.objects.create(id=1, name='店内')
+    OrderType.objects.create(id=2, name='テイクアウト')
+    WeatherType.objects.create(id=1, name='晴れ')
+    WeatherType.objects.create(id=2, name='雨')
+    TimeSlot.objects.create(id=1, name='モーニング')
+    TimeSlot.objects.create(id=2, name='ランチ')
+    MenuItem.objects.create(id=1, name='カフェラテ', price=420, category=drink)
+    MenuItem.objects.create(id=2, name='チーズケーキ', price=480, category=cake)
+
+
+def create_orders(day: date, count: int, prefix: str = ''):
+    """指定日に注文とアイテムを作成"""
+    for i in range(count):
+        order_id = f"{prefix}{day:%Y%m%d}-{i:03d}"
+        order = Order.objects.create(
+            id=order_id,
+            timestamp=timezone.make_aware(datetime.combine(day, datetime.min.time()) + timedelta(hours=8 + i % 10)),
+            gender_id=1 + i % 2,
+            order_type_id=1 + i % 2,
+            weather_id=1 + i % 2,
+            time_slot_id=1 + i % 2,
+            total_price=900,
+            discount=50 * (i % 3),
+        )
+        OrderItem.objects.create(id=f"{order_id}-01", order=order, menu_item_id=1, price=420)
+        OrderItem.objects.create(id=f"{order_id}-02", order=order, menu_item_id=2, price=480)
+
+
+class DashboardQueryCountTests(TestCase):
+    """ダッシュボードが注文件数に関わらず固定数のクエリで計算されることを確認"""
+
+    target_date = date(2024, 4, 10)
+
+    @classmethod
+    def setUpTestData(cls):
+        create_master_data()
+        for offset in range(-3, 4):
+            create_orders(cls.target_date + timedelta(days=offset), 5)
+
+    def setUp(self):
+        # マスターの名称はプロセス内で1回だけ読み込むため、計測前に読み込んでおく
+        DimensionRegistry.get()
+
+    def assertDashboardQueries(self, num):
+        with self.assertNumQueries(num):
+            DashboardService.get_daily_dashboard(self.target_date)
+        with self.assertNumQueries(num):
+            DashboardService.get_weekly_dashboard(self.target_date)
+        with self.assertNumQueries(num):
+            DashboardService.get_monthly_dashboard(self.target_date)
+
+    def test_dashboards_use_fixed_number_of_queries(self):
+        self.assertDashboardQueries(5)
+
+    def test_query_count_does_not_grow_with_order_volume(self):
+        create_orders(self.target_date, 30, prefix='extra-')
+        self.assertDashboardQueries(5)
+
+    def test_rollup_backed_dashboards_match_raw_orders(self):
+        builders = (
+            DashboardService.get_daily_dashboard,
+            DashboardService.get_weekly_dashboard,
+            DashboardService.get_monthly_dashboard,
+        )
+        raw = [builder(self.target_date) for builder in builders]
+        RollupService.build(date(2024, 4, 1), date(2024, 4, 30))
+
+        orders_table = connection.ops.quote_name('orders')
+        for builder, expected in zip(builders, raw):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(builder(self.target_date), expected)
+            # 注文テーブルは注文一覧の先頭ページの取得にのみ使う
+            self.assertFalse(any(
+                orders_table in query['sql'] and 'GROUP BY' in query['sql'] for query in queries.captured_queries
+            ))
+
+    @override_settings(DASHBOARD_ORDERS_PAGE_SIZE=10)
+    def test_only_first_page_of_orders_is_read(self):
+        with CaptureQueriesContext(connection) as queries:
+            DashboardService.get_monthly_dashboard(self.target_date)
+        order_queries = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and 'GROUP BY' not in query['sql']
+            and f"FROM {connection.ops.quote_name('orders')}" in query['sql']
+        ]
+        self.assertEqual(len(order_queries), 1)
+        self.assertIn('LIMIT 11', order_queries[0])
+
+    @override_settings(DASHBOARD_ORDERS_PAGE_SIZE=10)
+    def test_orders_are_limited_to_first_page(self):
+        dashboard = DashboardService.get_monthly_dashboard(self.target_date)
+
+        self.assertEqual(dashboard['sales_summary']['total_orders'], 35)
+        self.assertEqual(len(dashboard['orders']), 10)
+        self.assertIsNotNone(dashboard['orders_cursor'])
+
+        # カーソルから続きを取得すると、残りの注文が重複なく返る
+        response = self.client.get('/api/orders/', {
+            'start_date': '2024-04-01', 'end_date': '2024-04-30',
+            'cursor': dashboard['orders_cursor'], 'page_size': 100,
+        })
+        order_ids = [order['id'] for order in dashboard['orders'] + response.data['results']]
+        self.assertEqual(len(set(order_ids)), 35)
+
+    def test_stream_returns_all_orders_in_period(self):
+        response = self.client.get('/api/orders/stream/', {'start_date': '2024-04-10', 'end_date': '2024-04-10'})
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(len(json.loads(lines[0])['items']), 2)
+
+    def test_daily_dashboard_values(self):
+        dashboard = DashboardService.get_daily_dashboard(self.target_date)
+
+        self.assertEqual(dashboard['sales_summary']['total_orders'], 5)
+        self.assertEqual(dashboard['sales_summary']['total_amount'], 4500)
+        self.assertEqual(dashboard['sales_summary']['total_discount'], 200)
+        self.assertEqual(dashboard['takeout_rate'], 40.0)
+        self.assertEqual(len(dashboard['orders']), 5)
+        self.assertEqual(len(dashboard['orders'][0]['items']), 2)
+        self.assertEqual(
+            {row['menu_item__category__name']: row['items_sold'] for row in dashboard['popular_items']},
+            {'ドリンク': 5, 'ケーキ': 5},
+        )
+
+
+class RollupParityTests(TestCase):
+    """ロールアップからの集計結果が、生の注文からの集計結果と一致することを確認"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_master_data()
+        create_orders(date(2024, 4, 8), 5)
+        create_orders(date(2024, 4, 20), 3)
+        create_orders(date(2024, 5, 2), 4)
+
+    def results(self):
+        results = {}
+        for start, end in (('2024-04-01', '2024-05-31'), ('2024-04-08', '2024-04-08'), ('2024-04-09', '2024-05-02')):
+            results[start, end, 'summary'] = SalesService.get_sales_summary(start, end)
+            for period in ('daily', 'weekly', 'monthly'):
+                results[start, end, period] = SalesService.get_period_sales(period, start, end)
+            results[start, end, 'categories'] = SalesService.get_top_categories(None, start, end)
+        return results
+
+    def test_rollups_match_raw_orders(self):
+        RollupDay.objects.all().delete()
+        self.assertFalse(RollupService.is_covered('2024-04-01', '2024-05-31'))
+        raw = self.results()
+
+        RollupService.build(date(2024, 4, 1), date(2024, 5, 31))
+        self.assertTrue(RollupService.is_covered('2024-04-01', '2024-05-31'))
+        with CaptureQueriesContext(connection) as queries:
+            from_rollups = self.results()
+
+        self.assertFalse([query for query in queries if '"orders"' in query['sql']])
+        for key, expected in raw.items():
+            with self.subTest(key=key):
+                self.assertEqual(from_rollups[key], expected)
+
+
+class RollupUpdaterTests(TestCase):
+    """注文の変更をシグナルで差分適用したロールアップが、集計し直した結果と一致することを確認"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_master_data()
+        create_orders(date(2024, 4, 8), 4)
+        create_orders(date(2024, 4, 9), 2)
+        RollupService.build(date(2024, 4, 1), date(2024, 4, 30))
+
+    def rollup_rows(self):
+        sales = DailySalesRollup.objects.filter(order_count__gt=0).values_list(
+            'date', *SALES_KEY_FIELDS, 'order_count', 'total_sales', 'total_discount'
+        )
+        items = DailyMenuItemRollup.objects.filter(items_sold__gt=0).values_list(
+            'date', 'menu_item_id', 'items_sold', 'total_sales'
+        )
+        return sorted(sales), sorted(items)
+
+    def assertMatchesBuild(self):
+        incremental = self.rollup_rows()
+        RollupService.build(date(2024, 4, 1), date(2024, 4, 30))
+        self.assertEqual(incremental, self.rollup_rows())
+
+    def test_order_create(self):
+        create_orders(date(2024, 4, 10), 3, prefix='new-')
+        self.assertMatchesBuild()
+
+    def test_order_update_with_changed_timestamp(self):
+        order = Order.objects.get(id='20240408-001')
+        order.timestamp = timezone.make_aware(datetime(2024, 4, 9, 15, 30))
+        order.weather_id = 1
+        order.total_price = 1200
+        order.save()
+        self.assertMatchesBuild()
+
+    def test_order_delete_cascades_items_once(self):
+        Order.objects.get(id='20240408-002').delete()
+        self.assertEqual(signals._deleting_orders(), set())
+        self.assertMatchesBuild()
+
+        Order.objects.filter(id__startswith='20240409').delete()
+        self.assertEqual(signals._deleting_orders(), set())
+        self.assertMatchesBuild()
+
+    def test_order_item_changes(self):
+        OrderItem.objects.get(id='20240408-000-02').delete()
+        item = OrderItem.objects.get(id='20240408-001-01')
+        item.menu_item_id = 2
+        item.price = 480
+        item.save()
+        OrderItem.objects.create(id='20240409-000-03', order_id='20240409-000', menu_item_id=1, price=420)
+        self.assertMatchesBuild()
+
+    def test_deferred_changes(self):
+        with RollupUpdater.deferred():
+            create_orders(date(2024, 4, 10), 2, prefix='new-')
+            Order.objects.get(id='20240408-003').delete()
+            OrderItem.objects.get(id='20240409-001-01').delete()
+        self.assertMatchesBuild()
+
+    def test_concurrently_created_row_is_updated(self):
+        # 別のトランザクションが先に行を作成した状況(更新0件の後に一意制約違反)を再現する
+        update = QuerySet.update
+        calls = []
+
+        def lost_race(queryset, **kwargs):
+            calls.append(kwargs)
+            return 0 if len(calls) == 1 else update(queryset, **kwargs)
+
+        lookup = {'date': date(2024, 4, 8), 'menu_item_id': 1}
+        before = DailyMenuItemRollup.objects.get(**lookup)
+        with mock.patch.object(QuerySet, 'update', lost_race):
+            RollupUpdater._apply(DailyMenuItemRollup, lookup, {'items_sold': 1, 'total_sales': 420})
+
+        after = DailyMenuItemRollup.objects.get(**lookup)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual((after.items_sold, after.total_sales), (before.items_sold + 1, before.total_sales + 420))
+
+    def test_check_rollups_command(self):
+        out = StringIO()
+        call_command('check_rollups', stdout=out)
+        self.assertIn('All rollups are consistent', out.getvalue())
+
+        DailyMenuItemRollup.objects.filter(date=date(2024, 4, 9), menu_item_id=2).update(total_sales=1)
+        out = StringIO()
+        call_command('check_rollups', stdout=out)
+        self.assertIn('expected=(2, 960) actual=(2, 1)', out.getvalue())
+        self.assertIn('Found drift in 1 days', out.getvalue())
+
+        out = StringIO()
+        call_command('check_rollups', '--repair', stdout=out)
+        self.assertIn('Repaired 1 days', out.getvalue())
+        self.assertMatchesBuild()
+
+
+@override_settings(DASHBOARD_EXECUTION_MODE='concurrent', DASHBOARD_QUERY_WORKERS=2)
+class ConcurrentExecutionTests(TransactionTestCase):
+    """concurrentモードのrun_queriesが、順に実行した場合と同じ結果を返し、ワーカーの接続を閉じることを確認"""
+
+    def setUp(self):
+        create_master_data()
+        create_orders(date(2024, 4, 8), 4)
+        create_orders(date(2024, 4, 10), 3)
+
+    def test_results_match_serial_mode(self):
+        concurrent = DashboardService.get_weekly_dashboard('2024-04-10')
+        with override_settings(DASHBOARD_EXECUTION_MODE='serial'):
+            serial = DashboardService.get_weekly_dashboard('2024-04-10')
+        self.assertEqual(concurrent, serial)
+
+        threads = execution.run_queries({
+            name: lambda: threading.current_thread().name for name in ('first', 'second', 'third')
+        })
+        self.assertEqual(list(threads), ['first', 'second', 'third'])
+        self.assertTrue(threads['first'].startswith('dashboard-query'))
+        self.assertTrue(threads['second'].startswith('dashboard-query'))
+        # 1リクエストのワーカー数を超えた分は呼び出し元のスレッドで実行する
+        self.assertEqual(threads['third'], threading.current_thread().name)
+
+    def test_worker_exceptions_propagate(self):
+        def fail():
+            raise ValueError('query failed')
+
+        with self.assertRaisesMessage(ValueError, 'query failed'):
+            execution.run_queries({'ok': lambda: 1, 'fail': fail})
+
+        # 失敗したワーカーの枠も解放されている
+        _, db_slots = execution._get_pool()
+        self.assertEqual(db_slots._value, settings.DASHBOARD_MAX_DB_WORKERS)
+
+    def test_runs_inline_when_no_db_slots_are_free(self):
+        executor = mock.Mock()
+        db_slots = threading.BoundedSemaphore(1)
+        db_slots.acquire()
+        with mock.patch.object(execution, '_get_pool', return_value=(executor, db_slots)):
+            threads = execution.run_queries({
+                'first': lambda: threading.current_thread().name,
+                'second': lambda: threading.current_thread().name,
+            })
+        executor.submit.assert_not_called()
+        self.assertEqual(set(threads.values()), {threading.current_thread().name})
+
+    def test_worker_connections_are_closed(self):
+        used = []
+
+        def count_orders():
+            used.append(connections['default'])
+            return Order.objects.count()
+
+        self.assertEqual(execution.run_queries({'first': count_orders, 'second': count_orders}), {
+            'first': 7, 'second': 7,
+        })
+        worker_connections = [conn for conn in used if conn is not connection]
+        self.assertTrue(worker_connections)
+        for conn in worker_connections:
+            self.assertIsNone(conn.connection)
+
+
+class TimestampIndexTests(TestCase):
+    """期間での絞り込みがtimestampのインデックスを使うことをEXPLAINで確認"""
+
+    target_date = date(2024, 4, 10)
+
+    @classmethod
+    def setUpTestData(cls):
+        create_master_data()
+        for offset in range(-15, 15):
+            create_orders(cls.target_date + timedelta(days=offset), 3)
+
+    def test_range_filter_is_half_open(self):
+        filters = BaseService.timestamp_range_filter(self.target_date, self.target_date)
+
+        self.assertEqual(set(filters), {'timestamp__gte', 'timestamp__lt'})
+        self.assertEqual(filters['timestamp__lt'] - filters['timestamp__gte'], timedelta(days=1))
+        self.assertEqual(Order.objects.filter(**filters).count(), 3)
+
+    def test_period_filter_uses_timestamp_index(self):
+        plan = Order.objects.filter(
+            **BaseService.timestamp_range_filter(self.target_date, self.target_date)
+        ).explain()
+
+        self.assertRegex(plan, r'orders_ts(_order_type|_time_slot)?_idx')
+
+
+class OrderCursorPaginationTests(TestCase):
+    """注文一覧のカーソルページネーションが全件を重複なく返し、ページごとのクエリ数が一定であることを確認"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_master_data()
+        for offset in range(3):
+            create_orders(date(2024, 4, 10) + timedelta(days=offset), 10)
+
+    def setUp(self):
+        # マスターの名称はプロセス内で1回だけ読み込むため、計測前に読み込んでおく
+        DimensionRegistry.get()
+
+    def test_pages_cover_all_orders_with_fixed_queries(self):
+        url = '/api/orders/?page_size=7'
+        order_ids = []
+        while url:
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            order_ids.extend(order['id'] for order in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(order_ids, list(Order.objects.order_by('timestamp', 'id').values_list('id', flat=True)))
+
+    def test_results_include_item_details(self):
+        response = self.client.get('/api/orders/?page_size=1')
+        order = response.data['results'][0]
+
+        self.assertEqual(order['final_price'], order['total_price'] + order['discount'])
+        self.assertEqual(
+            [(item['menu_item_name'], item['category_name']) for item in order['items']],
+            [('カフェラテ', 'ドリンク'), ('チーズケーキ', 'ケーキ')],
+        )
+
+    def test_invalid_cursor_returns_not_found(self):
+        self.assertEqual(self.client.get('/api/orders/?cursor=invalid').status_code, 404)
+
+
+class RequestMetricsTests(TestCase):
+    """ビューごとの計測結果がヒストグラムとデバッグ用ヘッダーに記録されることを確認"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_master_data()
+        create_orders(date(2024, 4, 10), 5)
+
+    def setUp(self):
+        # マスターの名称はプロセス内で1回だけ読み込むため、計測前に読み込んでおく
+        DimensionRegistry.get()
+
+    @override_settings(REQUEST_METRICS_DEBUG_HEADER=True)
+    def test_debug_header_reports_query_count(self):
+        response = self.client.get('/api/orders/?page_size=2')
+
+        self.assertTrue(response['X-Request-Metrics'].startswith('queries=2;'))
+        self.assertIn(f"size={len(response.content)}", response['X-Request-Metrics'])
+
+    def test_metrics_endpoint_exposes_histograms_per_view(self):
+        self.client.get('/api/sales/sales_summary/')
+        response = self.client.get('/api/metrics/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('cafe_request_sql_queries_count{view="sales-sales-summary"}', response.content.decode())
+        self.assertNotIn('X-Request-Metrics', response)
+
+
+class DimensionRegistryTests(TestCase):
+    """集計がマスターとJOINせずにIDで行われ、マスターの変更がシグナルで名称に反映されることを確認"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_master_data()
+        create_orders(date(2024, 4, 10), 4)
+
+    def test_aggregates_without_joins_and_reflects_renames(self):
+        DimensionRegistry.get()
+        with CaptureQueriesContext(connection) as queries:
+            rows = SalesService.get_sales_by_factor('weather', 'weather__name', '2024-04-10', '2024-04-10')
+        self.assertEqual({row['weather__name']: row['total_orders'] for row in rows}, {'晴れ': 2, '雨': 2})
+        self.assertFalse(any('JOIN' in query['sql'] for query in queries.captured_queries))
+
+        weather = WeatherType.objects.get(pk=2)
+        weather.name = '大雨'
+        weather.save()
+        rows = SalesService.get_sales_by_factor('weather', 'weather__name', '2024-04-10', '2024-04-10')
+        self.assertEqual({row['weather__name'] for row in rows}, {'晴れ', '大雨'})
+
+
+class SingleFlightTests(TestCase):
+    """同じ引数の同時呼び出しが1回の計算にまとめられ、結果と例外が共有されることを確認"""
+
+    def run_concurrently(self, first_args, second_args):
+        calls = []
+        release = threading.Event()
+
+        @coalesce_requests('compute')
+        class Service:
+            @staticmethod
+            def compute(start_date, fail=False):
+                calls.append(start_date)
+                release.wait(5)
+                if fail:
+                    raise ValueError('failed')
+                return {'start_date': start_date}
+
+        outcomes = []
+
+        def call(*args):
+            try:
+                outcomes.append(Service.compute(*args))
+            except ValueError as e:
+                outcomes.append(e)
+
+        leader = threading.Thread(target=call, args=first_args)
+        leader.start()
+        while not SingleFlight._calls:
+            time.sleep(0.001)
+        waiter = threading.Thread(target=call, args=second_args)
+        waiter.start()
+        call_state = next(iter(SingleFlight._calls.values()))
+        while not call_state.waiters:
+            time.sleep(0.001)
+        release.set()
+        leader.join()
+        waiter.join()
+        return calls, outcomes
+
+    def test_identical_calls_share_result(self):
+        calls, outcomes = self.run_concurrently(('2024-04-01',), (date(2024, 4, 1),))
+
+        self.assertEqual(calls, ['2024-04-01'])
+        self.assertIs(outcomes[0], outcomes[1])
+
+    def test_error_is_propagated_to_waiters(self):
+        calls, outcomes = self.run_concurrently(('2024-04-01', True), ('2024-04-01', True))
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(isinstance(outcome, ValueError) for outcome in outcomes))
+
+    @override_settings(SINGLE_FLIGHT_TIMEOUT=0.01)
+    def test_waiter_timeout_reports_waiting_requests(self):
+        release = threading.Event()
+        leader = threading.Thread(target=SingleFlight.do, args=('key', lambda: release.wait(5)))
+        leader.start()
+        self.addCleanup(leader.join)
+        self.addCleanup(release.set)
+        while not SingleFlight._calls:
+            time.sleep(0.001)
+
+        with self.assertRaises(CoalescedCallTimeout) as raised:
+            SingleFlight.do('key', lambda: None)
+        self.assertIn('(1 requests are waiting for the same result)', str(raised.exception.detail))
+        self.assertEqual(SingleFlight._calls['key'].waiters, 0)
+
+    def test_only_named_methods_are_coalesced(self):
+        self.assertTrue(hasattr(DashboardService.get_cached_dashboard, '__wrapped__'))
+        self.assertFalse(hasattr(DashboardService.get_period_range, '__wrapped__'))
+        with self.assertRaises(TypeError):
+            coalesce_requests('missing')(type('Service', (), {}))
+
+
+class CacheWarmerTests(TestCase):
+    """warm_cacheで温めたダッシュボードと分析結果が、最初のリクエストで注文を読まずに返されることを確認"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_master_data()
+        for offset in range(3):
+            create_orders(date(2024, 4, 8) + timedelta(days=offset), 4)
+
+    def tearDown(self):
+        DashboardCache.get_cache().clear()
+
+    def test_warmed_requests_do_not_read_orders(self):
+        call_command('warm_cache', concurrency=1, analyses='products.bestsellers', stdout=StringIO())
+
+        with CaptureQueriesContext(connection) as queries:
+            weekly = self.client.get('/api/dashboard/weekly_dashboard/?date=2024-04-10')
+            bestsellers = self.client.get('/api/products/bestsellers/?start_date=2024-04-08&end_date=2024-04-14')
+        self.assertEqual(weekly.data['sales_summary']['total_orders'], 12)
+        self.assertEqual(bestsellers.data[0]['total_quantity'], 12)
+        tables = (connection.ops.quote_name('orders'), connection.ops.quote_name('order_items'))
+        self.assertFalse(any(table in query['sql'] for query in queries.captured_queries for table in tables))
+
+
+class ConditionalGetTests(TestCase):
+    """データバージョンから作ったETagが一致すれば、サービスを呼ばずに304を返すことを確認"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_master_data()
+        create_orders(date(2024, 4, 8), 4)
+
+    def tearDown(self):
+        DashboardCache.get_cache().clear()
+
+    def test_not_modified_until_orders_change(self):
+        urls = (
+            '/api/dashboard/weekly_dashboard/?date=2024-04-10',
+            '/api/products/bestsellers/?start_date=2024-04-08&end_date=2024-04-14',
+            '/api/sales/sales_summary/',
+        )
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+
+        not_called = AssertionError('service was called')
+        with mock.patch.object(DashboardService, 'get_cached_dashboard', side_effect=not_called), \
+                mock.patch.object(AnalysisService, 'get_cached_analysis', side_effect=not_called):
+            for url, etag in etags.items():
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        create_orders(date(2024, 4, 9), 1, prefix='new-')
+        for url, etag in etags.items():
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_master_rename_invalidates_cached_dashboards(self):
+        url = '/api/dashboard/weekly_dashboard/?date=2024-04-10'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('晴れ', response.content.decode())
+
+        weather = WeatherType.objects.get(id=1)
+        weather.name = '快晴'
+        weather.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        content = response.content.decode()
+        self.assertIn('快晴', content)
+        self.assertNotIn('晴れ', content)
+
+
+class ResponseFormatTests(TestCase):
+    """列指向JSONが通常のJSONと同じ値を返し、しきい値以上のレスポンスのみ圧縮されることを確認"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_master_data()
+        create_orders(date(2024, 4, 8), 10)
+
+    def tearDown(self):
+        DashboardCache.get_cache().clear()
+
+    def test_columnar_json_matches_json(self):
+        url = '/api/dashboard/daily_dashboard/?date=2024-04-08'
+        rows = json.loads(self.client.get(url).content)['orders']
+        response = self.client.get(url, HTTP_ACCEPT='application/vnd.cafe-analytics.columnar+json')
+        orders = json.loads(response.content)['orders']
+
+        self.assertEqual(response['Content-Type'], 'application/vnd.cafe-analytics.columnar+json')
+        self.assertEqual(orders['columns'], list(rows[0]))
+        self.assertEqual(len(orders['rows']), len(rows))
+        items = orders['rows'][0][orders['columns'].index('items')]
+        self.assertEqual([dict(zip(items['columns'], row)) for row in items['rows']], rows[0]['items'])
+
+    def test_only_large_responses_are_compressed(self):
+        url = '/api/dashboard/daily_dashboard/?date=2024-04-08'
+        with override_settings(RESPONSE_COMPRESSION_MIN_BYTES=1000):
+            self.assertEqual(self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')['Content-Encoding'], 'gzip')
+        with override_settings(RESPONSE_COMPRESSION_MIN_BYTES=10000):
+            self.assertFalse(self.client.get(url, HTTP_ACCEPT_ENCODING='gzip').has_header('Content-Encoding'))
+
+
+class SlowQueryLogTests(TestCase):
+    """しきい値を超えたサービスメソッドのSQLと実行計画が記録され、管理者のみが参照できることを確認"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_master_data()
+        create_orders(date(2024, 4, 10), 5)
+        cls.admin = User.objects.create_user('admin', password='password', is_staff=True)
+
+    def setUp(self):
+        SlowQueryLog.clear()
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0.001)
+    def test_slow_method_is_recorded_with_explain(self):
+        self.client.get('/api/products/bestsellers/?start_date=2024-04-01&end_date=2024-04-30')
+
+        self.assertEqual(self.client.get('/api/slow-queries/').status_code, 403)
+        self.client.force_login(self.admin)
+        entry = self.client.get('/api/slow-queries/').data['results'][0]
+        self.assertEqual(entry['method'], 'ProductService.get_bestsellers')
+        self.assertEqual(entry['arguments']['args'][1:], ['2024-04-01', '2024-04-30'])
+        self.assertTrue(entry['queries'][0]['sql'].startswith('SELECT'))
+        self.assertTrue(entry['queries'][0]['explain'])
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_disabled_threshold_records_nothing(self):
+        self.client.get('/api/products/bestsellers/')
+        self.assertEqual(SlowQueryLog.get_entries(), [])
+
+
+@override_settings(EXPORT_CHUNK_SIZE=4)
+class ExportTests(TestCase):
+    """一定件数ずつ読み込んだ行が、重複も欠落も無く書き出されることを確認"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_master_data()
+        MenuItem.objects.create(id=3, name='ラテ, "特製"', price=500, category_id=1)
+        # 11件目以降は同じ時刻の注文になるため、バッチの境界で時刻が重なる
+        create_orders(date(2024, 4, 8), 13)
+        create_orders(date(2024, 4, 9), 3)
+        OrderItem.objects.create(id='20240409-000-03', order_id='20240409-000', menu_item_id=3, price=500)
+
+    def export(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_orders_csv(self):
+        response, content = self.export('/api/exports/orders/?start_date=2024-04-08&end_date=2024-04-09')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="orders_2024-04-08_2024-04-09.csv"')
+        self.assertTrue(content.startswith('\ufeff'))
+
+        rows = list(csv.reader(StringIO(content[1:])))
+        self.assertEqual(rows[0], list(ORDER_EXPORT_FIELDS))
+        self.assertEqual(rows[1], ['20240408-000', '2024-04-08 08:00:00', '男', '店内', '晴れ', 'モーニング', '900', '0'])
+        expected = list(Order.objects.order_by('timestamp', 'id').values_list('id', flat=True))
+        self.assertEqual(len(expected), 16)
+        self.assertEqual([row[0] for row in rows[1:]], expected)
+
+    def test_order_items_csv_quotes_values(self):
+        _, content = self.export('/api/exports/order_items/')
+        self.assertIn('"ラテ, ""特製"""', content)
+
+        rows = list(csv.reader(StringIO(content[1:])))
+        self.assertEqual(rows[0], list(ORDER_ITEM_EXPORT_FIELDS))
+        # 33件を4件ずつ読み込む(最後のバッチは1件)
+        self.assertEqual([row[0] for row in rows[1:]], sorted(OrderItem.objects.values_list('id', flat=True)))
+        special = next(row for row in rows if row[0] == '20240409-000-03')
+        self.assertEqual(special[3:6], ['3', 'ラテ, "特製"', 'ドリンク'])
+
+    def test_empty_range_csv_has_header(self):
+        for dataset, columns in (('orders', ORDER_EXPORT_FIELDS), ('order_items', ORDER_ITEM_EXPORT_FIELDS)):
+            _, content = self.export(f'/api/exports/{dataset}/?start_date=2024-05-01&end_date=2024-05-31')
+            self.assertTrue(content.startswith('\ufeff'))
+            self.assertEqual(list(csv.reader(StringIO(content[1:]))), [list(columns)])
+
+    def test_order_items_batch_boundary(self):
+        OrderItem.objects.filter(id='20240409-000-03').delete()
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(ExportService.iter_order_items())
+        self.assertEqual([row['id'] for row in rows], sorted(OrderItem.objects.values_list('id', flat=True)))
+        # 32件がちょうど4件ずつに分かれる場合も、最後に空のバッチを確認して終わる
+        self.assertEqual(len(queries), 9)
+
+    def test_jsonl(self):
+        response, content = self.export('/api/exports/orders/?start_date=2024-04-09&end_date=2024-04-09&output=jsonl')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['id'] for row in rows], ['20240409-000', '20240409-001', '20240409-002'])
+        self.assertEqual(rows[1], {
+            'id': '20240409-001', 'timestamp': '2024-04-09 09:00:00', 'gender__name': '女',
+            'order_type__name': 'テイクアウト', 'weather__name': '雨', 'time_slot__name': 'ランチ',
+            'total_price': 900, 'discount': 50,
+        })
+
+        _, content = self.export('/api/exports/sales_summary/?start_date=2024-04-09&end_date=2024-04-09&output=jsonl')
+        self.assertEqual(json.loads(content)['total_orders'], 3)
+
+    def test_invalid_output_and_dataset(self):
+        response = self.client.get('/api/exports/orders/?output=xml')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid format: xml'})
+        self.assertEqual(self.client.get('/api/exports/unknown/').status_code, 404)
+        self.assertEqual(self.client.get('/api/exports/').json()['formats'], ['csv', 'jsonl'])
+
+
+@skipUnless(snapshot_service.pa is not None, 'pyarrow is not installed')
+class SnapshotTests(TestCase):
+    """データが変わった月のスナップショットだけが書き出され、読み込むと元の行に戻ることを確認"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_master_data()
+        create_orders(date(2024, 4, 8), 3)
+        create_orders(date(2024, 5, 2), 2)
+        cls.admin = User.objects.create_user('admin', password='password', is_staff=True)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings_override = override_settings(SNAPSHOT_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_only_changed_months_are_rebuilt(self):
+        result = SnapshotService.build(snapshot_format='arrow')
+        self.assertEqual(result, {'built': ['2024-04', '2024-05'], 'skipped': []})
+        manifest = SnapshotService.get_manifest()
+        self.assertEqual({month: entry['rows'] for month, entry in manifest.items()}, {'2024-04': 6, '2024-05': 4})
+        self.assertEqual(SnapshotService.get_stale_months(snapshot_format='arrow'), [])
+        # 形式が変わった月も書き出し直す
+        self.assertEqual(len(SnapshotService.get_stale_months(snapshot_format='parquet')), 2)
+
+        create_orders(date(2024, 5, 3), 1)
+        self.assertEqual(SnapshotService.get_stale_months(snapshot_format='arrow'), [date(2024, 5, 1)])
+        self.assertEqual(SnapshotService.build(snapshot_format='arrow'), {'built': ['2024-05'], 'skipped': ['2024-04']})
+        self.assertEqual(SnapshotService.get_manifest()['2024-05']['rows'], 6)
+        self.assertEqual(SnapshotService.get_manifest()['2024-04'], manifest['2024-04'])
+
+    def test_failed_rewrite_keeps_previous_file(self):
+        SnapshotService.build(snapshot_format='parquet')
+        create_orders(date(2024, 4, 9), 1)
+
+        with mock.patch('cafe_analytics.services.snapshot_service.pq.write_table', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                SnapshotService.build(snapshot_format='parquet')
+
+        self.assertEqual(SnapshotService.read_snapshot('2024-04').num_rows, 6)
+        self.assertEqual(sorted(path.name for path in self.directory.iterdir()), [
+            'manifest.json', 'orders_2024-04.parquet', 'orders_2024-05.parquet',
+        ])
+        self.assertEqual(SnapshotService.get_stale_months(snapshot_format='parquet'), [date(2024, 4, 1)])
+
+    def test_read_snapshot_round_trip(self):
+        for snapshot_format in ('parquet', 'arrow'):
+            SnapshotService.build(snapshot_format=snapshot_format)
+            rows = SnapshotService.read_snapshot('2024-04').to_pylist()
+
+            self.assertEqual(len(rows), 6)
+            self.assertEqual(rows[0]['order_id'], '20240408-000')
+            self.assertEqual(rows[0]['order_item_id'], '20240408-000-01')
+            self.assertEqual(rows[0]['timestamp'], timezone.make_aware(datetime(2024, 4, 8, 8)))
+            self.assertEqual((rows[0]['menu_item'], rows[0]['category'], rows[0]['price']), ('カフェラテ', 'ドリンク', 420))
+            self.assertEqual((rows[1]['weather'], rows[1]['total_price']), ('晴れ', 900))
+
+    def test_endpoints_are_admin_only(self):
+        self.assertEqual(self.client.post('/api/snapshots/build/').status_code, 403)
+        self.assertEqual(self.client.get('/api/snapshots/').status_code, 403)
+
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get('/api/snapshots/2023-01/').status_code, 404)
+        self.assertEqual(self.client.post('/api/snapshots/build/', {'format': 'csv'}).status_code, 400)
+        self.assertEqual(self.client.post('/api/snapshots/build/').data['built'], ['2024-04', '2024-05'])
+        self.assertEqual(self.client.get('/api/snapshots/2024-05/').status_code, 200)
+
+
+@skipUnless(columnar_store.np is not None, 'numpy is not installed')
+class ColumnarStoreParityTests(TestCase):
+    """列指向ストアの各集計がSQLでの集計と同じ結果になることを確認"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_master_data()
+        create_orders(date(2024, 4, 8), 5)
+        create_orders(date(2024, 4, 20), 3)
+        create_orders(date(2024, 5, 2), 4)
+        # 順位が同じにならないよう、カフェラテを多めに注文する
+        for order in Order.objects.filter(gender_id=1):
+            OrderItem.objects.create(id=f"{order.id}-03", order=order, menu_item_id=1, price=420)
+
+    def setUp(self):
+        ColumnarStore.invalidate()
+        self.addCleanup(ColumnarStore.invalidate)
+
+    def assertSameResults(self, call):
+        expected = call()
+        with override_settings(ANALYTICS_BACKEND='columnar'):
+            actual = call()
+        self.assertTrue(expected)
+        self.assertEqual(json.dumps(actual, default=str), json.dumps(expected, default=str))
+
+    def assertAllSame(self):
+        for start, end in ((None, None), ('2024-04-01', '2024-04-30'), ('2024-04-09', '2024-05-02')):
+            with self.subTest(start=start, end=end):
+                self.assertSameResults(lambda: SalesService.get_sales_summary(start, end))
+                for period in ('daily', 'weekly', 'monthly'):
+                    self.assertSameResults(lambda: SalesService.get_period_sales(period, start, end))
+                for field in ('gender', 'order_type', 'weather', 'time_slot'):
+                    self.assertSameResults(lambda: SalesService.get_sales_by_factor(field, f'{field}__name', start, end))
+                self.assertSameResults(lambda: SalesService.get_top_categories(None, start, end))
+                self.assertSameResults(lambda: SalesService.get_weather_timeslot_analysis(start, end))
+                self.assertSameResults(lambda: ProductService.get_bestsellers(10, start, end))
+                for order_type_id in (1, 2):
+                    self.assertSameResults(lambda: ProductService.get_popular_items_by_type(order_type_id, 10, start, end))
+                self.assertSameResults(lambda: ProductService.get_dine_in_popular_by_timeslot(start, end))
+                self.assertSameResults(lambda: ProductService.get_discount_analysis(start, end))
+
+    def test_matches_sql(self):
+        self.assertAllSame()
+
+    def test_master_changes_are_reflected_without_reload(self):
+        with override_settings(ANALYTICS_BACKEND='columnar'):
+            store = ColumnarStore.get()
+
+        # 名称の並び順が変わる変更と、メニューのカテゴリーの変更
+        WeatherType.objects.filter(id=1).update(name='雪')
+        TimeSlot.objects.filter(id=2).update(name='アフタヌーン')
+        MenuItem.objects.filter(id=2).update(category_id=1)
+        DimensionRegistry.invalidate()
+
+        self.assertAllSame()
+        with override_settings(ANALYTICS_BACKEND='columnar'):
+            self.assertIs(ColumnarStore.get(), store)
+            self.assertEqual(list(ProductService.get_dine_in_popular_by_timeslot()), ['モーニング'])
+            self.assertEqual(
+                [row['weather__name'] for row in SalesService.get_weather_timeslot_analysis()],
+                ['雨', '雪'],
+            )
+
+    @override_settings(ANALYTICS_COLUMNAR_REFRESH_INTERVAL=0)
+    def test_readers_use_previous_store_while_reloading(self):
+        store = ColumnarStore.get()
+        create_orders(date(2024, 5, 3), 1)
+
+        # 他のスレッドが読み込み直している間は待たずに前のストアを返す
+        with ColumnarStore._lock:
+            self.assertIs(ColumnarStore.get(), store)
+
+        reloaded = ColumnarStore.get()
+        self.assertIsNot(reloaded, store)
+        self.assertEqual(reloaded.sales_summary()['total_orders'], 13)
+
+
+class BasketEngineTests(TestCase):
+    """手計算した支持度・確信度・リフト値と一致することを確認"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_master_data()
+        MenuItem.objects.create(id=3, name='スコーン', price=300, category_id=2)
+        MenuItem.objects.create(id=4, name='ブレンド', price=380, category_id=1)
+        # カフェラテ(1)とチーズケーキ(2)は3件、スコーン(3)は2件、ブレンド(4)は1件の注文に含まれる
+        baskets = [(1, 2, 3), (1, 2), (1, 3), (2,), (4,)]
+        for i, menu_item_ids in enumerate(baskets):
+            order = Order.objects.create(
+                id=f'basket-{i}', timestamp=timezone.make_aware(datetime(2024, 4, 10, 9 + i)),
+                gender_id=1, order_type_id=1, weather_id=1, time_slot_id=1, total_price=0, discount=0,
+            )
+            for menu_item_id in menu_item_ids:
+                OrderItem.objects.create(id=f'basket-{i}-{menu_item_id}', order=order, menu_item_id=menu_item_id, price=0)
+
+    def combos(self, **kwargs):
+        engine = BasketEngine(date(2024, 4, 10), date(2024, 4, 10))
+        self.assertEqual(engine.total_orders, 5)
+        return {combo['items']: combo for combo in engine.combos(**kwargs)}
+
+    def test_pair_metrics(self):
+        combos = self.combos(min_occurrence=2)
+        self.assertEqual(list(combos), [('カフェラテ', 'スコーン'), ('カフェラテ', 'チーズケーキ')])
+
+        with_scone = combos[('カフェラテ', 'スコーン')]
+        self.assertEqual(with_scone['occurrence_count'], 2)
+        self.assertAlmostEqual(with_scone['support'], 2 / 5)
+        self.assertAlmostEqual(with_scone['confidence']['カフェラテ'], 2 / 3)
+        self.assertAlmostEqual(with_scone['confidence']['スコーン'], 1.0)
+        self.assertAlmostEqual(with_scone['lift'], (2 / 5) / ((3 / 5) * (2 / 5)))
+
+        with_cake = combos[('カフェラテ', 'チーズケーキ')]
+        self.assertAlmostEqual(with_cake['confidence']['チーズケーキ'], 2 / 3)
+        self.assertAlmostEqual(with_cake['lift'], (2 / 5) / ((3 / 5) * (3 / 5)))
+
+    def test_triples_need_frequent_pairs(self):
+        # スコーンとチーズケーキは1件のため、3品の組み合わせは調べない
+        self.assertEqual(len(self.combos(min_occurrence=2, include_triples=True)), 2)
+
+        combos = self.combos(min_occurrence=1, include_triples=True)
+        triple = combos[('カフェラテ', 'スコーン', 'チーズケーキ')]
+        self.assertEqual(triple['occurrence_count'], 1)
+        self.assertAlmostEqual(triple['support'], 1 / 5)
+        self.assertAlmostEqual(triple['lift'], (1 / 5) / ((3 / 5) * (2 / 5) * (3 / 5)))
+        self.assertEqual(len(combos), 4)
+
+    def test_combos_never_include_unseen_pairs(self):
+        for min_occurrence in (0, -1):
+            combos = self.combos(min_occurrence=min_occurrence, include_triples=True)
+            self.assertEqual(len(combos), 4)
+            self.assertTrue(all(combo['occurrence_count'] > 0 for combo in combos.values()))
+
+
+class ImportDataTests(TestCase):
+    """既存IDのスキップ件数と、途中で失敗した場合のロールアップ更新を確認"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_master_data()
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def write_lines(self, name, lines):
+        path = self.directory / name
+        path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+        return str(path)
+
+    def write_orders(self):
+        return self.write_lines('orders.jsonl', [json.dumps({
+            'id': f'import-{i}', 'timestamp': f'2024-04-10 {9 + i:02d}:00:00', 'gender_id': 1, 'order_type_id': 1,
+            'weather_id': 1, 'time_slot_id': 1, 'total_price': 420, 'discount': 0,
+        }) for i in range(3)])
+
+    def test_existing_rows_are_not_counted_as_written(self):
+        orders_path = self.write_orders()
+        out = StringIO()
+        call_command('import_data', orders_path, stdout=out)
+        self.assertIn('read 3, written 3, invalid 0', out.getvalue())
+
+        out = StringIO()
+        call_command('import_data', orders_path, stdout=out)
+        self.assertIn('read 3, written 0, invalid 0', out.getvalue())
+        self.assertIn('[skipped 3 existing]', out.getvalue())
+        self.assertIn('Refreshed rollups for 0 days', out.getvalue())
+
+    def test_upsert_compares_rows_without_stored_hash_by_value(self):
+        # マイグレーション前やORMで登録された行はrow_hashが空のまま
+        for i in range(3):
+            Order.objects.create(
+                id=f'import-{i}', timestamp=timezone.make_aware(datetime(2024, 4, 10, 9 + i)),
+                gender_id=1, order_type_id=1, weather_id=1, time_slot_id=1, total_price=420, discount=0,
+            )
+        self.assertEqual(set(Order.objects.values_list('row_hash', flat=True)), {''})
+        day = date(2024, 4, 10)
+        before = DashboardCache.get_versions(day, day)[day]
+
+        out = StringIO()
+        call_command('import_data', self.write_orders(), '--on-conflict', 'upsert', stdout=out)
+        self.assertIn('read 3, written 0, invalid 0', out.getvalue())
+        self.assertIn('[inserted 0, updated 0, unchanged 3]', out.getvalue())
+        self.assertIn('Refreshed rollups for 0 days', out.getvalue())
+        self.assertEqual(DashboardCache.get_versions(day, day)[day], before)
+
+    def test_parsed_files_are_written_batch_by_batch(self):
+        parsed = parse_source_file(self.write_orders(), batch_size=2)
+        self.addCleanup(parsed.close)
+        self.assertEqual([len(rows) for _, rows in parsed.iter_batches()], [2, 1])
+
+        importer = BulkImporter(batch_size=2)
+        [stats] = importer.import_parsed(parsed)
+        self.assertEqual((stats.read, stats.written), (3, 3))
+        self.assertEqual(Order.objects.filter(id__startswith='import-').count(), 3)
+
+        spool_path = parsed.spool_path
+        parsed.close()
+        self.assertFalse(Path(spool_path).exists())
+
+    def test_rollups_are_refreshed_when_import_fails(self):
+        orders_path = self.write_orders()
+        items_path = self.write_lines('order_items.jsonl', [
+            json.dumps({'id': 'import-0-01', 'order_id': 'import-0', 'menu_item_id': 1, 'price': 420}),
+            '{broken',
+        ])
+        day = date(2024, 4, 10)
+        before = DashboardCache.get_versions(day, day)[day]
+
+        out = StringIO()
+        call_command('import_data', orders_path, items_path, '--batch-size', '1', stdout=out)
+
+        self.assertIn('Invalid JSON format', out.getvalue())
+        self.assertIn('Refreshed rollups for 1 days', out.getvalue())
+        self.assertEqual(OrderItem.objects.count(), 1)
+        self.assertEqual(
+            list(DailyMenuItemRollup.objects.values_list('date', 'menu_item_id', 'items_sold')),
+            [(day, 1, 1)],
+        )
+        self.assertGreater(DashboardCache.get_versions(day, day)[day], before)
+
+
+class SyntheticDataTests(TestCase):
+    """合成データがシードごとに同じになり、サンプルと同じ形式・整合性で生成されることを確認"""
+
+    def test_generated_month_is_reproducible_and_consistent(self):
+        profile = SampleProfile()
+        first = list(SyntheticDataGenerator(profile, scale=2, seed=1).iter_months(date(2024, 5, 1), 1))
+        second = list(SyntheticDataGenerator(profile, scale=2, seed=1).iter_months(date(2024, 5, 1), 1))
+        self.assertEqual(first, second)
+
+        _, orders, items = first[0]
+        subtotals = {}
+        for item in items:
+            subtotals[item['order_id']] = subtotals.get(item['order_id'], 0) + item['price']
+        for order in orders:
+            self.assertEqual(order['total_price'] + order['discount'], subtotals[order['id']])
+        self.assertTrue(orders[0]['timestamp'].startswith('2024-05-01'))
+        self.assertTrue(orders[-1]['timestamp'].startswith('2024-05-31'))
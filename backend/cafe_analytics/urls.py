@@ -13,10 +13,21 @@ router.register(r'sales', views.SalesAnalysisViewSet, basename='sales')
 # 商品分析関連
 router.register(r'products', views.ProductAnalysisViewSet, basename='products')
 
+# CSV / JSON Linesでの出力
+router.register(r'exports', views.ExportViewSet, basename='exports')
+
+# 月ごとの注文スナップショット (Parquet / Arrow IPC)
+router.register(r'snapshots', views.SnapshotViewSet, basename='snapshots')
+
+# しきい値を超えたサービスメソッドのSQLと実行計画 (管理者のみ)
+router.register(r'slow-queries', views.SlowQueryViewSet, basename='slow-queries')
+
 # 既存のViewSet
 router.register(r'orders', views.OrderViewSet)
 router.register(r'menu-items', views.MenuItemViewSet)
 
 urlpatterns = [
+    # リクエストの計測結果 (Prometheusのテキスト形式)
+    path('metrics/', views.metrics, name='metrics'),
     path('', include(router.urls)),
 ]
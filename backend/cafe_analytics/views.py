@@ -1,20 +1,61 @@
+import json
+from urllib.parse import urlencode
+
+from django.db.models import Prefetch
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
 from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 
-from .models import Order, MenuItem
+from .conditional import conditional_get, dashboard_etag, analysis_etag
+from .metrics import render_metrics
+from .models import Order, OrderItem, MenuItem
+from .pagination import KeysetCursorPagination
 from .serializers import OrderSerializer, MenuItemSerializer
 from .services.dashboard_service import DashboardService
-from .services.sales_service import SalesService
-from .services.product_service import ProductService
 from .services.order_service import OrderService
+from .services.execution import section_timings, format_server_timing
+from .services.export_service import ExportService, CONTENT_TYPES, EXPORT_COLUMNS, EXPORT_FORMATS, FORMAT_CSV
+from .services.slow_query_log import SlowQueryLog
+from .services.analysis_service import AnalysisService
+from .services.snapshot_service import SnapshotService, SNAPSHOT_FORMATS, parse_month
 
 
 class DashboardViewSet(viewsets.ViewSet):
     """ダッシュボード表示用のビュー"""
 
+    @staticmethod
+    def dashboard_response(request: Request, period: str, target_date) -> Response:
+        """
+        ダッシュボードを取得し、注文一覧の続きと全件のストリーミングのURLを付けて返す
+        処理ごとの時間はServer-Timingヘッダーで返す
+        """
+        with section_timings() as timings:
+            dashboard_data = dict(DashboardService.get_cached_dashboard(period, target_date))
+
+        start_date, end_date = DashboardService.get_period_range(period, target_date)
+        orders_url = request.build_absolute_uri(reverse('order-list'))
+        params = {'start_date': start_date.isoformat(), 'end_date': end_date.isoformat()}
+        dashboard_data['orders_next'] = (
+            f"{orders_url}?{urlencode({**params, 'cursor': dashboard_data['orders_cursor']})}"
+            if dashboard_data['orders_cursor'] else None
+        )
+        dashboard_data['orders_stream'] = (
+            f"{request.build_absolute_uri(reverse('order-stream'))}?{urlencode(params)}"
+        )
+
+        response = Response(dashboard_data)
+        if timings:
+            response['Server-Timing'] = format_server_timing(timings)
+        return response
+
     @action(detail=False, methods=['get'])
+    @conditional_get(dashboard_etag('daily'))
     def daily_dashboard(self, request: Request) -> Response:
         """デイリーダッシュボード用のデータを取得"""
         date_str = request.query_params.get('date')
@@ -23,10 +64,10 @@ class DashboardViewSet(viewsets.ViewSet):
         if not target_date:
             return Response({"error": "Invalid date format"}, status=400)
 
-        dashboard_data = DashboardService.get_daily_dashboard(target_date)
-        return Response(dashboard_data)
+        return self.dashboard_response(request, 'daily', target_date)
 
     @action(detail=False, methods=['get'])
+    @conditional_get(dashboard_etag('weekly'))
     def weekly_dashboard(self, request: Request) -> Response:
         """ウィークリーダッシュボード用のデータを取得"""
         date_str = request.query_params.get('date')
@@ -35,10 +76,10 @@ class DashboardViewSet(viewsets.ViewSet):
         if not target_date:
             return Response({"error": "Invalid date format"}, status=400)
 
-        dashboard_data = DashboardService.get_weekly_dashboard(target_date)
-        return Response(dashboard_data)
+        return self.dashboard_response(request, 'weekly', target_date)
 
     @action(detail=False, methods=['get'])
+    @conditional_get(dashboard_etag('monthly'))
     def monthly_dashboard(self, request: Request) -> Response:
         """マンスリーダッシュボード用のデータを取得"""
         date_str = request.query_params.get('date')
@@ -47,31 +88,33 @@ class DashboardViewSet(viewsets.ViewSet):
         if not target_date:
             return Response({"error": "Invalid date format"}, status=400)
 
-        dashboard_data = DashboardService.get_monthly_dashboard(target_date)
-        return Response(dashboard_data)
+        return self.dashboard_response(request, 'monthly', target_date)
 
     @action(detail=False, methods=['get'])
+    @conditional_get(analysis_etag)
     def daily_sales(self, request: Request) -> Response:
         """日次の売上データを取得"""
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
-        period_sales = SalesService.get_period_sales('daily', start_date, end_date)
+        period_sales = AnalysisService.get_cached_analysis('dashboard.daily_sales', start_date, end_date)
         return Response(period_sales)
 
     @action(detail=False, methods=['get'])
+    @conditional_get(analysis_etag)
     def weekly_sales(self, request: Request) -> Response:
         """週次の売上データを取得"""
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
-        period_sales = SalesService.get_period_sales('weekly', start_date, end_date)
+        period_sales = AnalysisService.get_cached_analysis('dashboard.weekly_sales', start_date, end_date)
         return Response(period_sales)
 
     @action(detail=False, methods=['get'])
+    @conditional_get(analysis_etag)
     def monthly_sales(self, request: Request) -> Response:
         """月次の売上データを取得"""
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
-        period_sales = SalesService.get_period_sales('monthly', start_date, end_date)
+        period_sales = AnalysisService.get_cached_analysis('dashboard.monthly_sales', start_date, end_date)
         return Response(period_sales)
 
 
@@ -79,95 +122,253 @@ class SalesAnalysisViewSet(viewsets.ViewSet):
     """売上分析用のビュー"""
 
     @action(detail=False, methods=['get'])
+    @conditional_get(analysis_etag)
     def sales_summary(self, request):
         """売上サマリーを取得"""
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
-        return Response(SalesService.get_sales_summary(start_date, end_date))
+        return Response(AnalysisService.get_cached_analysis('sales.sales_summary', start_date, end_date))
 
     @action(detail=False, methods=['get'])
+    @conditional_get(analysis_etag)
     def category_sales(self, request):
         """カテゴリー別売上を取得"""
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
-        return Response(SalesService.get_top_categories(limit=None, start_date=start_date, end_date=end_date))
+        return Response(AnalysisService.get_cached_analysis('sales.category_sales', start_date, end_date))
 
     @action(detail=False, methods=['get'])
+    @conditional_get(analysis_etag)
     def sales_by_weather(self, request):
         """天気別売上を取得"""
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
-        return Response(SalesService.get_sales_by_factor('weather', 'weather__name', start_date, end_date))
+        return Response(AnalysisService.get_cached_analysis('sales.sales_by_weather', start_date, end_date))
 
     @action(detail=False, methods=['get'])
+    @conditional_get(analysis_etag)
     def sales_by_gender(self, request):
         """性別別売上を取得"""
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
-        return Response(SalesService.get_sales_by_factor('gender', 'gender__name', start_date, end_date))
+        return Response(AnalysisService.get_cached_analysis('sales.sales_by_gender', start_date, end_date))
 
     @action(detail=False, methods=['get'])
+    @conditional_get(analysis_etag)
     def weather_timeslot_analysis(self, request):
         """天気と時間帯のクロス分析を取得"""
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
-        return Response(SalesService.get_weather_timeslot_analysis(start_date, end_date))
+        return Response(AnalysisService.get_cached_analysis('sales.weather_timeslot_analysis', start_date, end_date))
 
 
 class ProductAnalysisViewSet(viewsets.ViewSet):
     """商品分析用のビュー"""
 
     @action(detail=False, methods=['get'])
+    @conditional_get(analysis_etag)
     def bestsellers(self, request):
         """ベストセラー商品を取得"""
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
         limit = int(request.query_params.get('limit', 10))
-        return Response(ProductService.get_bestsellers(limit, start_date, end_date))
+        return Response(AnalysisService.get_cached_analysis('products.bestsellers', start_date, end_date, limit=limit))
 
     @action(detail=False, methods=['get'])
+    @conditional_get(analysis_etag)
     def discount_analysis(self, request):
         """割引分析を取得"""
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
-        return Response(ProductService.get_discount_analysis(start_date, end_date))
+        return Response(AnalysisService.get_cached_analysis('products.discount_analysis', start_date, end_date))
 
     @action(detail=False, methods=['get'])
+    @conditional_get(analysis_etag)
     def dine_in_popular_items(self, request):
         """店内飲食の時間帯ごとの人気メニューランキングを取得"""
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
-        return Response(ProductService.get_dine_in_popular_by_timeslot(start_date, end_date))
+        return Response(AnalysisService.get_cached_analysis('products.dine_in_popular_items', start_date, end_date))
 
     @action(detail=False, methods=['get'])
+    @conditional_get(analysis_etag)
     def dine_in_popular(self, request):
         """店内飲食の人気商品を取得"""
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
         limit = int(request.query_params.get('limit', 10))
-        return Response(ProductService.get_popular_items_by_type(order_type_id=1, limit=limit, start_date=start_date, end_date=end_date))
+        return Response(AnalysisService.get_cached_analysis('products.dine_in_popular', start_date, end_date, limit=limit))
 
     @action(detail=False, methods=['get'])
+    @conditional_get(analysis_etag)
     def takeout_popular(self, request):
         """テイクアウトの人気商品を取得"""
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
         limit = int(request.query_params.get('limit', 10))
-        return Response(ProductService.get_popular_items_by_type(order_type_id=2, limit=limit, start_date=start_date, end_date=end_date))
+        return Response(AnalysisService.get_cached_analysis('products.takeout_popular', start_date, end_date, limit=limit))
 
     @action(detail=False, methods=['get'])
+    @conditional_get(analysis_etag)
     def combo_analysis(self, request):
         """よく一緒に注文される商品の組み合わせ分析を取得"""
+        start_date = request.query_params.get('start_date')
+        end_date = request.query_params.get('end_date')
         min_occurrence = int(request.query_params.get('min_occurrence', 2))
         limit = int(request.query_params.get('limit', 10))
-        return Response(ProductService.get_combo_analysis(min_occurrence, limit))
+        include_triples = request.query_params.get('include_triples', '').lower() in ('1', 'true')
+        return Response(AnalysisService.get_cached_analysis(
+            'products.combo_analysis', start_date, end_date,
+            min_occurrence=min_occurrence, limit=limit, include_triples=include_triples,
+        ))
+
+
+class ExportViewSet(viewsets.ViewSet):
+    """注文・注文アイテム・集計結果をCSVまたはJSON Linesでストリーミング出力するビュー"""
+
+    def list(self, request: Request) -> Response:
+        """出力できるデータの一覧を取得"""
+        return Response({
+            'datasets': list(ExportService.get_datasets()),
+            'formats': list(EXPORT_FORMATS),
+        })
+
+    def retrieve(self, request: Request, pk: str = None) -> StreamingHttpResponse:
+        """
+        指定したデータを出力する
+        例: /api/exports/orders/?start_date=2024-04-01&end_date=2024-06-30&output=csv
+        """
+        start_date = request.query_params.get('start_date')
+        end_date = request.query_params.get('end_date')
+        # DRFがformatパラメータをレンダラーの選択に使うため、outputで形式を指定する
+        export_format = request.query_params.get('output', FORMAT_CSV)
+
+        try:
+            lines = ExportService.iter_export(
+                pk, export_format, start_date, end_date, columns=EXPORT_COLUMNS.get(pk)
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=404 if pk not in ExportService.get_datasets() else 400)
+
+        response = StreamingHttpResponse(lines, content_type=CONTENT_TYPES[export_format])
+        filename = '_'.join(part for part in (pk, start_date, end_date) if part)
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+        return response
+
+
+class SnapshotViewSet(viewsets.ViewSet):
+    """月ごとの注文スナップショット(Parquet / Arrow IPC)の一覧・ダウンロード・書き出しを行うビュー(管理者のみ)"""
+
+    permission_classes = [IsAdminUser]
+
+    def list(self, request: Request) -> Response:
+        """書き出し済みの月と、データが変わって書き出しが必要な月を取得"""
+        manifest = SnapshotService.get_manifest()
+        try:
+            stale_months = [month.strftime('%Y-%m') for month in SnapshotService.get_stale_months()]
+        except ImproperlyConfigured:
+            stale_months = []
+        return Response({
+            'snapshots': [
+                {
+                    'month': month,
+                    **entry,
+                    'url': request.build_absolute_uri(reverse('snapshots-detail', args=[month])),
+                }
+                for month, entry in sorted(manifest.items())
+            ],
+            'stale_months': stale_months,
+        })
+
+    def retrieve(self, request: Request, pk: str = None):
+        """指定した月 (YYYY-MM) のスナップショットをダウンロード"""
+        path = SnapshotService.get_snapshot_path(pk)
+        if path is None:
+            return Response({"error": f"No snapshot for {pk}"}, status=404)
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name)
+
+    @action(detail=False, methods=['post'])
+    def build(self, request: Request) -> Response:
+        """
+        データが変わった月のスナップショットを書き出す
+        例: POST /api/snapshots/build/ {"start_month": "2024-04", "end_month": "2024-06", "format": "arrow"}
+        """
+        start_month = request.data.get('start_month')
+        end_month = request.data.get('end_month')
+        snapshot_format = request.data.get('format')
+        start_month_obj = parse_month(start_month) if start_month else None
+        end_month_obj = parse_month(end_month) if end_month else None
+
+        if (start_month and not start_month_obj) or (end_month and not end_month_obj):
+            return Response({"error": "Invalid month format"}, status=400)
+        if snapshot_format and snapshot_format not in SNAPSHOT_FORMATS:
+            return Response({"error": f"Invalid format: {snapshot_format}"}, status=400)
+
+        try:
+            result = SnapshotService.build(start_month_obj, end_month_obj, snapshot_format)
+        except ImproperlyConfigured as e:
+            return Response({"error": str(e)}, status=503)
+        return Response(result)
+
+
+class SlowQueryViewSet(viewsets.ViewSet):
+    """処理時間がしきい値を超えたサービスメソッドのSQLと実行計画を確認するビュー(管理者のみ)"""
+
+    permission_classes = [IsAdminUser]
+
+    def list(self, request: Request) -> Response:
+        """記録を新しい順に取得"""
+        return Response({
+            'threshold_ms': SlowQueryLog.get_threshold() * 1000,
+            'results': SlowQueryLog.get_entries(),
+        })
+
+    @action(detail=False, methods=['post'])
+    def clear(self, request: Request) -> Response:
+        """記録を削除"""
+        SlowQueryLog.clear()
+        return Response(status=204)
 
 
 class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all().prefetch_related('items').order_by('timestamp')
+    queryset = Order.objects.all().select_related(
+        'gender', 'order_type', 'weather', 'time_slot',
+    ).prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('menu_item__category')),
+    ).order_by('timestamp', 'id')
     serializer_class = OrderSerializer
+    pagination_class = KeysetCursorPagination
+
+    def list(self, request: Request) -> Response:
+        """
+        注文一覧をカーソルページネーションで取得(start_date/end_dateで期間を指定可能)
+        モデルインスタンスを作らず、values()の行から1ページあたり2クエリで組み立てる
+        """
+        start_date = request.query_params.get('start_date')
+        end_date = request.query_params.get('end_date')
+        paginator = self.paginator
+        order_rows = paginator.paginate_queryset(
+            OrderService.get_order_rows(start_date, end_date), request, view=self
+        )
+        return paginator.get_paginated_response(OrderService.serialize_orders(order_rows))
+
+    @action(detail=False, methods=['get'])
+    def stream(self, request: Request) -> StreamingHttpResponse:
+        """期間内の全注文をJSON Lines形式でストリーミングする(一定件数ずつ読み込む)"""
+        start_date = request.query_params.get('start_date')
+        end_date = request.query_params.get('end_date')
+        rows = OrderService.iter_orders(start_date, end_date)
+        return StreamingHttpResponse(
+            (json.dumps(row, cls=JSONEncoder, ensure_ascii=False) + '\n' for row in rows),
+            content_type='application/x-ndjson; charset=utf-8',
+        )
 
 
 class MenuItemViewSet(viewsets.ModelViewSet):
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
+
+
+def metrics(request) -> HttpResponse:
+    """ビューごとの処理時間・SQLの件数と時間・レスポンスサイズのヒストグラム(Prometheusのテキスト形式)"""
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
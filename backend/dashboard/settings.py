@@ -48,6 +48,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "cafe_analytics.middleware.CompressionMiddleware",
+    "cafe_analytics.middleware.RequestMetricsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -97,6 +99,77 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# dashboardキャッシュはLRUで古いエントリから削除される(LocMemCache)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'dashboard': {
+        'BACKEND': os.getenv('DASHBOARD_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('DASHBOARD_CACHE_LOCATION', 'cafe-dashboard'),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('DASHBOARD_CACHE_MAX_ENTRIES', '500')),
+            'CULL_FREQUENCY': int(os.getenv('DASHBOARD_CACHE_CULL_FREQUENCY', '10')),
+        },
+    },
+}
+
+DASHBOARD_CACHE_ENABLED = os.getenv('DASHBOARD_CACHE_ENABLED', 'True') == 'True'
+DASHBOARD_CACHE_ALIAS = 'dashboard'
+# データバージョンをキャッシュに保持する秒数(複数プロセス間での反映遅延の上限)
+DASHBOARD_CACHE_VERSION_TTL = int(os.getenv('DASHBOARD_CACHE_VERSION_TTL', '5'))
+# 最新の注文日から遡ってキャッシュを温める日・週・月の数と、同時に実行する計算の数 (warm_cacheコマンド)
+CACHE_WARM_PERIODS = int(os.getenv('CACHE_WARM_PERIODS', '1'))
+CACHE_WARM_CONCURRENCY = int(os.getenv('CACHE_WARM_CONCURRENCY', '4'))
+# プロセスの起動時(wsgi.py / asgi.py)に別スレッドでキャッシュを温めるか
+CACHE_WARM_ON_STARTUP = os.getenv('CACHE_WARM_ON_STARTUP', 'False') == 'True'
+
+# ビューごとのSQLの件数と時間・シリアライズ時間・レスポンスサイズ・処理時間の計測 (/api/metrics/)
+REQUEST_METRICS_ENABLED = os.getenv('REQUEST_METRICS_ENABLED', 'True') == 'True'
+# 計測結果をX-Request-Metricsヘッダーでも返すか
+REQUEST_METRICS_DEBUG_HEADER = os.getenv('REQUEST_METRICS_DEBUG_HEADER', 'False') == 'True'
+
+# レスポンスをgzipで圧縮する最小サイズ(バイト) (0で圧縮しない)
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', '1024'))
+
+# SalesService / ProductServiceのメソッドがこの時間(ミリ秒)を超えたら、SQLと実行計画を記録する (0で無効)
+SLOW_QUERY_THRESHOLD_MS = int(os.getenv('SLOW_QUERY_THRESHOLD_MS', '500'))
+# 保持する記録の件数(古いものから捨てる)と、1件あたりに実行計画を取得するSQLの数
+SLOW_QUERY_LOG_SIZE = int(os.getenv('SLOW_QUERY_LOG_SIZE', '100'))
+SLOW_QUERY_MAX_EXPLAINS = int(os.getenv('SLOW_QUERY_MAX_EXPLAINS', '5'))
+
+# ダッシュボードに含める注文一覧の件数(続きはカーソルで取得する)
+DASHBOARD_ORDERS_PAGE_SIZE = int(os.getenv('DASHBOARD_ORDERS_PAGE_SIZE', '50'))
+# ダッシュボードのクエリの実行方法 (serial: 順に実行, concurrent: スレッドプールで同時に実行)
+DASHBOARD_EXECUTION_MODE = os.getenv('DASHBOARD_EXECUTION_MODE', 'serial')
+# 1リクエストが同時に使うワーカー数(ワーカーごとにDB接続を1つ使う)
+DASHBOARD_QUERY_WORKERS = int(os.getenv('DASHBOARD_QUERY_WORKERS', '2'))
+# プロセス全体でワーカーが使うDB接続数の上限
+DASHBOARD_MAX_DB_WORKERS = int(os.getenv('DASHBOARD_MAX_DB_WORKERS', '8'))
+
+# CSV / JSON Linesの出力で1回に読み込む行数
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+
+# 月ごとのスナップショット(Parquet / Arrow IPC)の保存先と形式 (parquet または arrow ※pyarrowが必要)
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', str(BASE_DIR / 'snapshots'))
+SNAPSHOT_FORMAT = os.getenv('SNAPSHOT_FORMAT', 'parquet')
+
+# 分析APIの集計方法 (sql: DBで集計, columnar: NumPyの列指向ストアで集計 ※numpyが必要)
+ANALYTICS_BACKEND = os.getenv('ANALYTICS_BACKEND', 'sql')
+# 列指向ストアがデータバージョンを確認する間隔(秒)
+ANALYTICS_COLUMNAR_REFRESH_INTERVAL = int(os.getenv('ANALYTICS_COLUMNAR_REFRESH_INTERVAL', '5'))
+# マスター(性別・天気・メニュー等)の名称をプロセス内に保持する秒数 (0以下は期限なし)
+# 同じプロセスでの変更はシグナルで即時に反映され、他のプロセスでの変更はこの秒数以内に反映される
+DIMENSION_REGISTRY_TTL = int(os.getenv('DIMENSION_REGISTRY_TTL', '300'))
+# 同じ分析の同時リクエストを1回の計算にまとめるか (ダッシュボードと商品分析)
+SINGLE_FLIGHT_ENABLED = os.getenv('SINGLE_FLIGHT_ENABLED', 'True') == 'True'
+# 実行中の同じ計算を待つ最大秒数 (超えると503を返す)
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv('SINGLE_FLIGHT_TIMEOUT', '30'))
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
 ]
@@ -145,4 +218,12 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 REST_FRAMEWORK = {
     'DATETIME_FORMAT': '%Y-%m-%d %H:%M:%S',
     'DATE_FORMAT': '%Y-%m-%d',
+    # 列指向JSON (?format=columnar) とMessagePack (?format=msgpack ※msgpackが必要) はAcceptヘッダーでも指定できる
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'cafe_analytics.renderers.ColumnarJSONRenderer',
+        'cafe_analytics.renderers.MessagePackRenderer',
+    ],
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'cafe_analytics.renderers.ContentNegotiation',
 }
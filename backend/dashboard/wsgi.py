@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dashboard.settings')
 
 application = get_wsgi_application()
+
+# CACHE_WARM_ON_STARTUPが有効なら、起動直後にダッシュボードと分析結果のキャッシュを別スレッドで作成する
+from cafe_analytics.services.cache_warmer import warm_on_startup  # noqa: E402
+
+warm_on_startup()